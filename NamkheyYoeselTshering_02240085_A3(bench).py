@@ -0,0 +1,271 @@
+# NamkheyYoeselTshering_02240085_A3(bench).py
+
+"""
+Benchmarks for the banking system's hot paths.
+
+Builds synthetic books of different sizes and times loading, saving,
+account creation, login, every process_User_Input choice and
+BankAccount.transfer. Results are printed (or written) as JSON with
+throughput and p50/p99 latency, and can be checked against a saved
+baseline so slowdowns show up as a failing exit code. Import time and
+footprint are reported for the core module on its own and together with
+the GUI layer.
+
+    python "NamkheyYoeselTshering_02240085_A3(bench).py" --sizes 1000,100000
+    python "NamkheyYoeselTshering_02240085_A3(bench).py" --save-baseline bench_baseline.json
+    python "NamkheyYoeselTshering_02240085_A3(bench).py" --baseline bench_baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from NamkheyYoeselTshering_02240085_A3 import BankingSystem, PersonalAccount, STORAGE_BACKENDS
+
+
+def summarize(name, size, samples):
+    """
+    Turn per-operation timings into one result row.
+
+    Args:
+        name: Benchmark name
+        size: Number of accounts in the book
+        samples: Duration of each operation in nanoseconds
+
+    Returns:
+        dict: Operation count, throughput and latency percentiles
+    """
+    samples = sorted(samples)
+    total = sum(samples)
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(p * len(samples)))] / 1000
+    return {
+        "name": name,
+        "size": size,
+        "ops": len(samples),
+        "throughput": len(samples) / (total / 1e9) if total else 0.0,
+        "p50_us": percentile(0.50),
+        "p99_us": percentile(0.99),
+    }
+
+
+def timed(function, repeat):
+    """Run function `repeat` times and return each duration in nanoseconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        function()
+        samples.append(time.perf_counter_ns() - started)
+    return samples
+
+
+def write_book(path, size, rng):
+    """
+    Write a synthetic accounts file.
+
+    Returns:
+        list: (account_id, passcode) of every account
+    """
+    credentials = []
+    with open(path, "w") as file:
+        for n in range(size):
+            account_id, passcode = str(10000000 + n), str(rng.randint(1000, 9999))
+            category = "Personal" if n % 4 else "Business"
+            file.write(f"{account_id},{passcode},{category},{rng.randint(0, 10**6)}.{rng.randint(0, 99)}\n")
+            credentials.append((account_id, passcode))
+    return credentials
+
+
+def run_size(size, ops, rng, workdir, options):
+    """Run every benchmark against one book size."""
+    results = []
+    path = os.path.join(workdir, f"accounts_{size}.txt")
+    credentials = write_book(path, size, rng)
+
+    # Other backends get the same book copied into their own format
+    storage = options.get("storage", "text")
+    if storage != "text":
+        source = BankingSystem(path)
+        path = os.path.join(workdir, f"accounts_{size}.{storage}")
+        backend = STORAGE_BACKENDS[storage](path)
+        backend.save(source.accounts)
+        backend.close()
+        source.close()
+    repeat = 3 if size <= 100000 else 1
+
+    # Whole-book operations
+    results.append(summarize("load_accounts", size, timed(lambda: BankingSystem(path, **options).close(), repeat)))
+    system = BankingSystem(path, **options)
+    results.append(summarize("save_accounts", size, timed(system.save_accounts, repeat)))
+
+    # Per-operation paths
+    results.append(summarize("create_account", size, timed(lambda: system.create_account("Personal"), ops)))
+    picks = [rng.choice(credentials) for _ in range(ops)]
+    samples = []
+    for account_id, passcode in picks:
+        started = time.perf_counter_ns()
+        system.login(account_id, passcode)
+        samples.append(time.perf_counter_ns() - started)
+    results.append(summarize("login", size, samples))
+
+    accounts = [system.accounts[account_id] for account_id, _ in picks]
+    arguments = {
+        "1": lambda a: {},
+        "2": lambda a: {"amount": 1.0},
+        "3": lambda a: {"amount": 0.5},
+        "4": lambda a: {"amount": 0.25, "recipient_id": rng.choice(credentials)[0]},
+        "5": lambda a: {"amount": 0.25, "number": "17123456"},
+    }
+    for choice, make_arguments in arguments.items():
+        samples = []
+        for account in accounts:
+            kwargs = make_arguments(account)
+            started = time.perf_counter_ns()
+            system.process_User_Input(account, choice, **kwargs)
+            samples.append(time.perf_counter_ns() - started)
+        results.append(summarize(f"process_User_Input[{choice}]", size, samples))
+
+    # Deleting uses freshly made accounts so the book keeps its size
+    doomed = system.create_accounts("Personal", ops)
+    samples = []
+    for account in doomed:
+        started = time.perf_counter_ns()
+        system.process_User_Input(account, "6")
+        samples.append(time.perf_counter_ns() - started)
+    results.append(summarize("process_User_Input[6]", size, samples))
+    system.close()
+
+    # Object-level transfer, without any saving
+    left, right = PersonalAccount("1", "1", 10**9), PersonalAccount("2", "2", 0)
+    results.append(summarize("BankAccount.transfer", size, timed(lambda: left.transfer(1.0, right), ops)))
+    return results
+
+
+# Each import is measured in a fresh interpreter so nothing is cached
+IMPORT_PROBE = """
+import sys, time, tracemalloc
+before = set(sys.modules)
+tracemalloc.start()
+started = time.perf_counter()
+for name in sys.argv[1:]:
+    __import__(name)
+elapsed = time.perf_counter() - started
+print(elapsed, tracemalloc.get_traced_memory()[1], len(set(sys.modules) - before), "tkinter" in sys.modules)
+"""
+
+
+def measure_import(label, modules, repeat=5):
+    """
+    Time importing modules in a new interpreter.
+
+    Args:
+        label: Name for the result row
+        modules: Modules to import, in order
+        repeat: Fresh interpreters to start; the fastest run is kept
+
+    Returns:
+        dict: Best import time, peak allocated memory and number of modules loaded
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", IMPORT_PROBE, *modules], cwd=here,
+                                capture_output=True, text=True)
+        if output.returncode != 0:
+            return {"name": label, "error": output.stderr.strip().splitlines()[-1]}
+        elapsed, peak, loaded, tkinter = output.stdout.split()
+        runs.append((float(elapsed), int(peak), int(loaded), tkinter == "True"))
+    elapsed, peak, loaded, tkinter = min(runs)
+    return {
+        "name": label,
+        "import_ms": elapsed * 1000,
+        "peak_kib": peak / 1024,
+        "modules_loaded": loaded,
+        "tkinter_loaded": tkinter,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Find benchmarks that got slower than the baseline allows.
+
+    Returns:
+        list: Messages describing each regression
+    """
+    previous = {(r["name"], r["size"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = previous.get((result["name"], result["size"]))
+        if old and old["throughput"] and result["throughput"] < old["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{result['name']} @ {result['size']}: {result['throughput']:.0f} ops/s "
+                f"vs baseline {old['throughput']:.0f} ops/s"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banking system benchmarks")
+    parser.add_argument("--sizes", default="1000,10000", help="comma separated book sizes (up to 1000000)")
+    parser.add_argument("--ops", type=int, default=1000, help="operations timed per benchmark")
+    parser.add_argument("--table", default="dict", choices=["dict", "columnar"], help="account table to benchmark")
+    parser.add_argument("--storage", default="text", choices=sorted(STORAGE_BACKENDS), help="storage backend to benchmark")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", metavar="FILE", help="write the JSON results to FILE instead of stdout")
+    parser.add_argument("--baseline", metavar="FILE", help="compare against a saved baseline")
+    parser.add_argument("--save-baseline", metavar="FILE", help="save these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed throughput drop (default 0.25)")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bank_bench_")
+    try:
+        results = []
+        for size in (int(s) for s in args.sizes.split(",")):
+            results.extend(run_size(size, args.ops, rng, workdir, {"table": args.table, "storage": args.storage}))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "table": args.table,
+        "storage": args.storage,
+        "imports": [
+            measure_import("core", ["NamkheyYoeselTshering_02240085_A3"]),
+            measure_import("core+gui", ["NamkheyYoeselTshering_02240085_A3", "banking_gui"]),
+        ],
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        report["regressions"] = regressions
+        if regressions:
+            exit_code = 1
+            for message in regressions:
+                print("REGRESSION:", message, file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            file.write(text + "\n")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,11 +2,48 @@
 
 import unittest
 import os
+import glob
 import tempfile
+import threading
+import random
+import io
+import contextlib
+import asyncio
+import subprocess
+import sys
+import time
 from NamkheyYoeselTshering_02240085_A3 import (
-    BankAccount, PersonalAccount, BusinessAccount, BankingSystem,
-    Invalid_Menu_Choice_Exception, Invalid_Transfer_Exception
+    BankAccount, PersonalAccount, BusinessAccount, BankingSystem, Money,
+    Invalid_Menu_Choice_Exception, Invalid_Transfer_Exception,
+    MmapAccountStore, TransactionJournal, Journal_Failed_Exception, OperationBatch, main,
+    AccountIdAllocator, Account_Id_Exhausted_Exception, AccountTable,
+    SessionManager, hash_passcode, verify_passcode, SortedBalances, ReadSnapshot,
+    TextFileBackend, TableBalances, split_lines,
+    TransactionLedger, LEDGER_DEPOSIT, LEDGER_TRANSFER_OUT, LEDGER_TRANSFER_IN, LEDGER_TOP_UP,
+    LEDGER_REFUND,
+    BATCH_OK, BATCH_INSUFFICIENT_FUNDS, BATCH_UNKNOWN_ACCOUNT,
+    BATCH_UNKNOWN_RECIPIENT, BATCH_INVALID_NUMBER, BATCH_INVALID_AMOUNT, BATCH_LIMIT_EXCEEDED,
+    VelocityLimits
 )
+from banking_server import BankingServer, BankingClient
+from banking_topup import TopUpDispatcher, StubGateway, TOPUP_DELIVERED, TOPUP_REFUNDED
+from banking_scheduler import OrderScheduler, TimerWheel
+from banking_bookformat import (
+    BookWriter, BookReader, Invalid_Book_Exception, csv_to_book, book_to_csv, diff_books
+)
+try:
+    import banking_gui
+    from banking_gui import BackgroundWorker, BankingGUI
+except ImportError:   # Python built without Tk
+    banking_gui = None
+
+
+def remove_bank_files(filename):
+    """Delete an accounts file together with its journal and other side files"""
+    for path in [filename] + glob.glob(glob.escape(filename) + ".*"):
+        if os.path.exists(path):
+            os.unlink(path)
+
 
 class TestBankAccount(unittest.TestCase):
     """Tests for core BankAccount functionality"""
@@ -78,14 +115,62 @@ class TestBankAccount(unittest.TestCase):
         self.assertEqual(result, "Invalid phone number or insufficient balance.")
         self.assertEqual(self.account.funds, 100.0)
 
+class TestMoney(unittest.TestCase):
+    """Tests for the integer-cents money type"""
+
+    def test_conversions(self):
+        self.assertEqual(Money.to_cents(10), 1000)
+        self.assertEqual(Money.to_cents(0.1), 10)
+        self.assertEqual(Money.to_cents("12.5"), 1250)
+        self.assertEqual(Money.to_cents("-0.05"), -5)
+        self.assertEqual(Money.to_cents("1e2"), 10000)
+        with self.assertRaises(ValueError):
+            Money.to_cents("ten")
+
+    def test_text_round_trip(self):
+        for cents in (0, 5, 10, 10030, 10025, -250, 123456789012345678):
+            self.assertEqual(Money.parse(str(Money(cents))), cents)
+        self.assertEqual(str(Money(20000)), "200.0")
+        self.assertEqual(str(Money(10025)), "100.25")
+
+    def test_mixes_with_numbers(self):
+        total = sum([Money(10), Money(20)])
+        self.assertEqual(total, 0.3)
+        self.assertEqual(hash(Money(30)), hash(0.3))
+        self.assertLess(Money(5), 0.06)
+        self.assertEqual(f"{Money(1234):.1f}", "12.3")
+
+    def test_never_equal_to_text(self):
+        self.assertNotEqual(Money(1050), "10.50")
+        self.assertEqual(len({Money(1050): "money", "10.50": "text"}), 2)
+        self.assertNotEqual(Money(100), True)
+        self.assertNotEqual(Money(0), float("nan"))
+        with self.assertRaises(TypeError):
+            Money(5) < "0.06"
+
+    def test_accounts_have_no_dict(self):
+        account = BusinessAccount("12345", "1111", 10)
+        self.assertFalse(hasattr(account, "__dict__"))
+        with self.assertRaises(AttributeError):
+            account.nickname = "shop"
+
+    def test_sub_cent_amounts_are_rejected(self):
+        account = PersonalAccount("12345", "1111", 1)
+        self.assertEqual(account.deposit(0.001), "Invalid amount for deposit.")
+        self.assertEqual(account.funds, 1)
+
+
 class TestBankingSystem(unittest.TestCase):
     """Tests for BankingSystem functionality"""
+
+    # Extra BankingSystem arguments; subclasses rerun these tests on other setups
+    system_options = {}
     
     def setUp(self):
         # Use a temporary file for testing
         self.temp_file = tempfile.NamedTemporaryFile(delete=False)
         self.temp_file.close()
-        self.system = BankingSystem(self.temp_file.name)
+        self.system = BankingSystem(self.temp_file.name, **self.system_options)
         self.account1 = self.system.create_account("Personal")
         self.account2 = self.system.create_account("Business")
         # Set known balances for testing
@@ -94,7 +179,7 @@ class TestBankingSystem(unittest.TestCase):
         self.system.save_accounts()
     
     def tearDown(self):
-        os.unlink(self.temp_file.name)
+        remove_bank_files(self.temp_file.name)
     
     def test_valid_login(self):
         account = self.system.login(self.account1.account_id, self.account1.passcode)
@@ -155,6 +240,88 @@ class TestBankingSystem(unittest.TestCase):
         self.system.create_account("Personal")
         self.assertEqual(len(self.system.accounts), initial_count + 1)
 
+    def test_changes_survive_restart(self):
+        self.system.process_User_Input(self.account1, "4", amount=25.5, recipient_id=self.account2.account_id)
+        self.system.process_User_Input(self.account2, "5", amount=0.5, number="17123456")
+        new_account = self.system.create_account("Business")
+        self.system.delete_account(self.account1.account_id)
+        self.system.close()
+        self.system = BankingSystem(self.temp_file.name, **self.system_options)
+        self.assertNotIn(self.account1.account_id, self.system.accounts)
+        self.assertEqual(self.system.accounts[self.account2.account_id].funds, 125.0)
+        self.assertEqual(self.system.accounts[new_account.account_id].account_category, "Business")
+        self.system.close()
+
+    def test_deleted_account_stays_deleted(self):
+        stale = self.account1
+        self.system.delete_account(stale.account_id)
+        for choice in ("1", "2"):
+            with self.assertRaises(ValueError):
+                self.system.process_User_Input(stale, choice, amount=10.0)
+        self.system.close()
+        self.system = BankingSystem(self.temp_file.name, **self.system_options)
+        self.assertNotIn(stale.account_id, self.system.accounts)
+        self.assertEqual(self.system.account_count(), 1)
+        self.system.close()
+
+class TestBankingSystemColumnar(TestBankingSystem):
+    """The BankingSystem tests again, on the columnar account table"""
+    system_options = {"table": "columnar"}
+
+
+class TestBankingSystemMmap(TestBankingSystem):
+    """The BankingSystem tests again, on the binary account store"""
+    system_options = {"storage": "mmap"}
+
+
+class TestBankingSystemSqlite(TestBankingSystem):
+    """The BankingSystem tests again, on the SQLite backend"""
+    system_options = {"storage": "sqlite"}
+
+
+class TestSqliteBackend(unittest.TestCase):
+    """Tests for the SQLite storage engine"""
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.system = BankingSystem(self.temp_file.name, storage="sqlite")
+        self.account1, self.account2 = self.system.create_accounts("Personal", 2)
+        self.system.process_User_Input(self.account1, "2", amount=100)
+
+    def tearDown(self):
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    def rows(self):
+        return dict(self.system.backend.db.execute("SELECT account_id, cents FROM accounts").fetchall())
+
+    def test_wal_mode(self):
+        self.assertEqual(self.system.backend.db.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertTrue(self.system.checkpoint())
+
+    def test_transfer_is_one_transaction(self):
+        class Broken:
+            account_id, passcode, account_category = self.account2.account_id, "1", "Personal"
+            @property
+            def cents(self):
+                raise OSError("disk went away")
+        self.account1.funds = 50.0
+        with self.assertRaises(OSError):
+            self.system.backend.record([self.account1, Broken()])
+        self.assertEqual(self.rows()[self.account1.account_id], 10000)   # Rolled back
+        self.account1.funds = 100.0
+        self.system.process_User_Input(self.account1, "4", amount=40, recipient_id=self.account2.account_id)
+        self.assertEqual(self.rows(), {self.account1.account_id: 6000, self.account2.account_id: 4000})
+
+    def test_passcode_change_rewrites_row(self):
+        self.account1.passcode = hash_passcode("1234", iterations=1000)
+        self.system.record_changes([self.account1], full=True)
+        self.system.close()
+        self.system = BankingSystem(self.temp_file.name, storage="sqlite")
+        self.assertEqual(self.system.login(self.account1.account_id, "1234").funds, 100.0)
+
+
 class TestEdgeCases(unittest.TestCase):
     """Tests for unusual edge cases"""
     
@@ -167,7 +334,7 @@ class TestEdgeCases(unittest.TestCase):
         self.system.save_accounts()
     
     def tearDown(self):
-        os.unlink(self.temp_file.name)
+        remove_bank_files(self.temp_file.name)
     
     def test_transfer_to_self(self):
         """Test transferring to same account (should fail)"""
@@ -176,10 +343,11 @@ class TestEdgeCases(unittest.TestCase):
         self.assertEqual(self.account.funds, 100.0)
     
     def test_precision_handling(self):
-        """Test floating point precision handling"""
+        """Test that cent amounts add up exactly"""
         self.account.deposit(0.1)
         self.account.deposit(0.2)
-        self.assertAlmostEqual(self.account.funds, 100.3, places=2)
+        self.assertEqual(self.account.funds, 100.3)
+        self.assertEqual(self.account.cents, 10030)
     
     def test_empty_file(self):
         """Test system behavior with empty data file"""
@@ -199,5 +367,1665 @@ class TestEdgeCases(unittest.TestCase):
         system = BankingSystem(self.temp_file.name)
         self.assertEqual(len(system.accounts), 1)
 
+class TestParallelLoad(unittest.TestCase):
+    """Tests for loading a large accounts file in chunks"""
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        rng = random.Random(3)
+        with open(self.temp_file.name, "w") as f:
+            for n in range(3000):
+                if n % 700 == 0:
+                    f.write("bad,data,here\n")
+                category = rng.choice(["Personal", "Business"])
+                f.write(f"{10000 + n % 2500},{rng.randint(1000, 9999)},{category},{rng.randint(0, 10**5)}.{n % 100}\n")
+        self.threshold = TextFileBackend.PARALLEL_THRESHOLD
+
+    def tearDown(self):
+        TextFileBackend.PARALLEL_THRESHOLD = self.threshold
+        remove_bank_files(self.temp_file.name)
+
+    def load(self, workers, table="dict"):
+        system = BankingSystem(self.temp_file.name, load_workers=workers, table=table)
+        book = {a.account_id: (a.passcode, a.account_category, a.cents) for a in system.accounts.values()}
+        bad = system.backend.bad_lines
+        system.close()
+        return book, bad
+
+    def test_chunks_match_line_by_line_load(self):
+        expected, expected_bad = self.load(1)
+        self.assertEqual(len(expected), 2500)    # Later duplicate lines won
+        self.assertEqual([n for n, _ in expected_bad], [1, 702, 1403, 2104, 2805])
+        TextFileBackend.PARALLEL_THRESHOLD = 0
+        for workers in (1, 3):
+            for table in ("dict", "columnar"):
+                book, bad = self.load(workers, table)
+                self.assertEqual(book, expected)
+                self.assertEqual(bad, expected_bad)
+
+    def test_unusual_line_breaks_load_the_same(self):
+        with open(self.temp_file.name, "a", newline="") as f:
+            f.write("20001,12\x0b34,Personal,5.00\n20002,5678,Business,1.\u2028\n\n20003,4321,Personal,2.50\r\n")
+        expected, expected_bad = self.load(1)
+        self.assertEqual(expected["20001"], ("12\x0b34", "Personal", 500))
+        self.assertEqual(expected["20003"][2], 250)
+        TextFileBackend.PARALLEL_THRESHOLD = 0
+        for workers in (1, 3):
+            book, bad = self.load(workers)
+            self.assertEqual(book, expected)
+            self.assertEqual(bad, expected_bad)
+
+    def test_ranges_cover_whole_lines(self):
+        with open(self.temp_file.name, "rb") as f:
+            data = f.read()
+        ranges = split_lines(self.temp_file.name, 7)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(data))
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(data[start - 1:start], b"\n")
+
+class TestTransactionJournal(unittest.TestCase):
+    """Tests for the append-only journal"""
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.system = BankingSystem(self.temp_file.name)
+        self.account = self.system.create_account("Personal")
+        self.account.funds = 100.0
+        self.system.save_accounts()
+
+    def tearDown(self):
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    def test_operation_appends_instead_of_rewriting(self):
+        with open(self.temp_file.name) as f:
+            snapshot = f.read()
+        self.system.process_User_Input(self.account, "2", amount=25.0)
+        with open(self.temp_file.name) as f:
+            self.assertEqual(f.read(), snapshot)
+        self.assertEqual(self.system.journal.records, 1)
+
+    def test_restart_replays_journal(self):
+        other = self.system.create_account("Business")
+        self.system.process_User_Input(self.account, "4", amount=40.0, recipient_id=other.account_id)
+        restarted = BankingSystem(self.temp_file.name)
+        self.assertEqual(restarted.accounts[self.account.account_id].funds, 60.0)
+        self.assertEqual(restarted.accounts[other.account_id].funds, 40.0)
+
+    def test_replay_delete(self):
+        self.system.process_User_Input(self.account, "6")
+        restarted = BankingSystem(self.temp_file.name)
+        self.assertNotIn(self.account.account_id, restarted.accounts)
+
+    def test_torn_record_is_discarded(self):
+        self.system.process_User_Input(self.account, "2", amount=10.0)
+        self.system.journal.close()
+        with open(self.temp_file.name + ".journal", "ab") as f:
+            f.write(b"0000beef|U,12345,1111,Per")  # Crash in the middle of a write
+        restarted = BankingSystem(self.temp_file.name)
+        self.assertEqual(restarted.accounts[self.account.account_id].funds, 110.0)
+        self.assertNotIn("12345", restarted.accounts)
+        self.assertEqual(restarted.journal.records, 1)
+
+    def test_compaction_folds_journal_into_snapshot(self):
+        self.system.compact_every = 3
+        for _ in range(3):
+            self.system.process_User_Input(self.account, "2", amount=1.0)
+        self.assertEqual(self.system.journal.records, 0)
+        self.system.wait_for_checkpoint()
+        restarted = BankingSystem(self.temp_file.name)
+        self.assertEqual(restarted.accounts[self.account.account_id].funds, 103.0)
+
+
+class TestMmapAccountStore(unittest.TestCase):
+    """Tests for the memory-mapped fixed-width store"""
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.system = BankingSystem(self.temp_file.name, storage="mmap")
+        self.account1 = self.system.create_account("Personal")
+        self.account2 = self.system.create_account("Business")
+        self.account1.funds = 200.0
+        self.system.save_accounts()
+
+    def tearDown(self):
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    def reopen(self):
+        self.system.close()
+        self.system = BankingSystem(self.temp_file.name, storage="mmap")
+        return self.system
+
+    def test_round_trip(self):
+        system = self.reopen()
+        account = system.login(self.account1.account_id, self.account1.passcode)
+        self.assertEqual(account.funds, 200.0)
+        self.assertEqual(account.account_category, "Personal")
+        self.assertEqual(system.accounts[self.account2.account_id].account_category, "Business")
+
+    def test_operations_patch_in_place(self):
+        size = os.path.getsize(self.temp_file.name)
+        self.system.process_User_Input(self.account1, "4", amount=75.0, recipient_id=self.account2.account_id)
+        self.assertEqual(os.path.getsize(self.temp_file.name), size)
+        system = self.reopen()
+        self.assertEqual(system.accounts[self.account1.account_id].funds, 125.0)
+        self.assertEqual(system.accounts[self.account2.account_id].funds, 75.0)
+
+    def test_deleted_slot_is_reused(self):
+        slot = self.system.store.index[self.account1.account_id]
+        self.system.delete_account(self.account1.account_id)
+        new_account = self.system.create_account("Personal")
+        self.assertEqual(self.system.store.index[new_account.account_id], slot)
+        system = self.reopen()
+        self.assertNotIn(self.account1.account_id, system.accounts)
+        self.assertIn(new_account.account_id, system.accounts)
+
+    def test_store_grows(self):
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+        store = MmapAccountStore(self.temp_file.name, initial_slots=2)
+        for i in range(10):
+            store.write(PersonalAccount(str(10000 + i), "1111", float(i)))
+        store.close()
+        self.system = BankingSystem(self.temp_file.name, storage="mmap")
+        self.assertEqual(len(self.system.accounts), 10)
+        self.assertEqual(self.system.accounts["10009"].funds, 9.0)
+
+
+class TestGroupCommit(unittest.TestCase):
+    """Tests for batched fsync in the journal"""
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+
+    def tearDown(self):
+        remove_bank_files(self.temp_file.name)
+
+    def test_concurrent_records_share_fsyncs(self):
+        journal = TransactionJournal(self.temp_file.name + ".journal", group_commit=True,
+                                     commit_window=0.05, commit_batch=8)
+        def writer(n):
+            for i in range(5):
+                journal.append([("U", str(10000 + n), "1111", "Personal", float(i))])
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        journal.close()
+        self.assertEqual(journal.records, 40)
+        self.assertLess(journal.syncs, 40)
+        self.assertEqual(len(TransactionJournal(journal.path).replay()), 40)
+
+    def test_single_caller_is_durable_on_return(self):
+        system = BankingSystem(self.temp_file.name, group_commit=True, commit_window=0.001)
+        account = system.create_account("Personal")
+        system.process_User_Input(account, "2", amount=30.0)
+        self.assertEqual(system.journal.syncs, 2)
+        system.close()
+        restarted = BankingSystem(self.temp_file.name)
+        self.assertEqual(restarted.accounts[account.account_id].funds, 30.0)
+        restarted.close()
+
+
+    def test_failed_write_is_reported_to_every_caller(self):
+        journal = TransactionJournal(self.temp_file.name + ".journal", group_commit=True,
+                                     commit_window=0.2, commit_batch=4)
+        open(journal.path, "wb").close()
+        journal.file = open(journal.path, "rb")   # Every write to it fails
+        outcomes = []
+        def writer(n):
+            try:
+                journal.append([("U", str(10000 + n), "1111", "Personal", 1.0)])
+                outcomes.append("saved")
+            except OSError as e:
+                outcomes.append(type(e))
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertNotIn("saved", outcomes)
+        self.assertEqual(outcomes.count(Journal_Failed_Exception), 3)
+        with self.assertRaises(Journal_Failed_Exception):
+            journal.append([("D", "10000")])
+        journal.reset()
+        journal.append([("D", "10000")])
+        journal.close()
+        self.assertEqual(len(TransactionJournal(journal.path).replay()), 1)
+
+
+class TestApplyBatch(unittest.TestCase):
+    """Tests for bulk operations"""
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.system = BankingSystem(self.temp_file.name)
+        self.account1 = self.system.create_account("Personal")
+        self.account2 = self.system.create_account("Business")
+        self.account1.funds = 100.0
+        self.system.save_accounts()
+
+    def tearDown(self):
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    def test_statuses_and_order(self):
+        a, b = self.account1.account_id, self.account2.account_id
+        status = self.system.apply_batch([
+            ("withdraw", a, 150.0),          # Overdraft
+            ("deposit", a, 50.0),
+            ("withdraw", a, 150.0),          # Fine after the deposit
+            ("transfer", b, 10.0, a),        # Business account is empty
+            ("transfer", a, 10.0, "99999"),
+            ("topup", a, 5.0, "1234"),
+            ("deposit", "00000", 5.0),
+            ("deposit", a, -5.0),
+        ])
+        self.assertEqual(list(status), [
+            BATCH_INSUFFICIENT_FUNDS, BATCH_OK, BATCH_OK, BATCH_INSUFFICIENT_FUNDS,
+            BATCH_UNKNOWN_RECIPIENT, BATCH_INVALID_NUMBER, BATCH_UNKNOWN_ACCOUNT,
+            BATCH_INVALID_AMOUNT,
+        ])
+        self.assertEqual(self.account1.funds, 0.0)
+
+    def test_matches_per_call_methods(self):
+        rng = random.Random(7)
+        a, b = self.account1.account_id, self.account2.account_id
+        rows = []
+        for _ in range(300):
+            operation = rng.choice(["deposit", "withdraw", "transfer", "topup"])
+            source, target = rng.choice([(a, b), (b, a)])
+            if operation == "topup":
+                target = rng.choice(["12345678", "123"])
+            rows.append((operation, source, float(rng.randint(-5, 60)), target))
+
+        twin1 = PersonalAccount(a, "0", 100.0)
+        twin2 = BusinessAccount(b, "0", 0.0)
+        twins = {a: twin1, b: twin2}
+        expected = []
+        for operation, source, amount, target in rows:
+            account = twins[source]
+            if operation == "deposit":
+                ok = account.deposit(amount) == "Deposit completed."
+            elif operation == "withdraw":
+                ok = account.withdraw(amount) == "Withdrawal completed."
+            elif operation == "transfer":
+                ok = account.transfer(amount, twins[target]) == "Transfer completed."
+            else:
+                ok = account.top_up_mobile(target, amount).startswith("Mobile number")
+            expected.append(ok)
+
+        status = self.system.apply_batch(rows)
+        self.assertEqual([code == BATCH_OK for code in status], expected)
+        self.assertEqual(self.account1.funds, twin1.funds)
+        self.assertEqual(self.account2.funds, twin2.funds)
+
+    def test_binary_file_and_persistence(self):
+        path = self.temp_file.name + ".ops"
+        OperationBatch.from_rows([("transfer", self.account1.account_id, 30.0, self.account2.account_id)]).write(path)
+        status = self.system.apply_batch(path)
+        self.assertEqual(list(status), [BATCH_OK])
+        restarted = BankingSystem(self.temp_file.name)
+        self.assertEqual(restarted.accounts[self.account2.account_id].funds, 30.0)
+        restarted.close()
+
+    def test_cli_applies_csv(self):
+        self.system.close()
+        path = self.temp_file.name + ".csv"
+        with open(path, "w") as f:
+            f.write(f"deposit,{self.account1.account_id},20\nwithdraw,{self.account2.account_id},5\n")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            main(["--accounts", self.temp_file.name, "--batch", path])
+        self.assertIn("ok: 1", output.getvalue())
+        self.assertIn("insufficient funds: 1", output.getvalue())
+        self.system = BankingSystem(self.temp_file.name)
+        self.assertEqual(self.system.accounts[self.account1.account_id].funds, 120.0)
+
+    def test_replay_keeps_line_order(self):
+        a, b = self.account1.account_id, self.account2.account_id
+        script = [
+            f"{a} 2 50", f"{a} 1", "# comment", "",
+            f"{a},4,30,{b}", f"{b} 3 100", f"{a} 5 5 17123456",
+            f"{a} 9", "00000 1", f"{b} 6",
+        ]
+        results = list(self.system.replay(script, batch_size=2))
+        self.assertEqual(results, [
+            (1, "ok"), (2, "Your balance is 150.0"), (5, "ok"), (6, "insufficient funds"), (7, "ok"),
+            (8, "error: Invalid menu choice"), (9, "unknown account"), (10, "Account successfully deleted."),
+        ])
+        self.assertEqual(self.account1.funds, 115.0)
+        self.assertNotIn(b, self.system.accounts)
+
+    def test_cli_replay(self):
+        self.system.close()
+        path = self.temp_file.name + ".script"
+        with open(path, "w") as f:
+            f.write(f"{self.account1.account_id} 3 40\n{self.account1.account_id} 1\n")
+        output, errors = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(errors):
+            main(["--accounts", self.temp_file.name, "--replay", path])
+        self.assertEqual(output.getvalue(), "1: ok\n2: Your balance is 60.0\n")
+        self.assertIn("Replayed 2 operations", errors.getvalue())
+        self.system = BankingSystem(self.temp_file.name)
+        self.assertEqual(self.system.accounts[self.account1.account_id].funds, 60.0)
+
+    def test_command_line_does_not_import_tkinter(self):
+        code = ("import sys, NamkheyYoeselTshering_02240085_A3 as core; print('tkinter' in sys.modules); "
+                "core.BankingGUI; print('tkinter' in sys.modules)")
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(output.stdout.split(), ["False", "True"])
+
+
+class TestAccountIdAllocator(unittest.TestCase):
+    """Tests for collision-free account ID allocation"""
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.path = self.temp_file.name + ".ids"
+
+    def tearDown(self):
+        remove_bank_files(self.temp_file.name)
+
+    def test_whole_space_is_unique_then_exhausted(self):
+        allocator = AccountIdAllocator(self.path, width=2)
+        ids = allocator.allocate_many(90)
+        self.assertEqual(sorted(ids), [str(n) for n in range(10, 100)])
+        with self.assertRaises(Account_Id_Exhausted_Exception):
+            allocator.allocate()
+
+    def test_restart_never_repeats(self):
+        first = AccountIdAllocator(self.path, width=3, reserve=10).allocate_many(25)
+        second = AccountIdAllocator(self.path, width=3, reserve=10).allocate_many(25)
+        self.assertEqual(len(set(first) | set(second)), 50)
+
+    def test_changing_width_and_back_never_repeats(self):
+        first = AccountIdAllocator(self.path, width=3, reserve=10).allocate_many(25)
+        wider = AccountIdAllocator(self.path, width=4, reserve=10).allocate_many(5)
+        again = AccountIdAllocator(self.path, width=3, reserve=10).allocate_many(25)
+        self.assertEqual(len(set(first) | set(again)), 50)
+        self.assertTrue(all(len(account_id) == 4 for account_id in wider))
+        self.assertNotIn(wider[0], AccountIdAllocator(self.path, width=4, reserve=10).allocate_many(20))
+
+    def test_skips_ids_in_use(self):
+        allocator = AccountIdAllocator(self.path, width=2)
+        legacy_id = str(allocator.low + allocator.permute(0))
+        new_id = allocator.allocate(in_use=lambda account_id: account_id == legacy_id)
+        self.assertNotEqual(new_id, legacy_id)
+        self.assertEqual(allocator.counter, 2)
+
+    def test_wider_ids_and_bulk_creation(self):
+        system = BankingSystem(self.temp_file.name, id_width=9)
+        accounts = system.create_accounts("Business", 500)
+        self.assertEqual(len(system.accounts), 500)
+        self.assertTrue(all(len(a.account_id) == 9 for a in accounts))
+        self.assertEqual(system.journal.records, 1)
+        system.close()
+
+
+class TestConcurrency(unittest.TestCase):
+    """Tests for the locked, multi-threaded engine"""
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.system = BankingSystem(self.temp_file.name, workers=8)
+        self.accounts = self.system.create_accounts("Personal", 6)
+        for account in self.accounts:
+            account.funds = 1000.0
+        self.system.save_accounts()
+
+    def tearDown(self):
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    def test_contended_transfers_keep_money(self):
+        rng = random.Random(3)
+        requests = []
+        for _ in range(2000):
+            source, target = rng.sample(self.accounts, 2)
+            requests.append((source, "4", {"amount": float(rng.randint(1, 50)), "recipient_id": target.account_id}))
+        requests += [(account, "2", {"amount": 1.0}) for account in self.accounts for _ in range(100)]
+        self.system.run_parallel(requests)
+        self.assertEqual(sum(a.funds for a in self.accounts), 6000.0 + 600.0)
+        self.assertTrue(all(a.funds >= 0 for a in self.accounts))
+
+        restarted = BankingSystem(self.temp_file.name)
+        for account in self.accounts:
+            self.assertEqual(restarted.accounts[account.account_id].funds, account.funds)
+        restarted.close()
+
+    def test_errors_come_back_per_request(self):
+        results = self.system.run_parallel([
+            (self.accounts[0], "2", {"amount": 5.0}),
+            (self.accounts[0], "4", {"amount": 5.0, "recipient_id": "00000"}),
+        ])
+        self.assertEqual(results[0], "Deposit completed.")
+        self.assertIsInstance(results[1], Invalid_Transfer_Exception)
+
+    def test_transfer_to_self_through_system(self):
+        account = self.accounts[0]
+        result = self.system.submit(account, "4", amount=10.0, recipient_id=account.account_id).result()
+        self.assertEqual(result, "Cannot transfer to the same account.")
+        self.assertEqual(account.funds, 1000.0)
+
+
+class TestSessions(unittest.TestCase):
+    """Tests for hashed passcodes and session tokens"""
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.system = BankingSystem(self.temp_file.name, hash_passcodes=True, passcode_iterations=1000)
+
+    def tearDown(self):
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    def test_hash_round_trip(self):
+        stored = hash_passcode("1234", iterations=1000)
+        self.assertTrue(verify_passcode(stored, "1234"))
+        self.assertFalse(verify_passcode(stored, "4321"))
+        self.assertNotIn("1234", stored.split("$")[2:])
+
+    def test_new_accounts_store_only_hashes(self):
+        account, passcode = self.system.open_account("Personal")
+        self.assertTrue(account.passcode.startswith("pbkdf2_sha256$"))
+        self.system.close()
+        self.system = BankingSystem(self.temp_file.name, hash_passcodes=True, passcode_iterations=1000)
+        self.assertEqual(self.system.login(account.account_id, passcode).account_id, account.account_id)
+        with self.assertRaises(ValueError):
+            self.system.login(account.account_id, account.passcode)
+
+    def test_tokens(self):
+        account, passcode = self.system.open_account("Business")
+        token = self.system.open_session(account.account_id, passcode)
+        self.assertEqual(self.system.authenticate(token).account_id, account.account_id)
+        self.system.close_session(token)
+        with self.assertRaises(ValueError):
+            self.system.authenticate(token)
+        token = self.system.open_session(account.account_id, passcode)
+        self.system.delete_account(account.account_id)
+        with self.assertRaises(ValueError):
+            self.system.authenticate(token)
+
+    def test_cache_is_bounded_and_expires(self):
+        sessions = SessionManager(ttl=60, max_sessions=3)
+        tokens = [sessions.issue(str(n)) for n in range(5)]
+        self.assertEqual(len(sessions), 3)
+        self.assertIsNone(sessions.lookup(tokens[0]))
+        self.assertEqual(sessions.lookup(tokens[4]), "4")
+        sessions.ttl = -1
+        token = sessions.issue("9")
+        self.assertIsNone(sessions.lookup(token))
+
+    def test_migration_of_plain_passcodes(self):
+        with open(self.temp_file.name, "w") as f:
+            f.write("12345,1111,Personal,10.0\n54321,2222,Business,5.0\n")
+        plain = BankingSystem(self.temp_file.name, passcode_iterations=1000)
+        self.assertEqual(plain.rehash_passcodes(), 2)
+        plain.close()
+        with open(self.temp_file.name) as f:
+            self.assertNotIn(",1111,", f.read())
+        system = BankingSystem(self.temp_file.name)
+        self.assertEqual(system.login("12345", "1111").funds, 10.0)
+        system.close()
+
+    def test_migration_in_binary_store(self):
+        os.unlink(self.temp_file.name)
+        system = BankingSystem(self.temp_file.name, storage="mmap", passcode_iterations=1000)
+        system.accounts["12345"] = PersonalAccount("12345", "1111", 10.0)
+        system.record_changes([system.accounts["12345"]])
+        self.assertEqual(system.rehash_passcodes(), 1)
+        system.close()
+        system = BankingSystem(self.temp_file.name, storage="mmap")
+        self.assertTrue(system.accounts["12345"].passcode.startswith("pbkdf2_sha256$"))
+        self.assertEqual(system.login("12345", "1111").funds, 10.0)
+        system.close()
+
+    def test_asking_for_hashes_migrates_a_plain_book(self):
+        with open(self.temp_file.name, "w") as f:
+            f.write("12345,1111,Personal,10.0\n")
+        self.system.close()
+        self.system = BankingSystem(self.temp_file.name, hash_passcodes=True, passcode_iterations=1000)
+        self.assertTrue(self.system.accounts["12345"].passcode.startswith("pbkdf2_sha256$"))
+        self.system.close()
+        self.system = BankingSystem(self.temp_file.name)
+        self.assertTrue(self.system.accounts["12345"].passcode.startswith("pbkdf2_sha256$"))
+        self.assertEqual(self.system.login("12345", "1111").funds, 10.0)
+
+    def test_hashed_book_keeps_hashing(self):
+        self.system.open_account("Personal")
+        self.system.close()
+        self.system = BankingSystem(self.temp_file.name, passcode_iterations=1000)   # A later normal run
+        account, passcode = self.system.open_account("Business")
+        self.assertTrue(account.passcode.startswith("pbkdf2_sha256$"))
+        self.assertEqual(self.system.login(account.account_id, passcode).account_id, account.account_id)
+        self.system.close()
+        with self.assertRaises(ValueError):
+            BankingSystem(self.temp_file.name, hash_passcodes=False)
+
+
+class TestReports(unittest.TestCase):
+    """Tests for the running book-wide aggregates"""
+    system_options = {}
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        if self.system_options.get("storage") == "mmap":
+            os.unlink(self.temp_file.name)
+        self.system = BankingSystem(self.temp_file.name, **self.system_options)
+        self.rng = random.Random(7)
+
+    def tearDown(self):
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    def assert_matches_scan(self):
+        accounts = list(self.system.accounts.values())
+        self.assertEqual(self.system.total_funds(), Money(sum(a.cents for a in accounts)))
+        self.assertEqual(self.system.account_count(), len(accounts))
+        for name in ("Personal", "Business"):
+            group = [a.cents for a in accounts if a.account_category == name]
+            self.assertEqual(self.system.category_totals()[name], (Money(sum(group)), len(group)))
+        ranked = sorted(((a.cents, a.account_id) for a in accounts), reverse=True)
+        self.assertEqual([(i, m.cents) for i, m in self.system.top_accounts(5)], [(i, c) for c, i in ranked[:5]])
+        if accounts:
+            self.assertEqual(self.system.balance_percentile(1.0).cents, ranked[0][0])
+            self.assertEqual(self.system.balance_percentile(0).cents, ranked[-1][0])
+
+    def test_every_operation_keeps_reports_current(self):
+        accounts = self.system.create_accounts("Personal", 30) + self.system.create_accounts("Business", 10)
+        for account in accounts:
+            self.system.process_User_Input(account, "2", amount=self.rng.randint(1, 500))
+        for _ in range(200):
+            account, other = self.rng.sample(accounts, 2)
+            choice = self.rng.choice("345")
+            self.system.process_User_Input(account, choice, amount=self.rng.randint(1, 50),
+                                           recipient_id=other.account_id, number="17123456")
+        self.system.apply_batch([("deposit", accounts[-1].account_id, 9999.0),
+                                 ("transfer", accounts[-1].account_id, 5.0, accounts[-2].account_id)])
+        for account in accounts[:5]:
+            self.system.process_User_Input(account, "6")
+        self.assert_matches_scan()
+
+        # The same figures come back after a restart
+        self.system.close()
+        self.system = BankingSystem(self.temp_file.name, **self.system_options)
+        self.assert_matches_scan()
+        self.assertEqual(self.system.top_accounts(1)[0][0], accounts[-1].account_id)
+
+    def test_median_and_unsaved_changes(self):
+        self.assertIsNone(self.system.balance_percentile(0.5))
+        accounts = self.system.create_accounts("Personal", 5)
+        for n, account in enumerate(accounts):
+            account.funds = float(n * 10)
+        self.system.save_accounts()
+        self.assertEqual(self.system.balance_percentile(0.5), 20.0)
+        self.assertEqual(self.system.total_funds(), 100.0)
+        with self.assertRaises(ValueError):
+            self.system.balance_percentile(1.5)
+
+    def test_sorted_balances_split_buckets(self):
+        ordered = SortedBalances()
+        pairs = [(self.rng.randint(0, 10**6), str(n)) for n in range(5000)]
+        for pair in pairs:
+            ordered.add(pair)
+        for pair in pairs[::2]:
+            ordered.remove(pair)
+        expected = sorted(pairs[1::2])
+        self.assertGreater(len(ordered.buckets), 1)
+        self.assertEqual([ordered.at(i) for i in range(len(expected))], expected)
+        self.assertEqual(ordered.largest(3), expected[::-1][:3])
+
+
+class TestReportsColumnar(TestReports):
+    """The report tests again, on the columnar account table"""
+    system_options = {"table": "columnar"}
+
+
+class TestReportsMmap(TestReports):
+    """The report tests again, on the binary account store"""
+    system_options = {"storage": "mmap"}
+
+
+class TestReportsSqlite(TestReports):
+    """The report tests again, on the SQLite backend"""
+    system_options = {"storage": "sqlite"}
+
+
+class TestReadSnapshots(unittest.TestCase):
+    """Tests for versioned read snapshots"""
+    system_options = {}
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.system = BankingSystem(self.temp_file.name, **self.system_options)
+        self.accounts = self.system.create_accounts("Personal", 20)
+        for account in self.accounts:
+            account.funds = 100.0
+        self.system.save_accounts()
+
+    def tearDown(self):
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    def test_snapshot_keeps_its_version(self):
+        first, second = self.accounts[0], self.accounts[1]
+        with self.system.snapshot() as snapshot:
+            self.assertIsInstance(snapshot, ReadSnapshot)
+            self.system.process_User_Input(first, "4", amount=30, recipient_id=second.account_id)
+            self.system.delete_account(self.accounts[2].account_id)
+            new_account = self.system.create_account("Business")
+            self.assertEqual(snapshot.balance(first.account_id), 100)
+            self.assertEqual(snapshot.balance(self.accounts[2].account_id), 100)
+            self.assertIsNone(snapshot.get(new_account.account_id))
+            self.assertEqual(snapshot.total_funds(), 2000)
+            self.assertEqual(snapshot.category_totals()["Personal"], (2000, 20))
+            with self.system.snapshot() as later:
+                self.assertEqual(later.balance(first.account_id), 70)
+                self.assertIsNone(later.get(self.accounts[2].account_id))
+                self.assertEqual(later.total_funds(), 1900)
+        with self.assertRaises(ValueError):
+            snapshot.balance(first.account_id)
+
+    def test_old_versions_are_reclaimed(self):
+        aggregates = self.system.aggregates
+        older = self.system.snapshot()
+        self.system.process_User_Input(self.accounts[0], "2", amount=5)
+        newer = self.system.snapshot()
+        self.system.process_User_Input(self.accounts[1], "2", amount=5)
+        self.assertEqual(len(aggregates.history), 2)
+        older.close()
+        self.assertEqual(list(aggregates.history), [self.accounts[1].account_id])
+        self.assertEqual(newer.balance(self.accounts[1].account_id), 100)
+        newer.close()
+        self.assertEqual(aggregates.history, {})
+        self.assertEqual(len(aggregates.retired), 0)
+        self.system.process_User_Input(self.accounts[2], "2", amount=5)
+        self.assertEqual(aggregates.history, {})   # Nothing kept without readers
+
+    def test_scans_see_whole_transfers(self):
+        stop = threading.Event()
+
+        def shuffle():
+            rng = random.Random(7)
+            while not stop.is_set():
+                sender, recipient = rng.sample(self.accounts, 2)
+                self.system.process_User_Input(sender, "4", amount=rng.randint(1, 20), recipient_id=recipient.account_id)
+
+        writers = [threading.Thread(target=shuffle) for _ in range(2)]
+        for writer in writers:
+            writer.start()
+        try:
+            for _ in range(50):
+                with self.system.snapshot() as snapshot:
+                    self.assertEqual(snapshot.total_funds(), 2000)
+        finally:
+            stop.set()
+            for writer in writers:
+                writer.join()
+
+    def test_balance_check_reads_committed_balance(self):
+        account = self.accounts[0]
+        account.cents += 1000   # Changed but never recorded
+        self.assertEqual(self.system.process_User_Input(account, "1"), "Your balance is 100.0")
+
+
+class TestReadSnapshotsColumnar(TestReadSnapshots):
+    """The snapshot tests again, on the columnar account table"""
+    system_options = {"table": "columnar"}
+
+    def test_committed_balances_are_kept_by_row(self):
+        balances = self.system.aggregates.balances
+        self.assertIsInstance(balances, TableBalances)
+        self.assertEqual(len(balances), 20)
+        self.assertEqual(balances.get(self.accounts[0].account_id), ("Personal", 10000))
+        del self.system.accounts[self.accounts[1].account_id]   # Removed without being recorded
+        self.system.save_accounts()
+        self.assertNotIn(self.accounts[1].account_id, balances)
+        self.assertEqual(self.system.account_count(), 19)
+        self.assertEqual(self.system.total_funds(), 1900)
+
+
+class TestVelocityLimits(unittest.TestCase):
+    """Tests for per-category spending limits"""
+
+    def setUp(self):
+        self.now = 0.0
+        self.limits = VelocityLimits({"Personal": [(3600, 100), (86400, 250)], "Business": [(3600, 1000)]},
+                                     clock=lambda: self.now)
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.system = BankingSystem(self.temp_file.name, velocity_limits=self.limits)
+        self.personal = self.system.create_account("Personal")
+        self.business = self.system.create_account("Business")
+        self.personal.funds = 1000.0
+        self.business.funds = 1000.0
+        self.system.save_accounts()
+
+    def tearDown(self):
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    def test_limits_per_category(self):
+        self.assertEqual(self.system.process_User_Input(self.personal, "3", amount=60), "Withdrawal completed.")
+        result = self.system.process_User_Input(self.personal, "4", amount=50, recipient_id=self.business.account_id)
+        self.assertIn("spending limit", result)
+        self.assertEqual(self.personal.funds, 940)
+        self.assertEqual(self.limits.remaining(self.personal.account_id, "Personal"), 40)
+        self.assertEqual(self.system.process_User_Input(self.business, "3", amount=500), "Withdrawal completed.")
+        self.assertEqual(self.system.process_User_Input(self.personal, "2", amount=500), "Deposit completed.")
+
+    def test_window_slides(self):
+        self.system.process_User_Input(self.personal, "3", amount=100)
+        self.assertIn("spending limit", self.system.process_User_Input(self.personal, "5", amount=1, number="17123456"))
+        self.now = 3000.0   # Still inside the hour
+        self.assertFalse(self.limits.allows(self.personal.account_id, "Personal", 100))
+        self.now = 3700.0
+        self.assertEqual(self.system.process_User_Input(self.personal, "3", amount=100), "Withdrawal completed.")
+        self.now = 7400.0
+        self.system.process_User_Input(self.personal, "3", amount=50)
+        self.assertEqual(self.limits.remaining(self.personal.account_id, "Personal"), 0)   # Daily limit reached
+        self.assertIn("spending limit", self.system.process_User_Input(self.personal, "3", amount=1))
+        self.now = 86400.0 + 3700.0
+        self.assertEqual(self.limits.remaining(self.personal.account_id, "Personal"), 100)
+
+    def test_batches_report_limits(self):
+        status = self.system.apply_batch([
+            ("withdraw", self.personal.account_id, 80),
+            ("transfer", self.personal.account_id, 30, self.business.account_id),
+            ("topup", self.personal.account_id, 20, "17123456"),
+        ])
+        self.assertEqual(list(status), [BATCH_OK, BATCH_LIMIT_EXCEEDED, BATCH_OK])
+        self.assertEqual(self.personal.funds, 900)
+
+    def test_refund_gives_back_headroom(self):
+        self.now = 1000.0
+        self.system.apply_batch([("topup", self.personal.account_id, 70, "17123456")])
+        self.now = 1500.0   # A later bucket of the same hour
+        self.system.apply_batch([("withdraw", self.personal.account_id, 20)])
+        self.assertEqual(self.limits.remaining(self.personal.account_id, "Personal"), 10)
+        status = self.system.apply_batch([("refund", self.personal.account_id, 70)])
+        self.assertEqual(list(status), [BATCH_OK])
+        self.assertEqual(self.personal.funds, 980)
+        self.assertEqual(self.limits.remaining(self.personal.account_id, "Personal"), 80)
+        self.now = 3700.0 + 1000.0   # Only the 20 is left when that bucket slides out
+        self.assertEqual(self.limits.remaining(self.personal.account_id, "Personal"), 100)
+
+    def test_idle_accounts_are_evicted(self):
+        for n in range(50):
+            self.limits.record(str(n), "Personal", 1)
+        self.assertEqual(len(self.limits), 50)
+        self.now = 2 * 86400.0
+        for n in range(50, 80):
+            self.limits.record(str(n), "Personal", 1)
+        self.assertEqual(len(self.limits), 30)
+
+
+class TestTopUpDispatcher(unittest.TestCase):
+    """Tests for batched top-up delivery"""
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.system = BankingSystem(self.temp_file.name)
+        self.account = self.system.create_account("Personal")
+        self.account.funds = 100.0
+        self.system.save_accounts()
+        self.dispatchers = []
+
+    def tearDown(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.close()
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    def dispatcher(self, gateway, **options):
+        options.setdefault("backoff", 0.001)
+        dispatcher = TopUpDispatcher(self.system, gateway, **options)
+        self.dispatchers.append(dispatcher)
+        return dispatcher
+
+    def test_funds_reserved_then_delivered_in_batches(self):
+        gateway = StubGateway()
+        dispatcher = self.dispatcher(gateway, batch_size=10, max_wait=0.5)
+        futures = dispatcher.submit_many([(self.account.account_id, "17123456", 1.5)] * 25)
+        self.assertEqual(self.account.funds, 62.5)   # Reserved before delivery
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual([f.result() for f in futures], [TOPUP_DELIVERED] * 25)
+        self.assertEqual(sorted(gateway.batches), [5, 10, 10])
+        self.assertEqual(dispatcher.stats()["delivered"], 25)
+        self.assertEqual(dispatcher.stats()["queue_depth"], 0)
+
+    def test_declined_without_reserving(self):
+        dispatcher = self.dispatcher(StubGateway())
+        self.assertEqual(dispatcher.submit(self.account, "17123456", 500).result(), "insufficient funds")
+        self.assertEqual(dispatcher.submit(self.account, "123", 5).result(), "invalid phone number")
+        self.assertEqual(self.account.funds, 100.0)
+
+    def test_rejected_top_up_is_refunded_and_saved(self):
+        dispatcher = self.dispatcher(StubGateway(reject_numbers={"17000000"}))
+        good = dispatcher.submit(self.account, "17123456", 10)
+        bad = dispatcher.submit(self.account, "17000000", 20)
+        self.assertEqual(bad.result(timeout=5), TOPUP_REFUNDED)
+        self.assertEqual(good.result(timeout=5), TOPUP_DELIVERED)
+        self.assertEqual(self.account.funds, 90.0)
+        restarted = BankingSystem(self.temp_file.name)
+        self.assertEqual(restarted.accounts[self.account.account_id].funds, 90.0)
+        restarted.close()
+
+    def test_retries_with_backoff(self):
+        gateway = StubGateway(fail_batches=2, flaky_numbers={"17654321": 1})
+        dispatcher = self.dispatcher(gateway)
+        futures = [dispatcher.submit(self.account, "17654321", 5), dispatcher.submit(self.account, "17123456", 5)]
+        self.assertEqual([f.result(timeout=5) for f in futures], [TOPUP_DELIVERED] * 2)
+        self.assertGreaterEqual(dispatcher.stats()["retries"], 2)
+        self.assertEqual(self.account.funds, 90.0)
+
+    def test_gives_up_after_max_attempts(self):
+        dispatcher = self.dispatcher(StubGateway(fail_batches=10), max_attempts=3)
+        self.assertEqual(dispatcher.submit(self.account, "17123456", 5).result(timeout=5), TOPUP_REFUNDED)
+        self.assertEqual(self.account.funds, 100.0)
+        self.assertEqual(dispatcher.stats()["retries"], 2)
+        self.assertIn(("topup_delivery", "refunded"), self.system.metrics.counters)
+
+    def test_failed_settlement_resolves_every_caller(self):
+        apply_batch = self.system.apply_batch
+        def failing_refunds(operations):
+            if operations[0][0] == "refund":
+                raise OSError("disk full")
+            return apply_batch(operations)
+        self.system.apply_batch = failing_refunds
+        dispatcher = self.dispatcher(StubGateway(reject_numbers={"17000000"}))
+        futures = [dispatcher.submit(self.account, "17000000", 10), dispatcher.submit(self.account, "17123456", 5)]
+        with self.assertRaises(OSError):
+            futures[0].result(timeout=5)
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual(dispatcher.stats()["in_flight"], 0)
+
+    def test_other_accounts_are_not_blocked(self):
+        other = self.system.create_account("Personal")
+        locks = self.system.locks
+        while locks.stripes_for([other.account_id]) == locks.stripes_for([self.account.account_id]):
+            other = self.system.create_account("Personal")
+        dispatcher = self.dispatcher(StubGateway())
+        held, done = threading.Event(), threading.Event()
+        def busy():   # Another operation working on a different account for a while
+            with locks.holding(other.account_id):
+                held.set()
+                done.wait(2)
+        holder = threading.Thread(target=busy)
+        holder.start()
+        held.wait()
+        started = time.perf_counter()
+        future = dispatcher.submit(self.account, "17123456", 5)
+        elapsed = time.perf_counter() - started
+        done.set()
+        holder.join()
+        self.assertLess(elapsed, 1)
+        self.assertEqual(future.result(timeout=5), TOPUP_DELIVERED)
+
+    def test_refund_is_posted_as_refund_and_frees_limits(self):
+        path = self.temp_file.name + ".limited"
+        system = BankingSystem(path, ledger=True, velocity_limits={"Personal": [(3600, 50)]})
+        account = system.create_account("Personal")
+        account.funds = 100.0
+        system.save_accounts()
+        dispatcher = TopUpDispatcher(system, StubGateway(reject_numbers={"17000000"}), backoff=0.001)
+        self.dispatchers.append(dispatcher)
+        self.assertEqual(dispatcher.submit(account, "17000000", 40).result(timeout=5), TOPUP_REFUNDED)
+        self.assertEqual(account.funds, 100.0)
+        self.assertEqual(system.limits.remaining(account.account_id, "Personal"), 50)
+        entries = system.ledger.last(account.account_id, 10)
+        self.assertEqual([e.kind for e in entries], [LEDGER_REFUND, LEDGER_TOP_UP])
+        dispatcher.close()
+        system.close()
+        remove_bank_files(path)
+
+    def test_submit_after_close_keeps_funds(self):
+        dispatcher = self.dispatcher(StubGateway())
+        dispatcher.close()
+        with self.assertRaises(RuntimeError):
+            dispatcher.submit(self.account, "17123456", 30)
+        self.assertEqual(self.account.funds, 100.0)
+
+
+class TestBookFormat(unittest.TestCase):
+    """Tests for the binary book format"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for path in glob.glob(os.path.join(self.directory, "*")):
+            os.unlink(path)
+        os.rmdir(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_round_trip_every_compression(self):
+        rows = [
+            ("10000", "1234", "Personal", 150),
+            ("10007", "pbkdf2$x", "Business", -25),
+            ("00042", "9999", "Personal", 0),
+            ("ACC-1", "1111", "Savings", 10**12),
+            ("9", "2222", "Personal", 5),
+        ]
+        for compression in ("none", "zlib", "lzma"):
+            with BookWriter(self.path("book"), compression, block_records=2) as book:
+                for row in rows:
+                    book.write(*row)
+            with BookReader(self.path("book")) as book:
+                self.assertEqual(list(book), rows)
+
+    def test_csv_round_trip(self):
+        with open(self.path("accounts.txt"), "w") as file:
+            file.write("10001,1234,Personal,12.5\nnot a line\n10002,4321,Business,0.07\n")
+        self.assertEqual(csv_to_book(self.path("accounts.txt"), self.path("book")), (2, 1))
+        self.assertEqual(book_to_csv(self.path("book"), self.path("copy.txt")), 2)
+        with open(self.path("copy.txt")) as file:
+            self.assertEqual(file.read(), "10001,1234,Personal,12.5\n10002,4321,Business,0.07\n")
+        system = BankingSystem(self.path("copy.txt"))
+        self.assertEqual(system.accounts["10002"].funds, 0.07)
+        system.close()
+
+    def test_damage_is_detected(self):
+        with BookWriter(self.path("book"), "none") as book:
+            book.write("10001", "1234", "Personal", 100)
+        with open(self.path("book"), "rb") as file:
+            data = file.read()
+        for offset in (30, len(data) - 12, len(data) - 1):   # Block body, end marker, record count
+            with open(self.path("damaged"), "wb") as file:
+                file.write(data[:offset] + b"\xff" + data[offset + 1:])
+            with self.assertRaises(Invalid_Book_Exception):
+                list(BookReader(self.path("damaged")))
+        with open(self.path("plain"), "wb") as file:
+            file.write(b"10001,1234,Personal,1.0\n")
+        with self.assertRaises(Invalid_Book_Exception):
+            BookReader(self.path("plain"))
+
+    def test_diff_books(self):
+        with BookWriter(self.path("old")) as book:
+            for row in [("10001", "1", "Personal", 100), ("10002", "2", "Personal", 200), ("10003", "3", "Business", 300)]:
+                book.write(*row)
+        with BookWriter(self.path("new")) as book:
+            for row in [("10001", "1", "Personal", 100), ("10003", "3", "Business", 250), ("10004", "4", "Personal", 0)]:
+                book.write(*row)
+        self.assertEqual(list(diff_books(self.path("old"), self.path("new"))), [
+            ("removed", ("10002", "2", "Personal", 200)),
+            ("changed", ("10003", "3", "Business", 300), ("10003", "3", "Business", 250)),
+            ("added", ("10004", "4", "Personal", 0)),
+        ])
+        with BookWriter(self.path("unsorted")) as book:
+            book.write("10002", "2", "Personal", 0)
+            book.write("10001", "1", "Personal", 0)
+        with self.assertRaises(Invalid_Book_Exception):
+            list(diff_books(self.path("old"), self.path("unsorted")))
+
+    def test_diff_two_csv_exports(self):
+        system = BankingSystem(self.path("accounts.txt"))
+        accounts = system.create_accounts("Personal", 20)   # IDs come out in no particular order
+        system.save_accounts()
+        self.assertEqual(csv_to_book(self.path("accounts.txt"), self.path("old")), (20, 0))
+        accounts[3].funds = 9.5
+        system.delete_account(accounts[7].account_id)
+        system.save_accounts()
+        system.close()
+        self.assertEqual(csv_to_book(self.path("accounts.txt"), self.path("new")), (19, 0))
+        changes = list(diff_books(self.path("old"), self.path("new")))
+        self.assertEqual(sorted((change[0], change[1][0]) for change in changes),
+                         sorted([("changed", accounts[3].account_id), ("removed", accounts[7].account_id)]))
+
+    def test_large_export_is_merged_from_sorted_runs(self):
+        rng = random.Random(3)
+        expected = {}
+        with open(self.path("accounts.txt"), "w") as file:
+            for _ in range(500):
+                account_id, cents = str(rng.randint(10000, 10400)), rng.randint(0, 10**6)
+                file.write(f"{account_id},1234,Personal,{Money(cents)}\n")
+                expected[account_id] = cents   # A repeated ID keeps its last line
+        self.assertEqual(csv_to_book(self.path("accounts.txt"), self.path("book"), run_records=64),
+                         (len(expected), 0))
+        rows = list(BookReader(self.path("book")))
+        self.assertEqual([(row[0], row[3]) for row in rows], sorted(expected.items()))
+        self.assertEqual(sorted(os.listdir(self.directory)), ["accounts.txt", "book"])   # Runs cleaned up
+
+    def test_failed_write_leaves_no_end_marker(self):
+        with self.assertRaises(RuntimeError):
+            with BookWriter(self.path("book"), "none") as book:
+                book.write("10001", "1234", "Personal", 100)
+                raise RuntimeError("export interrupted")
+        with self.assertRaises(Invalid_Book_Exception):
+            list(BookReader(self.path("book")))
+
+    def test_export_system_accounts(self):
+        system = BankingSystem(self.path("accounts.txt"))
+        accounts = system.create_accounts("Personal", 50)
+        accounts[0].funds = 12.34
+        with BookWriter(self.path("book"), block_records=16) as book:
+            book.write_accounts(system.accounts)
+        rows = list(BookReader(self.path("book")))
+        self.assertEqual([row[0] for row in rows], sorted(system.accounts.keys()))
+        self.assertIn((accounts[0].account_id, accounts[0].passcode, "Personal", 1234), rows)
+        system.close()
+
+
+class TestTimerWheel(unittest.TestCase):
+    """Tests for the hierarchical timer wheel"""
+
+    def test_items_fire_on_time_in_order(self):
+        rng = random.Random(5)
+        wheel = TimerWheel(start_tick=1000, slots=8, levels=3)
+        ticks = [1000 + rng.randint(0, 5000) for _ in range(500)]
+        for n, tick in enumerate(ticks):
+            wheel.add(tick, n)
+        fired = []
+        for now in (1000, 1003, 1100, 1700, 4000, 6000):
+            due = wheel.advance(now)
+            self.assertTrue(all(tick <= now for tick, _ in due))
+            fired.extend(due)
+        self.assertEqual([tick for tick, _ in fired], sorted(ticks))
+        self.assertEqual(len(wheel), 0)
+
+    def test_overdue_items_fire_next(self):
+        wheel = TimerWheel(start_tick=50)
+        wheel.add(10, "late")
+        wheel.add(10 ** 9, "far")
+        self.assertEqual(wheel.advance(50), [(50, "late")])
+        self.assertEqual(wheel.advance(10 ** 9 - 1), [])
+        self.assertEqual(wheel.advance(10 ** 9), [(10 ** 9, "far")])
+
+
+class TestOrderScheduler(unittest.TestCase):
+    """Tests for standing orders"""
+
+    def setUp(self):
+        self.now = 1000000.0
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.system = BankingSystem(self.temp_file.name)
+        self.employer = self.system.create_account("Business")
+        self.staff = self.system.create_accounts("Personal", 3)
+        self.employer.funds = 1000.0
+        self.system.save_accounts()
+        self.scheduler = self.open_scheduler()
+
+    def tearDown(self):
+        self.scheduler.close()
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    def open_scheduler(self):
+        return OrderScheduler(self.system, clock=lambda: self.now)
+
+    def test_one_off_transfer(self):
+        order_id = self.scheduler.schedule(self.employer.account_id, self.staff[0].account_id, 25, self.now + 60)
+        self.assertEqual(self.scheduler.run_due(), [])
+        self.now += 60
+        self.assertEqual(self.scheduler.run_due(), [(order_id, self.now, "ok")])
+        self.assertEqual(self.staff[0].funds, 25)
+        self.assertEqual(self.scheduler.stats()["orders"], 0)
+        self.now += 3600
+        self.assertEqual(self.scheduler.run_due(), [])
+
+    def test_payroll_catches_up_after_restart(self):
+        payroll = [(account.account_id, 100) for account in self.staff]
+        self.scheduler.schedule_many(self.employer.account_id, payroll, self.now + 10, interval=86400, count=5)
+        self.now += 10
+        self.assertEqual(len(self.scheduler.run_due()), 3)
+
+        # Down for two and a half days: both missed paydays run, in time order
+        self.scheduler.close()
+        self.now += 2.5 * 86400
+        self.scheduler = self.open_scheduler()
+        results = self.scheduler.run_due()
+        self.assertEqual(len(results), 6)
+        self.assertEqual([due for _, due, _ in results], sorted(due for _, due, _ in results))
+        self.assertEqual([account.funds for account in self.staff], [300, 300, 300])
+
+        # The money runs out on the fourth payday
+        self.now += 86400
+        self.assertEqual([name for _, _, name in self.scheduler.run_due()], ["ok", "insufficient funds", "insufficient funds"])
+        self.now += 30 * 86400
+        self.assertEqual(len(self.scheduler.run_due()), 3)   # Fifth and last run
+        self.assertEqual(self.scheduler.stats()["orders"], 0)
+
+    def test_cancel_and_validation(self):
+        order_id = self.scheduler.schedule(self.employer.account_id, self.staff[0].account_id, 5, self.now, interval=60)
+        self.assertTrue(self.scheduler.cancel(order_id))
+        self.assertFalse(self.scheduler.cancel(order_id))
+        self.now += 600
+        self.assertEqual(self.scheduler.run_due(), [])
+        self.scheduler.close()
+        self.scheduler = self.open_scheduler()
+        self.assertEqual(self.scheduler.orders, {})
+        with self.assertRaises(ValueError):
+            self.scheduler.schedule(self.employer.account_id, "99999", 5, self.now)
+        with self.assertRaises(ValueError):
+            self.scheduler.schedule(self.employer.account_id, self.employer.account_id, 5, self.now)
+        with self.assertRaises(ValueError):
+            self.scheduler.schedule(self.employer.account_id, self.staff[0].account_id, -5, self.now)
+
+    def test_journal_is_compacted(self):
+        self.scheduler.COMPACT_SLACK = 10
+        for _ in range(30):
+            self.scheduler.cancel(self.scheduler.schedule(self.employer.account_id, self.staff[0].account_id, 1, self.now + 5))
+        self.assertLess(self.scheduler.journal_lines, 30)
+        self.scheduler.close()
+        self.scheduler = self.open_scheduler()
+        self.assertEqual(self.scheduler.orders, {})
+
+    def test_order_that_raises_fails_alone(self):
+        broken = self.staff[1].account_id
+        apply_batch = self.system.apply_batch
+        def fails_for_broken(operations):
+            if any(recipient == broken for _, _, _, recipient in operations):
+                raise RuntimeError("ledger is unavailable")
+            return apply_batch(operations)
+        self.system.apply_batch = fails_for_broken
+        for account in self.staff:
+            self.scheduler.schedule(self.employer.account_id, account.account_id, 10, self.now)
+        errors = io.StringIO()
+        with contextlib.redirect_stderr(errors):
+            results = self.scheduler.run_due()
+        self.assertEqual([name for _, _, name in results], ["ok", "error", "ok"])
+        self.assertEqual([account.funds for account in self.staff], [10, 0, 10])
+        self.assertIn("ledger is unavailable", errors.getvalue())
+        stats = self.scheduler.stats()
+        self.assertEqual((stats["fired"], stats["errors"]), (2, 1))
+        self.assertEqual(self.system.metrics.stats()["standing_order"]["outcomes"], {"ok": 2, "error": 1})
+
+    def test_thread_keeps_running_after_an_error(self):
+        self.scheduler.close()
+        self.scheduler = OrderScheduler(self.system, tick=0.01, clock=lambda: self.now)
+        run_due = self.scheduler.run_due
+        calls = []
+        def fails_once():
+            calls.append(None)
+            if len(calls) == 1:
+                raise OSError("disk full")
+            return run_due()
+        self.scheduler.run_due = fails_once
+        self.scheduler.schedule(self.employer.account_id, self.staff[0].account_id, 25, self.now)
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.scheduler.start()
+            for _ in range(500):
+                if self.staff[0].funds == 25:
+                    break
+                time.sleep(0.01)
+        self.assertEqual(self.staff[0].funds, 25)
+        self.assertEqual(self.scheduler.stats()["errors"], 1)
+
+
+@unittest.skipIf(banking_gui is None, "tkinter is not available")
+class TestBackgroundWorker(unittest.TestCase):
+    """Tests for the GUI's background worker"""
+
+    def setUp(self):
+        self.worker = BackgroundWorker()
+        self.delivered = []
+
+    def tearDown(self):
+        self.worker.shutdown()
+
+    def wait_for(self, count):
+        for _ in range(500):
+            self.worker.poll()
+            if len(self.delivered) >= count:
+                return
+            time.sleep(0.01)
+        self.fail("worker results never arrived")
+
+    def test_results_arrive_in_order_on_polling_thread(self):
+        for n in range(5):
+            self.worker.submit(lambda n=n: n * n, lambda result, error: self.delivered.append(
+                (result, error, threading.current_thread())))
+        self.wait_for(5)
+        self.assertEqual([r for r, _, _ in self.delivered], [0, 1, 4, 9, 16])
+        self.assertTrue(all(t is threading.current_thread() for _, _, t in self.delivered))
+        self.assertEqual(self.worker.pending, 0)
+
+    def test_errors_are_delivered_not_raised(self):
+        def fails():
+            raise ValueError("Account number or password is not recognized")
+        self.worker.submit(fails, lambda result, error: self.delivered.append(error))
+        self.wait_for(1)
+        self.assertIsInstance(self.delivered[0], ValueError)
+
+    def test_gui_reuses_one_window(self):
+        try:
+            banking_gui.tk.Tk().destroy()
+        except banking_gui.tk.TclError:
+            self.skipTest("no display available")
+        temp_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_file.close()
+        system = BankingSystem(temp_file.name)
+        account, passcode = system.open_account("Personal")
+        gui = BankingGUI(system)
+        try:
+            window = gui.window
+            for _ in range(2):
+                gui.id_entry.insert(0, account.account_id)
+                gui.pass_entry.insert(0, passcode)
+                gui.login()
+                for _ in range(500):
+                    gui.window.update()
+                    if gui.account_id is not None:
+                        break
+                    time.sleep(0.01)
+                self.assertEqual(gui.account_id, account.account_id)
+                gui.handle_action("logout")
+                gui.id_entry.delete(0, "end")
+            self.assertIs(gui.window, window)
+        finally:
+            gui.close()
+            system.close()
+            remove_bank_files(temp_file.name)
+
+
+class TestBankingServer(unittest.IsolatedAsyncioTestCase):
+    """Tests for the asyncio network front-end"""
+
+    async def asyncSetUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.system = BankingSystem(self.temp_file.name)
+        self.account1 = self.system.create_account("Personal")
+        self.account2 = self.system.create_account("Business")
+        self.server = BankingServer(self.system, port=0)
+        self.host, self.port = await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    async def connect(self, account):
+        client = await BankingClient().connect(self.host, self.port)
+        await client.login(account.account_id, account.passcode)
+        return client
+
+    async def test_pipelined_requests(self):
+        async with await self.connect(self.account1) as client:
+            results = await asyncio.gather(*[client.deposit(1.0) for _ in range(200)])
+            self.assertEqual(set(results), {"Deposit completed."})
+            self.assertEqual(await client.balance(), "Your balance is 200.0")
+            self.assertEqual(await client.transfer(50.0, self.account2.account_id), "Transfer completed.")
+        self.assertEqual(self.account2.funds, 50.0)
+
+    async def test_many_connections(self):
+        clients = await asyncio.gather(*[self.connect(self.account1) for _ in range(50)])
+        await asyncio.gather(*[c.deposit(2.0) for c in clients])
+        await asyncio.gather(*[c.close() for c in clients])
+        self.assertEqual(self.account1.funds, 100.0)
+
+    async def test_session_token_works_across_connections(self):
+        first = await self.connect(self.account1)
+        async with await BankingClient().connect(self.host, self.port) as second:
+            self.assertEqual(await second.request("deposit", amount=3.0, token=first.token), "Deposit completed.")
+        await first.close()
+        self.assertEqual(self.account1.funds, 3.0)
+
+    async def test_wire_amounts_are_exact(self):
+        session = {"account_id": self.account1.account_id}
+        line = '{"id": 1, "op": "deposit", "amount": 12345678901234567.89}'
+        reply = await self.server.handle_request(session, line)
+        self.assertTrue(reply["ok"], reply)
+        self.assertEqual(self.account1.cents, 1234567890123456789)
+        reply = await self.server.handle_request(session, '{"id": 2, "op": "withdraw", "amount": "0.3"}')
+        self.assertEqual(self.account1.cents, 1234567890123456759)
+
+    async def test_account_deleted_elsewhere_is_not_used(self):
+        async with await self.connect(self.account1) as client:
+            self.system.delete_account(self.account1.account_id)
+            with self.assertRaises(ValueError):
+                await client.deposit(5.0)
+        self.assertNotIn(self.account1.account_id, self.system.accounts)
+
+    async def test_login_does_not_block_the_loop(self):
+        open_session = self.system.open_session
+        def slow_open_session(account_id, passcode):
+            time.sleep(0.3)   # Stands in for a slow passcode hash
+            return open_session(account_id, passcode)
+        self.system.open_session = slow_open_session
+
+        gaps = []
+        async def tick():
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.01)
+                gaps.append(time.perf_counter() - last)
+                last = time.perf_counter()
+        ticker = asyncio.ensure_future(tick())
+        client = await self.connect(self.account1)
+        ticker.cancel()
+        await client.close()
+        self.assertLess(max(gaps), 0.2)
+
+    async def test_errors_are_raised_on_client(self):
+        async with await BankingClient().connect(self.host, self.port) as client:
+            with self.assertRaises(ValueError):
+                await client.balance()
+            with self.assertRaises(ValueError):
+                await client.login(self.account1.account_id, "wrong")
+            await client.login(self.account1.account_id, self.account1.passcode)
+            with self.assertRaises(Invalid_Transfer_Exception):
+                await client.transfer(1.0, "00000")
+            self.assertEqual(await client.top_up_mobile("1234", 5.0), "Invalid phone number or insufficient balance.")
+            self.assertEqual(await client.delete_account(), "Account successfully deleted.")
+        self.assertNotIn(self.account1.account_id, self.system.accounts)
+
+
+class TestAccountTable(unittest.TestCase):
+    """Tests for the columnar account table"""
+
+    def test_insert_lookup_delete_and_growth(self):
+        table = AccountTable(capacity=8)
+        for n in range(1000):
+            table.add(str(10000 + n), "1111", "Personal" if n % 2 else "Business", n)
+        self.assertEqual(len(table), 1000)
+        self.assertEqual(table["10500"].funds, 5.0)
+        for n in range(0, 1000, 3):
+            del table[str(10000 + n)]
+        self.assertNotIn("10000", table)
+        self.assertIn("10001", table)
+        self.assertEqual(len(table.keys()), len(table))
+        table.add("10000", "2222", "Personal", 7)
+        self.assertEqual(table["10000"].passcode, "2222")
+
+    def test_lookups_while_growing(self):
+        table = AccountTable(capacity=8)
+        table.add("10000", "1111", "Personal", 0)
+        errors = []
+
+        # An account that exists must be found while the index is rebuilt under it
+        def lookup():
+            try:
+                while len(table) < 50000:
+                    if "10000" not in table:
+                        errors.append("10000 went missing")
+                        return
+            except Exception as e:
+                errors.append(e)
+
+        reader = threading.Thread(target=lookup)
+        reader.start()
+        for n in range(1, 50000):
+            table.add(str(10000 + n), "1111", "Personal", n)
+        reader.join()
+        self.assertEqual(errors, [])
+
+    def test_views_behave_like_accounts(self):
+        table = AccountTable()
+        table.add("12345", "1111", "Personal", 10000)
+        table.add("54321", "2222", "Business", 0)
+        view = table["12345"]
+        self.assertIsInstance(view, BankAccount)
+        self.assertEqual(view.transfer(40.0, table["54321"]), "Transfer completed.")
+        self.assertEqual(table["54321"].funds, 40.0)
+        self.assertEqual(view.transfer(1.0, table["12345"]), "Cannot transfer to the same account.")
+        self.assertEqual(table.total_cents(), 10000)
+        self.assertEqual(table.category_totals()["Business"], [4000, 1])
+
+    def test_odd_ids_are_refused(self):
+        table = AccountTable()
+        with self.assertRaises(ValueError):
+            table.add("00123", "1111", "Personal", 0)
+        self.assertNotIn("bad", table)
+
+    def test_system_round_trip(self):
+        temp_file = tempfile.NamedTemporaryFile(delete=False)
+        temp_file.close()
+        try:
+            system = BankingSystem(temp_file.name, table="columnar")
+            accounts = system.create_accounts("Business", 50)
+            system.process_User_Input(accounts[0], "2", amount=12.5)
+            system.save_accounts()
+            system.process_User_Input(accounts[0], "4", amount=2.5, recipient_id=accounts[1].account_id)
+            system.close()
+            restarted = BankingSystem(temp_file.name, table="columnar")
+            self.assertEqual(len(restarted.accounts), 50)
+            self.assertEqual(restarted.accounts[accounts[1].account_id].funds, 2.5)
+            self.assertEqual(restarted.total_funds(), 12.5)
+            restarted.close()
+        finally:
+            remove_bank_files(temp_file.name)
+
+
+class TestTransactionLedger(unittest.TestCase):
+    """Tests for the per-account transaction ledger"""
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.system = BankingSystem(self.temp_file.name, ledger=True)
+        self.account1, self.account2 = self.system.create_accounts("Personal", 2)
+
+    def tearDown(self):
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    def test_operations_are_posted(self):
+        self.system.process_User_Input(self.account1, "2", amount=100.0)
+        self.system.process_User_Input(self.account1, "3", amount=500.0)   # Fails, not posted
+        self.system.process_User_Input(self.account1, "4", amount=30.0, recipient_id=self.account2.account_id)
+        self.system.process_User_Input(self.account1, "5", amount=5.0, number="12345678")
+
+        entries = self.system.ledger.last(self.account1.account_id, 10)
+        self.assertEqual([e.kind for e in entries], [LEDGER_TOP_UP, LEDGER_TRANSFER_OUT, LEDGER_DEPOSIT])
+        self.assertEqual(entries[0].counterparty, "12345678")
+        self.assertEqual(entries[0].balance, 65.0)
+        incoming = self.system.ledger.last(self.account2.account_id, 10)
+        self.assertEqual(incoming[0].kind, LEDGER_TRANSFER_IN)
+        self.assertEqual(incoming[0].counterparty, self.account1.account_id)
+        self.assertEqual(incoming[0].amount, 30.0)
+
+    def test_statement_by_date_range(self):
+        ledger = TransactionLedger(self.temp_file.name + ".history")
+        for day in range(10):
+            ledger.record("11111", LEDGER_DEPOSIT, 100, 100 * (day + 1), timestamp=day * 86400.0)
+            ledger.record("22222", LEDGER_DEPOSIT, 5, 5 * (day + 1), timestamp=day * 86400.0 + 1)
+        ledger.close()
+
+        ledger = TransactionLedger(ledger.path)   # Indexes are rebuilt from the file
+        statement = ledger.statement("11111", 2 * 86400.0, 5 * 86400.0)
+        self.assertEqual([e.balance for e in statement], [3.0, 4.0, 5.0])
+        self.assertEqual(len(ledger.between(0, 86400.0)), 2)
+        self.assertEqual([e.balance for e in ledger.last("22222", 2)], [0.5, 0.45])
+        self.assertEqual(ledger.statement("99999", 0, 1e12), [])
+        ledger.close()
+
+    def test_batch_rows_are_posted(self):
+        self.system.apply_batch([
+            ("deposit", self.account1.account_id, 20.0),
+            ("withdraw", self.account2.account_id, 20.0),   # Fails
+            ("transfer", self.account1.account_id, 5.0, self.account2.account_id),
+        ])
+        self.assertEqual(len(self.system.ledger), 3)
+        self.assertEqual(self.system.ledger.last(self.account2.account_id, 1)[0].balance, 5.0)
+
+    def test_nothing_is_posted_until_the_journal_commits(self):
+        def crashes(*args, **kwargs):
+            raise OSError("disk full")
+        self.system.record_changes = crashes
+        with self.assertRaises(OSError):
+            self.system.process_User_Input(self.account1, "2", amount=100.0)
+        with self.assertRaises(OSError):
+            self.system.apply_batch([("deposit", self.account1.account_id, 20.0)])
+        self.assertEqual(len(self.system.ledger), 0)
+
+
+class TestCheckpoints(unittest.TestCase):
+    """Tests for binary snapshots and journal compaction"""
+
+    system_options = {}
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.system = BankingSystem(self.temp_file.name, **self.system_options)
+        self.accounts = self.system.create_accounts("Personal", 20)
+        for account in self.accounts:
+            self.system.process_User_Input(account, "2", amount=10.0)
+
+    def tearDown(self):
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    def restart(self):
+        self.system.close()
+        self.system = BankingSystem(self.temp_file.name, **self.system_options)
+        return self.system
+
+    def test_restart_uses_snapshot_and_recent_journal(self):
+        self.assertTrue(self.system.checkpoint())
+        self.system.wait_for_checkpoint()
+        self.assertTrue(os.path.exists(self.temp_file.name + ".snap"))
+        self.assertFalse(os.path.exists(self.temp_file.name + ".journal.old"))
+        self.system.process_User_Input(self.accounts[0], "4", amount=4.0, recipient_id=self.accounts[1].account_id)
+
+        system = self.restart()
+        self.assertEqual(system.journal.records, 1)
+        self.assertEqual(len(system.accounts), 20)
+        self.assertEqual(system.accounts[self.accounts[0].account_id].funds, 6.0)
+        self.assertEqual(system.accounts[self.accounts[1].account_id].funds, 14.0)
+
+    def test_unfinished_checkpoint_loses_nothing(self):
+        self.system.checkpoint(background=False)
+        self.system.process_User_Input(self.accounts[2], "3", amount=1.0)
+        # Pretend a second checkpoint moved the journal aside and then crashed
+        self.system.journal.rotate(self.temp_file.name + ".journal.old")
+        self.system.process_User_Input(self.accounts[3], "3", amount=2.0)
+
+        system = self.restart()
+        self.assertEqual(system.accounts[self.accounts[2].account_id].funds, 9.0)
+        self.assertEqual(system.accounts[self.accounts[3].account_id].funds, 8.0)
+        system.checkpoint(background=False)
+        self.assertFalse(os.path.exists(self.temp_file.name + ".journal.old"))
+        self.assertEqual(self.restart().accounts[self.accounts[3].account_id].funds, 8.0)
+
+    def test_writers_continue_during_checkpoint(self):
+        self.system.checkpoint()
+        self.system.process_User_Input(self.accounts[4], "2", amount=1.0)
+        self.system.wait_for_checkpoint()
+        self.assertEqual(self.restart().accounts[self.accounts[4].account_id].funds, 11.0)
+
+    def test_save_accounts_replaces_snapshot(self):
+        self.system.checkpoint(background=False)
+        self.system.save_accounts()
+        self.assertFalse(os.path.exists(self.temp_file.name + ".snap"))
+        self.assertEqual(self.restart().total_funds(), 200.0)
+
+    def test_save_waits_for_running_checkpoint(self):
+        self.system.checkpoint()
+        self.system.process_User_Input(self.accounts[5], "2", amount=5.0)
+        self.system.save_accounts()
+        self.assertEqual(self.restart().accounts[self.accounts[5].account_id].funds, 15.0)
+
+    def test_concurrent_checkpoints_never_overlap(self):
+        errors = []
+        hook = threading.excepthook
+        threading.excepthook = lambda args: errors.append(args.exc_value)
+        def worker(account):
+            for _ in range(20):
+                self.system.process_User_Input(account, "2", amount=1.0)
+                self.system.checkpoint()
+        try:
+            threads = [threading.Thread(target=worker, args=(account,)) for account in self.accounts[:8]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.system.wait_for_checkpoint()
+        finally:
+            threading.excepthook = hook
+        self.assertEqual(errors, [])
+        self.assertEqual(glob.glob(glob.escape(self.temp_file.name) + "*.tmp"), [])
+        self.assertEqual(self.restart().total_funds(), 360.0)
+
+    def test_damaged_snapshot_is_not_skipped(self):
+        self.system.checkpoint(background=False)
+        self.system.close()
+        with open(self.temp_file.name + ".snap", "r+b") as file:
+            file.seek(20)
+            byte = file.read(1)
+            file.seek(20)
+            file.write(bytes([byte[0] ^ 0xFF]))
+        with self.assertRaises(ValueError):
+            BankingSystem(self.temp_file.name, **self.system_options)
+
+
+class TestCheckpointsColumnar(TestCheckpoints):
+    """Checkpoint tests on the columnar account table"""
+    system_options = {"table": "columnar"}
+
+
+class TestMetrics(unittest.TestCase):
+    """Tests for operation counters, histograms and profiling"""
+
+    def setUp(self):
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False)
+        self.temp_file.close()
+        self.system = BankingSystem(self.temp_file.name)
+        self.account1, self.account2 = self.system.create_accounts("Personal", 2)
+
+    def tearDown(self):
+        self.system.close()
+        remove_bank_files(self.temp_file.name)
+
+    def test_outcomes_and_phases(self):
+        self.system.process_User_Input(self.account1, "2", amount=10.0)
+        self.system.process_User_Input(self.account1, "3", amount=50.0)
+        with self.assertRaises(Invalid_Menu_Choice_Exception):
+            self.system.process_User_Input(self.account1, "9")
+        stats = self.system.metrics.stats()
+        self.assertEqual(stats["deposit"]["outcomes"], {"ok": 1})
+        self.assertEqual(stats["deposit"]["phases"]["persist"]["count"], 1)
+        self.assertEqual(stats["withdraw"]["outcomes"], {"rejected": 1})
+        self.assertNotIn("persist", stats["withdraw"]["phases"])
+        self.assertEqual(stats["invalid"]["outcomes"], {"error": 1})
+        self.assertEqual(stats["create"]["outcomes"], {"ok": 1})
+
+    def test_prometheus_dump(self):
+        self.system.process_User_Input(self.account1, "2", amount=10.0)
+        path = self.temp_file.name + ".prom"
+        self.system.metrics.dump_prometheus(path)
+        with open(path) as f:
+            text = f.read()
+        self.assertIn('bank_operations_total{operation="deposit",outcome="ok"} 1', text)
+        self.assertIn('bank_operation_seconds_bucket{operation="deposit",phase="compute",le="+Inf"} 1', text)
+        self.assertIn('bank_operation_seconds_count{operation="deposit",phase="persist"} 1', text)
+
+    def test_profiling_switches_at_runtime(self):
+        self.system.enable_profiling()
+        self.system.process_User_Input(self.account1, "2", amount=10.0)
+        report = self.system.disable_profiling()
+        self.assertIn("deposit", report)
+        self.system.process_User_Input(self.account1, "2", amount=10.0)
+        self.assertEqual(self.system.disable_profiling(), "")
+
+    def test_can_be_switched_off(self):
+        system = BankingSystem(self.temp_file.name, metrics=False)
+        account = system.accounts[self.account1.account_id]
+        self.assertEqual(system.process_User_Input(account, "2", amount=1.0), "Deposit completed.")
+        self.assertIsNone(system.metrics)
+        system.close()
+
+
 if __name__ == "__main__":
     unittest.main(verbosity=2)
\ No newline at end of file
@@ -1,8 +1,31 @@
 
-import random
-import tkinter as tk
-import tkinter.simpledialog as simpledialog
-from tkinter import messagebox
+import base64
+import bisect
+import cProfile
+import csv
+import hashlib
+import hmac
+import io
+import itertools
+import math
+import mmap
+import os
+import secrets
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+
+# The GUI lives in banking_gui and is only imported when it is used (see
+# __getattr__ at the end), so the core loads quickly and works without Tk
+GUI_NAMES = ("BankingGUI", "BackgroundWorker")
 
 
 
@@ -13,6 +36,20 @@ class Invalid_Menu_Choice_Exception(Exception):
     pass
 
 
+""" This error appears when every account number of the configured width is taken. """
+
+class Account_Id_Exhausted_Exception(Exception):
+    "Raised when the account ID allocator has no IDs left."
+    pass
+
+
+""" This error appears when the journal couldn't write an earlier record, so nothing more can be saved. """
+
+class Journal_Failed_Exception(OSError):
+    "Raised for journal writes after a failed one, until the book is saved in full."
+    pass
+
+
 """ This error appears when a money transfercan't be completed. """
 
 class Invalid_Transfer_Exception(Exception):
@@ -21,8 +58,397 @@ class Invalid_Transfer_Exception(Exception):
 
 
 
+""" Class made to represent an amount of money exactly, in whole cents. """
+class Money:
+    """
+    Exact money amount stored as an integer number of cents.
+
+    Floats, ints, strings and other Money values can all be mixed in
+    with it. Floats and strings are rounded to the nearest cent (ties to
+    even) and ints count whole units, so Money(1050) + "0.50" == 11.
+    Comparisons only take numbers: Money(1050) != "10.50".
+    str() gives the same text a float would ("200.0", "100.25"), so
+    messages and saved files look the same as before but read back exactly.
+    """
+
+    __slots__ = ("cents",)
+
+    def __init__(self, cents=0):
+        """
+        Args:
+            cents: Amount in cents (an int)
+        """
+        self.cents = cents
+
+    @staticmethod
+    def to_cents(value):
+        """
+        Convert any supported amount to whole cents.
+
+        Raises:
+            TypeError: For values that aren't amounts of money
+            ValueError: For strings that aren't numbers
+        """
+        if isinstance(value, Money):
+            return value.cents
+        if isinstance(value, int):
+            return value * 100
+        if isinstance(value, float):
+            return Money.parse(repr(value))
+        if isinstance(value, str):
+            return Money.parse(value)
+        if isinstance(value, Decimal):
+            return int((value * 100).to_integral_value(ROUND_HALF_EVEN))
+        raise TypeError(f"Can't use {type(value).__name__} as an amount of money")
+
+    @staticmethod
+    def parse(text):
+        """
+        Parse a decimal string such as '12.5' into cents.
+
+        Plain 'units.cents' text is handled directly; anything else
+        (exponents, extra decimals) goes through Decimal.
+        """
+        text = text.strip()
+        whole, _, fraction = text.partition(".")
+        digits = whole[1:] if whole[:1] in "+-" else whole
+        if digits.isdigit() and len(fraction) <= 2 and (not fraction or fraction.isdigit()):
+            cents = int(digits) * 100 + int(fraction.ljust(2, "0"))
+            return -cents if whole[:1] == "-" else cents
+        try:
+            return int((Decimal(text) * 100).to_integral_value(ROUND_HALF_EVEN))
+        except (InvalidOperation, OverflowError):
+            raise ValueError(f"Not an amount of money: {text!r}") from None
+
+    def __str__(self):
+        sign = "-" if self.cents < 0 else ""
+        whole, fraction = divmod(abs(self.cents), 100)
+        if fraction % 10 == 0:
+            return f"{sign}{whole}.{fraction // 10}"
+        return f"{sign}{whole}.{fraction:02d}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __format__(self, spec):
+        return format(float(self), spec) if spec else str(self)
+
+    def __float__(self):
+        return self.cents / 100
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __hash__(self):
+        # Equal to the float with the same value, so it must hash the same
+        return hash(self.cents / 100)
+
+    @staticmethod
+    def compared_cents(other):
+        # Cents of a value Money can be compared with, or None. Only numbers count:
+        # a string equal to Money would hide a unit mistake in a dict or a check
+        if isinstance(other, Money):
+            return other.cents
+        if isinstance(other, bool) or not isinstance(other, (int, float, Decimal)):
+            return None
+        try:
+            return Money.to_cents(other)
+        except ValueError:
+            return None   # NaN and infinity
+
+    def __eq__(self, other):
+        cents = Money.compared_cents(other)
+        return NotImplemented if cents is None else self.cents == cents
+
+    def __lt__(self, other):
+        cents = Money.compared_cents(other)
+        return NotImplemented if cents is None else self.cents < cents
+
+    def __le__(self, other):
+        cents = Money.compared_cents(other)
+        return NotImplemented if cents is None else self.cents <= cents
+
+    def __gt__(self, other):
+        cents = Money.compared_cents(other)
+        return NotImplemented if cents is None else self.cents > cents
+
+    def __ge__(self, other):
+        cents = Money.compared_cents(other)
+        return NotImplemented if cents is None else self.cents >= cents
+
+    def __add__(self, other):
+        return Money(self.cents + Money.to_cents(other))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Money(self.cents - Money.to_cents(other))
+
+    def __rsub__(self, other):
+        return Money(Money.to_cents(other) - self.cents)
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+
+
+# Passcodes are stored as slow salted hashes in this format
+PASSCODE_HASH_PREFIX = "pbkdf2_sha256$"
+PASSCODE_ITERATIONS = 200000
+
+
+def hash_passcode(passcode, iterations=PASSCODE_ITERATIONS, salt=None):
+    """
+    Hash a passcode with PBKDF2-SHA256 and a random salt.
+
+    Args:
+        passcode: Plain passcode
+        iterations: PBKDF2 rounds; more is slower to check and to guess
+        salt: Salt bytes (default: 16 random bytes)
+
+    Returns:
+        str: 'pbkdf2_sha256$<iterations>$<salt>$<hash>' (base64 parts)
+    """
+    salt = os.urandom(16) if salt is None else salt
+    digest = hashlib.pbkdf2_hmac("sha256", str(passcode).encode(), salt, iterations)
+    return (f"{PASSCODE_HASH_PREFIX}{iterations}$"
+            f"{base64.urlsafe_b64encode(salt).decode().rstrip('=')}$"
+            f"{base64.urlsafe_b64encode(digest).decode().rstrip('=')}")
+
+
+def is_hashed_passcode(stored):
+    """True if a stored passcode is already a hash."""
+    return str(stored).startswith(PASSCODE_HASH_PREFIX)
+
+
+def verify_passcode(stored, candidate):
+    """
+    Check a passcode against what is stored for an account.
+
+    Works for both hashed and (not yet migrated) plain passcodes, and
+    compares in constant time either way.
+    """
+    stored = str(stored)
+    if not is_hashed_passcode(stored):
+        return hmac.compare_digest(stored.encode(), str(candidate).encode())
+    try:
+        iterations, salt, digest = stored[len(PASSCODE_HASH_PREFIX):].split("$")
+        salt = base64.urlsafe_b64decode(salt + "=" * (-len(salt) % 4))
+        digest = base64.urlsafe_b64decode(digest + "=" * (-len(digest) % 4))
+    except ValueError:
+        return False
+    candidate_digest = hashlib.pbkdf2_hmac("sha256", str(candidate).encode(), salt, int(iterations))
+    return hmac.compare_digest(candidate_digest, digest)
+
+
+# Remembers who has already logged in so slow passcode checks happen once
+class SessionManager:
+    """
+    Bounded cache of verified sessions.
+
+    After one slow passcode check the caller gets an opaque random token.
+    Later requests present the token, which is a dictionary lookup. Each
+    use pushes the session's expiry ttl seconds into the future. When
+    more than max_sessions are open, the least recently used one is
+    dropped.
+    """
+
+    def __init__(self, ttl=900, max_sessions=100000):
+        """
+        Args:
+            ttl: Seconds a session stays valid after its last use (default 900)
+            max_sessions: Most sessions kept at once (default 100000)
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()   # token -> [account_id, expires at], oldest use first
+        self.lock = threading.Lock()
+
+    def issue(self, account_id):
+        """
+        Open a session for an account that has just been verified.
+
+        Returns:
+            str: New session token
+        """
+        token = secrets.token_urlsafe(24)
+        with self.lock:
+            self.sessions[token] = [account_id, time.monotonic() + self.ttl]
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        return token
+
+    def lookup(self, token):
+        """
+        Account ID behind a token, or None if it is unknown or expired.
+        """
+        now = time.monotonic()
+        with self.lock:
+            session = self.sessions.get(token)
+            if session is None:
+                return None
+            if session[1] < now:
+                del self.sessions[token]
+                return None
+            session[1] = now + self.ttl
+            self.sessions.move_to_end(token)
+
+            # Expired sessions are cleared from the old end a few at a time
+            for _ in range(2):
+                oldest = next(iter(self.sessions.values()))
+                if oldest[1] >= now:
+                    break
+                self.sessions.popitem(last=False)
+            return session[0]
+
+    def revoke(self, token):
+        """End one session."""
+        with self.lock:
+            self.sessions.pop(token, None)
+
+    def revoke_account(self, account_id):
+        """End every session of an account, e.g. when it is deleted."""
+        with self.lock:
+            for token in [t for t, session in self.sessions.items() if session[0] == account_id]:
+                del self.sessions[token]
+
+    def __len__(self):
+        return len(self.sessions)
+
+
+# Most money that may leave an account per category, as (window in seconds, amount) pairs
+VELOCITY_LIMITS = {
+    "Personal": [(3600, 2000), (86400, 5000)],
+    "Business": [(3600, 50000), (86400, 200000)],
+}
+
+
+# Caps how fast money can leave an account
+class VelocityLimits:
+    """
+    Sliding-window spending limits per account category.
+
+    Each limit splits its window into a fixed number of buckets. An
+    account keeps a running total and those bucket amounts for every
+    limit, so checking or recording a payment costs the same however
+    busy the account has been; the window slides one bucket at a time
+    (a one-hour limit with 12 buckets moves in five-minute steps).
+    Accounts left idle for longer than the longest window are dropped
+    from the old end a few at a time, so only recently active accounts
+    take up memory.
+    """
+
+    def __init__(self, limits=VELOCITY_LIMITS, buckets=12, clock=time.monotonic):
+        """
+        Args:
+            limits: Category -> list of (window in seconds, most money out
+                in that window); categories not listed are unlimited
+            buckets: Buckets each window is split into (default 12)
+            clock: Function returning the time in seconds
+        """
+        self.rules = {category: [(window / buckets, Money.to_cents(maximum)) for window, maximum in rules]
+                      for category, rules in limits.items()}
+        self.buckets = buckets
+        self.clock = clock
+        self.horizon = max((window for rules in limits.values() for window, _ in rules), default=0)
+        self.counters = OrderedDict()   # account_id -> [last used, [tick, total, *buckets] per limit], oldest use first
+        self.lock = threading.Lock()
+
+    def counters_for(self, account_id, rules, now):
+        # The account's counters with expired buckets emptied; the caller holds the lock
+        state = self.counters.get(account_id)
+        if state is None:
+            state = [now] + [[int(now // width), 0] + [0] * self.buckets for width, _ in rules]
+            self.counters[account_id] = state
+        else:
+            state[0] = now
+            self.counters.move_to_end(account_id)
+            for (width, _), counter in zip(rules, state[1:]):
+                tick = int(now // width)
+                if tick - counter[0] >= self.buckets:
+                    counter[1:] = [0] * (self.buckets + 1)
+                else:
+                    for passed in range(counter[0] + 1, tick + 1):
+                        slot = 2 + passed % self.buckets
+                        counter[1] -= counter[slot]
+                        counter[slot] = 0
+                counter[0] = max(counter[0], tick)
+
+        # Idle accounts are cleared from the old end a few at a time
+        for _ in range(2):
+            oldest_id, oldest = next(iter(self.counters.items()))
+            if oldest[0] >= now - self.horizon:
+                break
+            del self.counters[oldest_id]
+        return state
+
+    def allows(self, account_id, account_category, cents):
+        """Whether sending cents now keeps the account within every limit of its category."""
+        rules = self.rules.get(account_category)
+        if not rules:
+            return True
+        with self.lock:
+            state = self.counters_for(account_id, rules, self.clock())
+            return all(counter[1] + cents <= maximum for (_, maximum), counter in zip(rules, state[1:]))
+
+    def record(self, account_id, account_category, cents):
+        """Count money that has left the account against its limits."""
+        rules = self.rules.get(account_category)
+        if not rules:
+            return
+        with self.lock:
+            state = self.counters_for(account_id, rules, self.clock())
+            for counter in state[1:]:
+                counter[1] += cents
+                counter[2 + counter[0] % self.buckets] += cents
+
+    def release(self, account_id, account_category, cents):
+        """Give back headroom for money that was recorded but has come back, e.g. a refunded top-up."""
+        rules = self.rules.get(account_category)
+        if not rules:
+            return
+        with self.lock:
+            state = self.counters_for(account_id, rules, self.clock())
+            for counter in state[1:]:
+                # Newest buckets first, since that is where the payment most likely landed
+                left = min(cents, counter[1])
+                counter[1] -= left
+                for back in range(self.buckets):
+                    if not left:
+                        break
+                    slot = 2 + (counter[0] - back) % self.buckets
+                    taken = min(left, counter[slot])
+                    counter[slot] -= taken
+                    left -= taken
+
+    def remaining(self, account_id, account_category):
+        """
+        Most the account can still send right now.
+
+        Returns:
+            Money: Amount left under the tightest limit, or None if unlimited
+        """
+        rules = self.rules.get(account_category)
+        if not rules:
+            return None
+        with self.lock:
+            state = self.counters_for(account_id, rules, self.clock())
+            return Money(min(maximum - counter[1] for (_, maximum), counter in zip(rules, state[1:])))
+
+    def __len__(self):
+        return len(self.counters)
+
+
+# Compact codes for the two account categories, used by the binary formats
+CATEGORY_CODES = {"Personal": 1, "Business": 2}
+CATEGORY_NAMES = {1: "Personal", 2: "Business"}
+
+
 """ Class made to represent a general bank account. """
 class BankAccount:
+
+    # Fixed attributes instead of a per-object __dict__ keeps accounts small
+    __slots__ = ("account_id", "passcode", "account_category", "cents")
     
     def __init__(self, account_id, passcode, account_category, funds=0):
 
@@ -37,7 +463,31 @@ class BankAccount:
         self.account_id = account_id
         self.passcode = passcode
         self.account_category = account_category
-        self.funds = funds
+        self.cents = Money.to_cents(funds)   # Balance is kept in whole cents
+
+
+    # Checks a passcode against the stored (possibly hashed) one
+    def check_passcode(self, passcode):
+        """
+        Verify a passcode for this account.
+
+        Args:
+            passcode: Passcode to check
+
+        Returns:
+            bool: True if it matches
+        """
+        return verify_passcode(self.passcode, passcode)
+
+
+    # The balance as a Money value; setting it accepts any amount
+    @property
+    def funds(self):
+        return Money(self.cents)
+
+    @funds.setter
+    def funds(self, value):
+        self.cents = Money.to_cents(value)
 
 
     # Adds money to the account if the amount is valid
@@ -51,8 +501,9 @@ class BankAccount:
         """
 
         # Allowe only positive deposits
-        if amount > 0:
-            self.funds += amount 
+        cents = Money.to_cents(amount)
+        if cents > 0:
+            self.cents += cents
             return "Deposit completed."             
         return "Invalid amount for deposit."        # Returns Invalid amount error, funds must be greater than zero
 
@@ -70,8 +521,9 @@ class BankAccount:
             Transaction status message
         """
 
-        if 0 < amount <= self.funds:
-            self.funds -= amount
+        cents = Money.to_cents(amount)
+        if 0 < cents <= self.cents:
+            self.cents -= cents
             return "Withdrawal completed."
         return "Insufficiency of funds or invalid withdrawal sum."   # Returns insufficiency of funds because there is not enough money ofr withdrawl
 
@@ -90,6 +542,10 @@ class BankAccount:
             Transaction status message
         """
 
+        # Money can't be sent to the account it comes from
+        if recipient_account.account_id == self.account_id:
+            return "Cannot transfer to the same account."
+
         # First attempt withdrawal from this account
         withdrawal_message = self.withdraw(amount)
         if withdrawal_message == "Withdrawal completed.":
@@ -111,14 +567,16 @@ class BankAccount:
         Returns:
             Transaction status message
         """
-        if len(number) == 8 and number.isdigit() and amount > 0 and amount <= self.funds:
-            self.funds -= amount
+        cents = Money.to_cents(amount)
+        if len(number) == 8 and number.isdigit() and 0 < cents <= self.cents:
+            self.cents -= cents
             return f"Mobile number {number} topped up with {amount}."
         return "Invalid phone number or insufficient balance."
 
 
 # Class made for Personal Account
 class PersonalAccount(BankAccount):
+    __slots__ = ()
 
     # A regular account made  for individual people.
     def __init__(self, account_id, passcode, funds=0):
@@ -137,6 +595,7 @@ class PersonalAccount(BankAccount):
 # Class made for Business Account
 
 class BusinessAccount(BankAccount):
+    __slots__ = ()
     # A bank account for businesses and companies
     def __init__(self, account_id, passcode, funds=0):
         """
@@ -150,377 +609,3372 @@ class BusinessAccount(BankAccount):
         super().__init__(account_id, passcode, "Business", funds)
 
 
-# Class made to handle all the banks 
-class BankingSystem:
+# Account table that keeps each field in its own typed column
+class AccountTable:
+    """
+    Columnar account table for very large books.
 
-    def __init__(self, filename = "accounts.txt"):
+    Instead of one Python object per account, every field lives in a
+    parallel column: IDs and balances in cents as 64-bit integer arrays,
+    category codes as bytes, and passcodes as a list of interned strings.
+    Plain 4-digit codes are shared between accounts; a hashed book has
+    one unique hash string per account, which is most of its size.
+    IDs are found through an open-addressing hash index that is itself a
+    flat integer array. An account costs tens of bytes rather than
+    hundreds, and whole-book sums run over a single array.
+
+    The table behaves like the dict it replaces: table[account_id] gives
+    an AccountView that has the normal BankAccount methods and reads and
+    writes the columns directly. Deleted accounts leave a dead row
+    behind; the rows are dropped the next time the book is loaded.
+
+    Account IDs must be plain decimal numbers, which is what the ID
+    allocator hands out.
+
+    Lookups take no lock. Changes to the table are serialised by its own
+    lock, and a grown index is filled in before it replaces the old one
+    in a single assignment, so a reader always probes a complete index.
+    """
+
+    EMPTY = 0
+    DELETED = -1
+
+    def __init__(self, capacity=1024):
         """
-        Initialize banking system.
-        
         Args:
-            filename: Account data storage file (default 'accounts.txt')
+            capacity: Initial number of index slots (rounded up to a power of two)
         """
+        self.ids = array("q")
+        self.cents = array("q")
+        self.categories = array("b")    # 0 marks a deleted row
+        self.passcodes = []
+        self.live = 0
+        self.index = array("q", bytes(8 << max(3, (capacity - 1).bit_length())))   # row + 1, 0 empty, -1 deleted
+        self.index_used = 0
+        self.lock = threading.Lock()   # Held while rows or the index change
+
+    @staticmethod
+    def key(account_id):
+        """Integer key for an account ID, or None if the ID isn't a plain number."""
+        if isinstance(account_id, str) and account_id.isdigit() and (account_id == "0" or account_id[0] != "0"):
+            return int(account_id)
+        return None
+
+    @property
+    def index_size(self):
+        """Number of slots in the hash index (always a power of two)."""
+        return len(self.index)
+
+    @staticmethod
+    def home_slot(key, size):
+        """First slot of a size-slot index to probe for key (Fibonacci hashing: the top bits of a 64-bit product)."""
+        return ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> (65 - size.bit_length())
+
+    def find_slot(self, key, index=None):
+        """Slot of `index` (default the current one) holding key, or -1 when the key isn't in the table."""
+        if index is None:
+            index = self.index
+        ids = self.ids
+        mask = len(index) - 1
+        slot = self.home_slot(key, len(index))
+        while True:
+            entry = index[slot]
+            if entry == self.EMPTY:
+                return -1
+            if entry > 0 and ids[entry - 1] == key:
+                return slot
+            slot = (slot + 1) & mask
+
+    def find_row(self, account_id):
+        """Row number of a live account, or -1."""
+        key = self.key(account_id)
+        if key is None:
+            return -1
+        index = self.index   # The index may be replaced meanwhile, so the slot is read from this one
+        slot = self.find_slot(key, index)
+        return index[slot] - 1 if slot >= 0 else -1
+
+    def insert_index(self, key, row, index=None):
+        """Put a row into the hash index (default the current one); returns whether it took an empty slot."""
+        if index is None:
+            index = self.index
+        mask = len(index) - 1
+        slot = self.home_slot(key, len(index))
+        while index[slot] > 0:
+            slot = (slot + 1) & mask
+        empty = index[slot] == self.EMPTY
+        index[slot] = row + 1
+        return empty
+
+    def rebuild_index(self, size):
+        """Re-create the hash index with `size` slots from the live rows; the caller holds the lock."""
+        index = array("q", bytes(8 * size))
+        used = 0
+        for row in range(len(self.ids)):
+            if self.categories[row]:
+                used += self.insert_index(self.ids[row], row, index)
+        self.index = index
+        self.index_used = used
+
+    def add(self, account_id, passcode, account_category, cents):
+        """
+        Add or replace an account using raw field values.
 
-        # Starts up the banking system nd loads existing accounts
-        self.filename = filename
-        self.accounts = self.load_accounts()  # Gets all the saved account
+        Raises:
+            ValueError: If the account ID isn't a plain decimal number
+        """
+        key = self.key(account_id)
+        if key is None:
+            raise ValueError(f"Account ID {account_id!r} can't be stored in a columnar table")
+        code = CATEGORY_CODES.get(account_category, 2)
+        with self.lock:
+            slot = self.find_slot(key)
+            if slot >= 0:
+                row = self.index[slot] - 1
+                self.passcodes[row] = sys.intern(str(passcode))
+                self.categories[row] = code
+                self.cents[row] = cents
+                return row
+
+            # Keep the index at most half full so probes stay short
+            if 2 * (self.index_used + 1) > self.index_size:
+                self.rebuild_index(self.index_size * 2 if 4 * self.live > self.index_size else self.index_size)
+            row = len(self.ids)
+            self.ids.append(key)
+            self.passcodes.append(sys.intern(str(passcode)))
+            self.categories.append(code)
+            self.cents.append(cents)
+            self.index_used += self.insert_index(key, row)
+            self.live += 1
+            return row
+
+    def extend(self, columns):
+        """
+        Add a whole AccountColumns chunk, e.g. from the parallel loader.
 
+        The columns are appended in bulk and only the hash index is built
+        row by row. Rows are applied in order, so a later row replaces an
+        earlier one with the same ID, exactly as repeated add() calls would.
 
-    def load_accounts(self):
+        Raises:
+            ValueError: If an account ID isn't a plain decimal number
+        """
+        keys = array("q", [int(a) if a.isdigit() and (a == "0" or a[0] != "0") else -1 for a in columns.ids])
+        if -1 in keys:
+            bad = columns.ids[keys.index(-1)]
+            raise ValueError(f"Account ID {bad!r} can't be stored in a columnar table")
+
+        with self.lock:
+            # Size the index for the whole chunk up front instead of doubling repeatedly
+            size = self.index_size
+            while 2 * (self.index_used + len(keys)) > size:
+                size *= 2
+            if size != self.index_size:
+                self.rebuild_index(size)
+
+            first = len(self.ids)
+            self.ids.extend(keys)
+            self.passcodes.extend(map(sys.intern, columns.passcodes))
+            self.categories.extend(code if code in CATEGORY_NAMES else 2 for code in columns.categories)
+            self.cents.extend(columns.cents)
+
+            ids, passcodes, categories, cents, index = self.ids, self.passcodes, self.categories, self.cents, self.index
+            mask = len(index) - 1
+            added = 0
+            for row in range(first, len(ids)):
+                key = ids[row]
+                slot = self.home_slot(key, len(index))
+                free = -1
+                while True:
+                    entry = index[slot]
+                    if entry == self.EMPTY:
+                        if free < 0:
+                            free = slot
+                            self.index_used += 1
+                        index[free] = row + 1
+                        added += 1
+                        break
+                    if entry > 0 and ids[entry - 1] == key:
+                        # Same ID seen before: the older row takes the new values, the new one is dropped
+                        old = entry - 1
+                        passcodes[old], categories[old], cents[old] = passcodes[row], categories[row], cents[row]
+                        categories[row] = 0
+                        cents[row] = 0
+                        break
+                    if entry == self.DELETED and free < 0:
+                        free = slot
+                    slot = (slot + 1) & mask
+            self.live += added
+
+    def __setitem__(self, account_id, account):
+        self.add(account_id, account.passcode, account.account_category, account.cents)
+
+    def __getitem__(self, account_id):
+        row = self.find_row(account_id)
+        if row < 0:
+            raise KeyError(account_id)
+        return AccountView(self, row)
+
+    def get(self, account_id, default=None):
+        row = self.find_row(account_id)
+        return AccountView(self, row) if row >= 0 else default
+
+    def __contains__(self, account_id):
+        return self.find_row(account_id) >= 0
+
+    def __delitem__(self, account_id):
+        key = self.key(account_id)
+        with self.lock:
+            slot = self.find_slot(key) if key is not None else -1
+            if slot < 0:
+                raise KeyError(account_id)
+            row = self.index[slot] - 1
+            self.index[slot] = self.DELETED
+            self.categories[row] = 0
+            self.cents[row] = 0
+            self.live -= 1
+
+    def pop(self, account_id, default=None):
+        account = self.get(account_id)
+        if account is None:
+            return default
+        del self[account_id]
+        return account
 
-        # Loads account from file when the systems starts
-        
-        accounts = {} # Creates a dictionary where each account is stored with its ID as the key
-        
+    def __len__(self):
+        return self.live
 
-        # Reads all the saved accounts from a file when the bank starts
-        try:
-            # Open accouts file for reading
-            with open(self.filename, "r") as file:
+    def __iter__(self):
+        return iter(self.keys())
 
-                # Read eaach account line by line
-                for line in file:
+    def live_rows(self):
+        """Row numbers of every account that hasn't been deleted."""
+        return (row for row, code in enumerate(self.categories) if code)
 
-                    # Split the line into account details like id,passwoer,categories,etcc
-                    account_id, passcode, account_category, funds = line.strip().split(",")
+    def keys(self):
+        return [str(self.ids[row]) for row in self.live_rows()]
 
-                    # Convert balance to the number
-                    funds = float(funds)
+    def values(self):
+        return [AccountView(self, row) for row in self.live_rows()]
 
+    def items(self):
+        return [(str(self.ids[row]), AccountView(self, row)) for row in self.live_rows()]
+
+    def update(self, accounts):
+        """Copy accounts from another mapping into the table."""
+        for account_id, account in accounts.items():
+            self[account_id] = account
 
-                    # Creates appriopriate account type
-                    if account_category == "Personal":
-                        account = PersonalAccount(account_id, passcode, funds)
-                    else:
-                        account = BusinessAccount(account_id, passcode, funds)
-                    
-                    # Stores account in the dictionary with ID as key
-                    accounts[account_id] = account
+    def total_cents(self):
+        """Sum of every balance, in cents (deleted rows hold 0)."""
+        return sum(self.cents)
 
-        # IF the file doesn't exits yet, it starts with an empty account
-        except FileNotFoundError:
-            pass
-        return accounts
+    def category_totals(self):
+        """Total balance in cents and account count per category."""
+        totals = {name: [0, 0] for name in CATEGORY_CODES}
+        for code, cents in zip(self.categories, self.cents):
+            if code:
+                entry = totals[CATEGORY_NAMES[code]]
+                entry[0] += cents
+                entry[1] += 1
+        return totals
 
 
-    
-    # Saves all accounts to the file after changes
+# Looks like a BankAccount but reads and writes one row of an AccountTable
+class AccountView(BankAccount):
+    """
+    Lightweight proxy for one row of an AccountTable.
 
-    def save_accounts(self):
+    All BankAccount methods work unchanged, because the fields they use
+    are properties here that point into the table's columns.
+    """
 
-        # Open the file for writing
-        with open(self.filename, "w") as file:
+    __slots__ = ("table", "row")
 
-            # Write each account as a line in the file
-            for account in self.accounts.values():
-                file.write(f"{account.account_id},{account.passcode},{account.account_category},{account.funds}\n")
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
 
+    @property
+    def account_id(self):
+        return str(self.table.ids[self.row])
 
-    
-    # Makes a new personal and business account
+    @property
+    def passcode(self):
+        return self.table.passcodes[self.row]
 
-    def create_account(self, account_type):
-        """
-        Create new bank account.
-        
-        Args:
-            account_type: 'Personal' or 'Business'
-            
-        Returns:
-            BankAccount: Newly created account
-        """
+    @passcode.setter
+    def passcode(self, value):
+        self.table.passcodes[self.row] = sys.intern(str(value))
 
-        # Generate a random 5- digit caccount ID and a 4-digit passwords
-        account_id = str(random.randint(10000, 99999))
-        passcode = str(random.randint(1000, 9999))
+    @property
+    def account_category(self):
+        return CATEGORY_NAMES.get(self.table.categories[self.row], "Business")
 
-        # Create a account type
-        if account_type == "Personal":
-            account = PersonalAccount(account_id, passcode)
-        else:
-            account = BusinessAccount(account_id, passcode)
+    @property
+    def cents(self):
+        return self.table.cents[self.row]
 
-        # Add a new account to system and save
-        self.accounts[account_id] = account
-        self.save_accounts()
+    @cents.setter
+    def cents(self, value):
+        self.table.cents[self.row] = value
 
-        # Return the new account
-        return account
+    def __eq__(self, other):
+        return isinstance(other, AccountView) and other.table is self.table and other.row == self.row
 
+    def __hash__(self):
+        return hash((id(self.table), self.row))
 
-    # Checks if the login details are correct
-    def login(self, account_id, passcode):
+
+# Append-only log of account changes that sits next to the accounts file
+class TransactionJournal:
+    """
+    Write-ahead journal for the banking system.
+
+    Every operation appends one line holding the new state of each account it
+    touched, so a deposit costs one small append instead of rewriting the
+    whole accounts file. Each line carries a CRC32 of its payload; a line that
+    was only half written when the program crashed fails the check and is
+    cut off the next time the journal is opened.
+
+    Record layout (one per line):
+        <crc32 as 8 hex digits>|<entry>;<entry>;...
+    where an entry is either
+        U,<account_id>,<passcode>,<account_category>,<funds>   (upsert)
+        D,<account_id>                                       (delete)
+
+    Entries hold full account state rather than deltas, so replaying a record
+    twice gives the same result. That keeps compaction safe even if the
+    program stops between writing a snapshot and truncating the journal.
+
+    In group-commit mode, records from concurrent callers are collected
+    for up to commit_window seconds or commit_batch records. They are then
+    written with one flush and one fsync. The first caller of a batch
+    acts as its leader and does the write. Every caller returns only
+    after its own record is on disk.
+
+    If a write or fsync fails, the journal is marked failed: the caller
+    that wrote gets the error, every caller waiting on that batch or a
+    later one gets Journal_Failed_Exception, and so does every append
+    after it. Nothing is reported saved that may not be on disk, and no
+    record lands behind a half-written one. reset() (after a full save)
+    clears the failure.
+    """
+
+    def __init__(self, path, group_commit=False, commit_window=0.002, commit_batch=64):
         """
-        Authenticate user credentials.
-        
+        Open (or create) a journal file.
+
         Args:
-            account_id: Account number
-            passcode: Account PIN
-            
+            path: Location of the journal file
+            group_commit: Batch records from concurrent callers and fsync
+                them together (default False)
+            commit_window: Longest time in seconds a batch waits to fill up
+            commit_batch: Number of records that closes a batch early
+        """
+        self.path = path
+        self.records = 0
+        self.file = None
+        self.syncs = 0   # Number of fsync calls, handy for measuring batching
+
+        # Group commit state, all guarded by the condition's lock
+        self.group_commit = group_commit
+        self.commit_window = commit_window
+        self.commit_batch = commit_batch
+        self.condition = threading.Condition()
+        self.pending = []         # Encoded records waiting for the next batch
+        self.open_batch = 0       # Number of the batch currently being filled
+        self.durable_batch = -1   # Highest batch number known to be on disk
+        self.writing = False      # True while a leader is writing a batch
+        self.failure = None       # Error of a failed write; set until reset()
+
+    def replay(self):
+        """
+        Read every intact record from the journal.
+
+        A torn or corrupted record marks the end of the usable journal:
+        it and anything after it are truncated away so new records are
+        never appended behind garbage.
+
         Returns:
-            BankAccount: Authenticated account object
-            
-        Raises:
-            ValueError: If authentication fails
+            list: One list of entry tuples per record, oldest first
         """
+        records = []
+        valid_end = 0
+        try:
+            with open(self.path, "rb") as file:
+                for raw in file:
+                    # A line without its newline was cut short by a crash
+                    if not raw.endswith(b"\n"):
+                        break
+                    checksum, sep, payload = raw[:-1].partition(b"|")
+                    if not sep or checksum != b"%08x" % zlib.crc32(payload):
+                        break
+                    records.append([tuple(entry.split(",")) for entry in payload.decode().split(";")])
+                    valid_end += len(raw)
+        except FileNotFoundError:
+            pass
 
-        # Check if the account exists or not
-        account = self.accounts.get(account_id)
+        # Drop whatever follows the last good record
+        if os.path.exists(self.path) and os.path.getsize(self.path) != valid_end:
+            with open(self.path, "r+b") as file:
+                file.truncate(valid_end)
 
-        # Verify of the passwords matches or not
-        if account and account.passcode == passcode:
-            return account
-        
-        # If either checks, it fails        
-        raise ValueError("Account number or password is not recognized")
+        self.records = len(records)
+        return records
 
+    def append(self, entries):
+        """
+        Append one record made of several entries.
 
-    # Removes an account from the system
-    def delete_account(self, account_id):
+        All entries in a record are applied together on replay, which is
+        what makes a transfer between two accounts atomic.
+
+        Args:
+            entries: Sequence of entry tuples (see class docstring)
         """
-        Permanently remove account.
-        
+        payload = ";".join(",".join(str(field) for field in entry) for entry in entries).encode()
+        line = b"%08x|%s\n" % (zlib.crc32(payload), payload)
+        if self.group_commit:
+            self.commit(line)
+            return
+        with self.condition:
+            self.check_failure()
+            try:
+                if self.file is None:
+                    self.file = open(self.path, "ab")
+                self.file.write(line)
+                self.file.flush()
+            except Exception as e:
+                self.failure = e
+                raise
+            self.records += 1
+
+    def check_failure(self):
+        # Refuses to go on after a failed write; the caller holds the lock
+        if self.failure is not None:
+            raise Journal_Failed_Exception(f"Journal {self.path} failed to write and must be saved in full") \
+                from self.failure
+
+    def commit(self, line):
+        """
+        Add a record to the open batch and wait until that batch is durable.
+
         Args:
-            account_id: Account number to delete
-            
-        Raises:
-            ValueError: If account doesn't exist
+            line: Fully encoded journal record
         """
+        with self.condition:
+            self.check_failure()
+            self.pending.append(line)
+            batch = self.open_batch
+            if len(self.pending) >= self.commit_batch:
+                self.condition.notify_all()
+
+            while self.durable_batch < batch:
+                # A failed batch takes every record not yet on disk down with it
+                self.check_failure()
+
+                # Someone else is writing, wait for them to finish
+                if self.writing:
+                    self.condition.wait()
+                    continue
+
+                # Become the leader: give others a chance to join, then write
+                self.writing = True
+                deadline = time.monotonic() + self.commit_window
+                while len(self.pending) < self.commit_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                lines, self.pending = self.pending, []
+                written = self.open_batch
+                self.open_batch += 1
+
+                # Disk I/O happens without the lock so the next batch can fill
+                self.condition.release()
+                try:
+                    if self.file is None:
+                        self.file = open(self.path, "ab")
+                    self.file.write(b"".join(lines))
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                except Exception as e:
+                    self.condition.acquire()
+                    self.writing = False
+                    self.failure = e
+                    self.pending = []
+                    self.condition.notify_all()
+                    raise
+                self.condition.acquire()
+                self.writing = False
+                self.records += len(lines)
+                self.syncs += 1
+                self.durable_batch = written
+                self.condition.notify_all()
+
+    def rotate(self, old_path):
+        """
+        Move the current journal aside so a checkpoint can cover it.
 
-        # Check if the account exists
-        if account_id in self.accounts:
+        New records go to a fresh journal. If an earlier checkpoint never
+        finished, its journal is still at old_path and the current one is
+        appended to it, so no record is lost.
 
-            # Remove from the memory and update the file 
-            del self.accounts[account_id]
-            self.save_accounts()
+        Args:
+            old_path: Where the covered part of the journal is kept
+        """
+        with self.condition:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            if os.path.exists(self.path):
+                if os.path.exists(old_path):
+                    with open(old_path, "ab") as old, open(self.path, "rb") as current:
+                        old.write(current.read())
+                        old.flush()
+                        os.fsync(old.fileno())
+                    os.unlink(self.path)
+                else:
+                    os.replace(self.path, old_path)
+            self.records = 0
+
+    def reset(self):
+        """Empty the journal once its contents are covered by a snapshot."""
+        with self.condition:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            with open(self.path, "wb"):
+                pass
+            self.records = 0
+            self.failure = None
+
+    def close(self):
+        """Close the underlying file handle."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# Binary account file where every account sits in its own fixed-size slot
+class MmapAccountStore:
+    """
+    Memory-mapped account storage with fixed-width records.
+
+    The file starts with a small header followed by one 128-byte slot per
+    account. A deposit or withdrawal only rewrites the 8-byte balance of
+    its own slot, so the cost of saving does not depend on how many
+    accounts exist. Deleted slots are remembered in a free list and reused
+    by the next new account.
+
+    Header layout:  magic (4s), version (H), slot size (H), slots in use (Q)
+    Slot layout:    live flag (B), category code (B), padding,
+                    account_id (16s), passcode or passcode hash (96s),
+                    balance in cents (q)
+    """
+
+    MAGIC = b"NKBM"
+    VERSION = 3
+    HEADER = struct.Struct("<4sHHQ8x")
+    RECORD = struct.Struct("<BB6x16s96sq")
+    FUNDS = struct.Struct("<q")
+    FUNDS_OFFSET = 120
+    def __init__(self, path, initial_slots=1024):
+        """
+        Open (or create) a memory-mapped account file.
+
+        Args:
+            path: Location of the binary account file
+            initial_slots: Slots to reserve when the file is created
+        """
+        self.path = path
+        self.index = {}        # account_id -> slot number
+        self.free_slots = []   # slots left behind by deleted accounts
+        self.lock = threading.Lock()   # Guards slot allocation and growth
+
+        mode = "r+b" if os.path.exists(path) else "w+b"
+        self.file = open(path, mode)
+        if os.path.getsize(path) < self.HEADER.size:
+            self.file.truncate(self.HEADER.size + initial_slots * self.RECORD.size)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+            self.HEADER.pack_into(self.map, 0, self.MAGIC, self.VERSION, self.RECORD.size, 0)
         else:
-            raise ValueError("Account does not exist")
+            self.map = mmap.mmap(self.file.fileno(), 0)
+            magic, version, record_size, _ = self.HEADER.unpack_from(self.map, 0)
+            if magic != self.MAGIC or version != self.VERSION or record_size != self.RECORD.size:
+                raise ValueError(f"{path} is not a version {self.VERSION} account store")
+
+        # Rebuild the id -> slot index from the live slots
+        self.used = self.HEADER.unpack_from(self.map, 0)[3]
+        for slot in range(self.used):
+            offset = self.slot_offset(slot)
+            if self.map[offset]:
+                account_id = self.map[offset + 8:offset + 24].rstrip(b"\0").decode()
+                self.index[account_id] = slot
+            else:
+                self.free_slots.append(slot)
 
+    def slot_offset(self, slot):
+        """Byte offset of a slot inside the file."""
+        return self.HEADER.size + slot * self.RECORD.size
 
+    def load(self):
+        """
+        Build account objects for every live slot.
 
-    # Handles whatever action the user want to do
+        Returns:
+            dict: Accounts keyed by account ID
+        """
+        accounts = {}
+        for account_id, passcode, account_category, cents in self.rows():
+            if account_category == "Personal":
+                accounts[account_id] = PersonalAccount(account_id, passcode, Money(cents))
+            else:
+                accounts[account_id] = BusinessAccount(account_id, passcode, Money(cents))
+        return accounts
 
-    def process_User_Input(self, account, choice, amount=None, recipient_id=None, number=None):
+    def rows(self):
+        """Yield (account_id, passcode, account_category, cents) for every live slot."""
+        for account_id, slot in self.index.items():
+            _, code, _, passcode, cents = self.RECORD.unpack_from(self.map, self.slot_offset(slot))
+            yield account_id, passcode.rstrip(b"\0").decode(), CATEGORY_NAMES.get(code, "Business"), cents
+
+    def write(self, account, full=False):
         """
-        Execute user-selected banking operation.
-        
+        Store an account, patching its balance in place if it already has a slot.
+
         Args:
-            account (BankAccount): Source account
-            choice: Menu selection (1-6)
-            amount: Transaction amount
-            recipient_id: Target account ID
-            number: Mobile number
-            
-        Returns:
-            Operation result message
-            
-        Raises:
-            Invalid_Menu_Choice_Exception: For invalid menu selections
-            Invalid_Transfer_Exception: For failed transfers
+            account (BankAccount): Account to persist
+            full: Rewrite the whole slot, e.g. after a passcode change
         """
-        
-        # Checks the balance of the account
-        if choice == "1":
-            return f"Your balance is {account.funds}"
-        
-        # Deposit the money to the account
-        elif choice == "2":
-            result = account.deposit(amount)
-        
-        # Withdrw the money from the account
-        elif choice == "3":
-            result = account.withdraw(amount)
+        with self.lock:
+            slot = self.index.get(account.account_id)
+            if slot is not None and not full:
+                self.FUNDS.pack_into(self.map, self.slot_offset(slot) + self.FUNDS_OFFSET, account.cents)
+                return
 
-        # Transfer the momney from the account
-        elif choice == "4":
-            # First check if the recipient exist
-            if recipient_id not in self.accounts:
-                raise Invalid_Transfer_Exception("Recipient account does not exist.")
-            result = account.transfer(amount, self.accounts[recipient_id])
+            # New account: reuse a free slot or take the next one
+            if slot is not None:
+                pass
+            elif self.free_slots:
+                slot = self.free_slots.pop()
+            else:
+                slot = self.used
+                if self.slot_offset(slot + 1) > len(self.map):
+                    self.grow()
+                self.used += 1
+                self.HEADER.pack_into(self.map, 0, self.MAGIC, self.VERSION, self.RECORD.size, self.used)
+            self.RECORD.pack_into(
+                self.map, self.slot_offset(slot), 1,
+                CATEGORY_CODES.get(account.account_category, 2),
+                account.account_id.encode(), str(account.passcode).encode(), account.cents
+            )
+            self.index[account.account_id] = slot
+
+    def remove(self, account_id):
+        """
+        Free the slot of a deleted account.
 
-        # Mobile top-up
-        elif choice == "5":
-            result = account.top_up_mobile(number, amount)
+        Args:
+            account_id: ID of the account to remove
+        """
+        with self.lock:
+            slot = self.index.pop(account_id, None)
+            if slot is not None:
+                self.map[self.slot_offset(slot)] = 0
+                self.free_slots.append(slot)
+
+    def grow(self):
+        """Double the file size and map it again."""
+        size = len(self.map)
+        self.map.close()
+        self.file.truncate(self.HEADER.size + 2 * (size - self.HEADER.size))
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    def flush(self):
+        """Ask the OS to write dirty pages back to disk."""
+        self.map.flush()
+
+    def close(self):
+        """Unmap and close the file."""
+        self.map.close()
+        self.file.close()
+
+
+# Hands out unique account numbers without guessing and retrying
+class AccountIdAllocator:
+    """
+    Collision-free account ID allocator.
+
+    IDs are produced by pushing a simple counter through a keyed Feistel
+    permutation of the width-digit numbers. Every counter value maps to a
+    different ID, so no draw is ever thrown away and each allocation costs
+    the same no matter how full the ID space is. The key is random per
+    bank, so consecutive accounts still get unrelated-looking numbers.
+
+    The counter is saved to a small state file in steps of `reserve`, so
+    most allocations don't touch the disk. After a crash the allocator
+    continues past the last saved mark, which may skip some IDs but never
+    hands out one twice. The mark of every width ever used is kept, so
+    going back to an earlier width carries on where it stopped instead of
+    handing out IDs of accounts that were since deleted.
+
+    State file layout (one line):
+        width,key as hex,next counter value[,other width:its next counter value...]
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, path, width=5, reserve=1000):
+        """
+        Load or create allocator state.
 
-        # Deletes an account
-        elif choice == "6":
-            self.delete_account(account.account_id)
-            result = "Account successfully deleted."
+        Args:
+            path: Location of the state file
+            width: Number of digits in an account ID (default 5)
+            reserve: Counter values claimed per write of the state file
+        """
+        self.path = path
+        self.width = width
+        self.reserve = reserve
+        self.low = 10 ** (width - 1)
+        self.size = 9 * self.low   # How many width-digit numbers there are
+
+        # Feistel halves need an even number of bits covering the ID space
+        bits = max(2, (self.size - 1).bit_length())
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+
+        self.key = None
+        self.marks = {}   # width -> next counter value saved for it
+        try:
+            with open(path) as file:
+                stored_width, key, counter, *others = file.read().strip().split(",")
+            self.key = bytes.fromhex(key)
+            self.marks[int(stored_width)] = int(counter)
+            for other in others:
+                other_width, other_counter = other.split(":")
+                self.marks[int(other_width)] = int(other_counter)
+        except (FileNotFoundError, ValueError):
+            pass
+        if self.key is None:
+            self.key = os.urandom(16)
 
-        # Invaild choice
-        else:
-            raise Invalid_Menu_Choice_Exception("Invalid menu choice")
-        
-        # Saves any changes made
-        self.save_accounts()
-        return result
+        # A new width is a fresh ID space, since IDs of different widths can't clash
+        self.counter = self.marks.get(width, 0)
+        self.saved_counter = self.counter
+        self.lock = threading.Lock()
 
+    def round_value(self, round_number, half):
+        """Keyed round function of the Feistel network."""
+        digest = hashlib.blake2b(half.to_bytes(8, "little"), digest_size=8, key=self.key,
+                                 person=round_number.to_bytes(1, "little")).digest()
+        return int.from_bytes(digest, "little") & self.half_mask
 
+    def permute(self, value):
+        """
+        Map a counter value to a unique position in the ID space.
 
-class BankingGUI:
-    """Graphical user interface for banking application"""
+        The Feistel network permutes a power-of-four range that is at most
+        four times the ID space. Results outside the ID space are fed back
+        in (cycle walking), which stays a permutation and needs fewer than
+        four steps on average.
 
-    def __init__(self, system):
-        """
-        Initialize banking GUI.
-        
         Args:
-            system (BankingSystem): Connected banking system
+            value: Counter value in range(self.size)
+
+        Returns:
+            int: Position in range(self.size)
+        """
+        while True:
+            left, right = value >> self.half_bits, value & self.half_mask
+            for round_number in range(self.ROUNDS):
+                left, right = right, left ^ self.round_value(round_number, right)
+            value = (left << self.half_bits) | right
+            if value < self.size:
+                return value
+
+    def allocate_many(self, count, in_use=None):
         """
+        Hand out several new account IDs.
 
-        # It sets up the main banking application window
-        self.system = system
-        self.account = None
+        Args:
+            count: Number of IDs wanted
+            in_use: Optional check for IDs already taken by older accounts,
+                such as ones made before the allocator existed
 
-        # Creates the main window
-        self.window = tk.Tk()
-        self.window.title("Banking Application")
+        Returns:
+            list: New account IDs as strings
 
-        # Creates an account ID and passwords entry fields
+        Raises:
+            Account_Id_Exhausted_Exception: When the ID space is used up
+        """
+        ids = []
+        with self.lock:
+            while len(ids) < count:
+                if self.counter >= self.size:
+                    raise Account_Id_Exhausted_Exception(f"All {self.width}-digit account IDs are in use")
+                account_id = str(self.low + self.permute(self.counter))
+                self.counter += 1
+                if in_use is None or not in_use(account_id):
+                    ids.append(account_id)
+
+            # Claim the next block of counter values before they are handed out
+            if self.counter > self.saved_counter:
+                self.saved_counter = min(self.size, self.counter + self.reserve)
+                self.save()
+        return ids
+
+    def allocate(self, in_use=None):
+        """Hand out a single new account ID."""
+        return self.allocate_many(1, in_use)[0]
+
+    def save(self):
+        """Write the state file atomically."""
+        self.marks[self.width] = self.saved_counter
+        others = "".join(f",{width}:{counter}" for width, counter in sorted(self.marks.items()) if width != self.width)
+        temp_name = self.path + ".tmp"
+        with open(temp_name, "w") as file:
+            file.write(f"{self.width},{self.key.hex()},{self.saved_counter}{others}\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_name, self.path)
+
+
+# Keeps threads from changing the same account at the same time
+class AccountLocks:
+    """
+    Striped per-account locks.
+
+    Each account ID hashes to one of a fixed number of locks, so memory
+    stays the same however many accounts exist. Operations that touch
+    several accounts always take their locks in stripe order, which rules
+    out deadlocks between two transfers going in opposite directions.
+    """
+
+    def __init__(self, stripes=1024):
+        """
+        Args:
+            stripes: Number of locks to spread accounts over (default 1024)
+        """
+        self.stripes = [threading.Lock() for _ in range(stripes)]
 
-        self.id_entry = tk.Entry(self.window)
-        self.pass_entry = tk.Entry(self.window, show="*")  # Hides the passwords characters
+    def stripes_for(self, account_ids):
+        """Sorted, de-duplicated stripe numbers for the given accounts."""
+        return sorted({hash(account_id) % len(self.stripes) for account_id in account_ids if account_id is not None})
 
-        # Creates status display label
-        self.output = tk.Label(self.window, text="Welcome to the Bank!", wraplength=300)
+    def holding(self, *account_ids):
+        """
+        Context manager that holds the locks of the given accounts.
 
-        # Adds labels and entry fields to window
-        tk.Label(self.window, text="Account ID").pack()
-        self.id_entry.pack()
-        tk.Label(self.window, text="Passcode").pack()
-        self.pass_entry.pack()
+        Args:
+            account_ids: IDs of every account the operation touches
+        """
+        return _HeldStripes(self, self.stripes_for(account_ids))
 
-        # Add action buttons
-        tk.Button(self.window, text="Login", command=self.login).pack()
-        tk.Button(self.window, text="Create Personal Account", command=lambda: self.create_account("Personal")).pack()
-        tk.Button(self.window, text="Create Business Account", command=lambda: self.create_account("Business")).pack()
+    def holding_all(self):
+        """Context manager that holds every lock, e.g. for a full snapshot."""
+        return _HeldStripes(self, range(len(self.stripes)))
 
-        # Displays everyting
-        self.output.pack()
-        self.window.mainloop()
 
+class _HeldStripes:
+    """Acquires a set of stripes in order and releases them in reverse."""
 
-    def create_account(self, account_type):
+    def __init__(self, locks, stripes):
+        self.locks = locks.stripes
+        self.stripes = list(stripes)
 
-        # Creates new account and show the credentials details to the user
-        account = self.system.create_account(account_type)
-        self.output.config(text=f"Created {account_type} Account. ID: {account.account_id}, Pass: {account.passcode}")
+    def __enter__(self):
+        for stripe in self.stripes:
+            self.locks[stripe].acquire()
+        return self
 
+    def __exit__(self, *exc_info):
+        for stripe in reversed(self.stripes):
+            self.locks[stripe].release()
 
-    def login(self):
 
-        # Attempts to log in with entered credentitals
-        acc_id = self.id_entry.get()
-        passcode = self.pass_entry.get()
+# Binary copy of the whole book used for fast restarts
+class SnapshotFile:
+    """
+    Checksummed binary snapshot of every account.
 
-        try:
-            self.account = self.system.login(acc_id, passcode)
-            self.show_logged_in_options()
-        except ValueError as e:
-            messagebox.showerror("Login Failed", str(e))
+    Layout: header (magic, version, account count), then one fixed-width
+    record per account, then a CRC32 of all records. Reading it is a
+    single struct.iter_unpack over the file, with no text parsing.
 
+    Record layout: category code (B), account_id (16s), passcode or
+    passcode hash (96s), balance in cents (q)
+    """
 
-    def show_logged_in_options(self):
-        # Display banking options after successful login
-        self.clear_widgets()
+    MAGIC = b"NKSN"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHxxQ")
+    RECORD = struct.Struct("<B16s96sq")
+    TRAILER = struct.Struct("<I")
 
-        # Shows all the avaolable banking options 
-        options = [
-            ("Check Balance", "1"),
-            ("Deposit", "2"),
-            ("Withdraw", "3"),
-            ("Transfer", "4"),
-            ("Top-Up Mobile", "5"),
-            ("Delete Account", "6"),
-            ("Logout", "logout")
-        ]
+    @classmethod
+    def write(cls, path, rows):
+        """
+        Write a snapshot atomically.
 
-        # Creates a button for each options
-        for text, val in options:
-            tk.Button(self.window, text=text, command=lambda v=val: self.handle_action(v)).pack()
-        self.output.pack()
+        Args:
+            path: Snapshot file
+            rows: (account_id, passcode, category code, cents) tuples
+        """
+        body = b"".join(cls.RECORD.pack(code, account_id.encode(), str(passcode).encode(), cents)
+                        for account_id, passcode, code, cents in rows)
 
+        # Every write gets its own temporary file, so two writers never rename each other's
+        directory, name = os.path.split(os.path.abspath(path))
+        handle, temp_name = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(handle, "wb") as file:
+                file.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(body) // cls.RECORD.size))
+                file.write(body)
+                file.write(cls.TRAILER.pack(zlib.crc32(body)))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_name, path)
+        except BaseException:
+            if os.path.exists(temp_name):
+                os.unlink(temp_name)
+            raise
+
+    @classmethod
+    def read(cls, path):
+        """
+        Read every account from a snapshot.
 
+        Returns:
+            list: (account_id, passcode, account_category, cents) tuples
 
-    # Process user's sleected banking operations
-    def handle_action(self, choice):
+        Raises:
+            ValueError: If the file is damaged or not a snapshot
+        """
+        with open(path, "rb") as file:
+            data = file.read()
+        magic, version, count = cls.HEADER.unpack_from(data, 0)
+        end = cls.HEADER.size + count * cls.RECORD.size
+        if magic != cls.MAGIC or version != cls.VERSION or len(data) != end + cls.TRAILER.size:
+            raise ValueError(f"{path} is not a valid snapshot")
+        body = memoryview(data)[cls.HEADER.size:end]
+        if cls.TRAILER.unpack_from(data, end)[0] != zlib.crc32(body):
+            raise ValueError(f"{path} failed its checksum")
+        return [(account_id.rstrip(b"\0").decode(), passcode.rstrip(b"\0").decode(),
+                 CATEGORY_NAMES.get(code, "Business"), cents)
+                for code, account_id, passcode, cents in cls.RECORD.iter_unpack(body)]
+
+
+# A run of parsed accounts kept as columns rather than one tuple per account
+AccountColumns = namedtuple("AccountColumns", "ids passcodes categories cents")
+
+
+# Finds byte ranges of a file that each start and end on a line boundary
+def split_lines(path, parts):
+    """
+    Split a text file into about `parts` byte ranges of whole lines.
+
+    Returns:
+        list: (start, end) byte offsets covering the whole file
+    """
+    size = os.path.getsize(path)
+    starts = [0]
+    with open(path, "rb") as file:
+        for n in range(1, parts):
+            file.seek(max(starts[-1], size * n // parts))
+            file.readline()   # Move on to the start of the next line
+            if file.tell() >= size:
+                break
+            if file.tell() > starts[-1]:
+                starts.append(file.tell())
+    return list(zip(starts, starts[1:] + [size]))
+
+
+# Parses one byte range of an accounts file; runs in a worker process
+def parse_accounts_chunk(path, start, end):
+    """
+    Parse the 'id,passcode,category,funds' lines in one byte range.
+
+    Args:
+        path: Accounts file
+        start, end: Byte range, aligned to line boundaries
+
+    Returns:
+        tuple: (AccountColumns, number of lines, [(line index, text)] of
+        damaged lines that were skipped)
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+        text = file.read(end - start).decode(errors="replace")
+
+    # Lines end where reading the file as text ends them, at newlines only, so a name
+    # holding a character like \x0b or \u2028 loads the same as line by line
+    lines = [line.rstrip("\n") for line in io.StringIO(text, newline=None)]
+    ids, passcodes, categories, cents = [], [], bytearray(), array("q")
+    bad = []
+    for n, line in enumerate(lines):
+        try:
+            account_id, passcode, account_category, funds = line.strip().split(",")
+            balance = Money.parse(funds)
+        except ValueError:
+            if line.strip():
+                bad.append((n, line))
+            continue
+        ids.append(account_id)
+        passcodes.append(passcode)
+        categories.append(CATEGORY_CODES.get(account_category, 2))
+        cents.append(balance)
+    return AccountColumns(ids, passcodes, bytes(categories), cents), len(lines), bad
+
+
+# Copies every account into plain rows for a snapshot
+def snapshot_rows(accounts):
+    """
+    Take (account_id, passcode, category code, cents) rows of a whole book.
+
+    Args:
+        accounts: Dict of accounts or an AccountTable
+    """
+    if isinstance(accounts, AccountTable):
+        return [(str(accounts.ids[row]), accounts.passcodes[row], accounts.categories[row], accounts.cents[row])
+                for row in accounts.live_rows()]
+    return [(a.account_id, a.passcode, CATEGORY_CODES.get(a.account_category, 2), a.cents)
+            for a in accounts.values()]
+
+
+# Where BankingSystem keeps its accounts between runs
+class StorageBackend:
+    """
+    Interface every storage engine behind BankingSystem implements.
+
+    BankingSystem keeps the accounts in memory and tells the backend
+    about every change:
+
+        load()         yields (account_id, passcode, category, cents) rows;
+                       a row with passcode None means the account is gone,
+                       and an AccountColumns holds many rows at once
+        record()       persists one operation (one or two accounts for a
+                       transfer, or deletions) as a single atomic change
+        save()         writes the whole book; the caller holds every lock
+        checkpoint()   compacts whatever record() has piled up
+        close()        releases files and connections
+    """
+
+    def load(self):
+        raise NotImplementedError
+
+    def record(self, accounts, deleted=(), full=False):
+        """
+        Args:
+            accounts: Accounts whose current state should be stored
+            deleted: IDs of accounts that were removed
+            full: More than the balance changed, e.g. a new passcode
+        """
+        raise NotImplementedError
+
+    def save(self, accounts):
+        raise NotImplementedError
+
+    def needs_checkpoint(self, compact_every):
+        """True once enough has been recorded that a checkpoint is due."""
+        return False
+
+    def checkpoint(self, accounts, locks, background=True):
+        """Compact recorded changes; returns False if one is already running."""
+        return True
+
+    def wait_for_checkpoint(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# The original accounts.txt, with a journal and binary checkpoints next to it
+class TextFileBackend(StorageBackend):
+    """
+    CSV accounts file plus an append-only journal.
+
+    Each operation appends one checksummed journal record, so its cost
+    doesn't depend on the size of the book. Checkpoints write a binary
+    snapshot (.snap) in the background and drop the journal it covers.
+    save() rewrites the CSV file and starts over with an empty journal.
+    """
+
+    # Files smaller than this are parsed on the main process
+    PARALLEL_THRESHOLD = 8 * 1024 * 1024
+
+    def __init__(self, filename, group_commit=False, commit_window=0.002, commit_batch=64, load_workers=None):
+        """
+        Args:
+            filename: Accounts file
+            group_commit, commit_window, commit_batch: See TransactionJournal
+            load_workers: Processes used to parse a large accounts file
+                (default: one per available core; 1 parses on this process)
+        """
+        self.filename = filename
+        if load_workers is None:
+            load_workers = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+        self.load_workers = load_workers
+        self.bad_lines = []   # (line number, text) of damaged lines skipped by the last load
+        self.snapshot_path = filename + ".snap"
+        self.old_journal_path = filename + ".journal.old"
+        self.checkpoint_thread = None
+        self.checkpoint_lock = threading.Lock()   # Held while a checkpoint is being started
+        self.checkpoint_error = None
+        self.journal = TransactionJournal(filename + ".journal", group_commit, commit_window, commit_batch)
+
+    def load(self):
+        yield from self.load_book()
+
+        # Replays whatever happened after the last snapshot: first a journal left
+        # behind by a checkpoint that never finished, then the live journal
+        journals = [self.journal.replay()]
+        if os.path.exists(self.old_journal_path):
+            journals.insert(0, TransactionJournal(self.old_journal_path).replay())
+        for records in journals:
+            for record in records:
+                for entry in record:
+                    if entry[0] == "U":
+                        _, account_id, passcode, account_category, funds = entry
+                        yield account_id, passcode, account_category, Money.parse(funds)
+                    elif entry[0] == "D":
+                        yield entry[1], None, None, 0
+
+    def load_book(self):
+        # A binary checkpoint is newer than the text file whenever it exists. The
+        # journal only goes back to the checkpoint, so a damaged one can't be
+        # skipped in favour of the older text file without losing changes
+        if os.path.exists(self.snapshot_path):
+            try:
+                rows = SnapshotFile.read(self.snapshot_path)
+            except (ValueError, struct.error) as e:
+                raise ValueError(f"Checkpoint {self.snapshot_path} is damaged, restore it from a backup: {e}") from None
+            yield from rows
+            return
+
+        # IF the file doesn't exits yet, it starts with an empty account
+        self.bad_lines = []
+        try:
+            size = os.path.getsize(self.filename)
+        except FileNotFoundError:
+            return
+
+        # Big books are parsed in chunks of lines, by a pool of processes when there are cores to spare
+        if size >= self.PARALLEL_THRESHOLD:
+            yield from self.load_chunks()
+            return
+
+        # Reads all the saved accounts from a file when the bank starts
+        with open(self.filename, "r") as file:
+
+            # Read eaach account line by line
+            for line_number, line in enumerate(file, 1):
+
+                # Split the line into account details like id,passwoer,categories,etcc
+                # and skip lines that are damaged instead of failing the whole load
+                try:
+                    account_id, passcode, account_category, funds = line.strip().split(",")
+
+                    # Convert balance to an exact amount of money
+                    cents = Money.parse(funds)
+                except ValueError:
+                    if line.strip():
+                        self.bad_lines.append((line_number, line.rstrip("\r\n")))
+                    continue
+                yield account_id, passcode, account_category, cents
+
+    def load_chunks(self):
+        """
+        Parse the accounts file in chunks, on a process pool if load_workers > 1.
+
+        The file is cut into byte ranges that start and end on line
+        boundaries, a few per worker so uneven chunks even out. Each
+        worker parses its range into AccountColumns, and the chunks come
+        back in file order, so later lines still win over earlier ones.
+
+        Yields:
+            AccountColumns: One per chunk
+        """
+        ranges = split_lines(self.filename, max(4, self.load_workers * 4))
+        paths = itertools.repeat(self.filename)
+        pool = None
+        if self.load_workers > 1:
+            from concurrent.futures import ProcessPoolExecutor   # Only needed for parallel loads
+            pool = ProcessPoolExecutor(max_workers=self.load_workers)
+        try:
+            chunks = pool.map(parse_accounts_chunk, paths, *zip(*ranges)) if pool else \
+                map(parse_accounts_chunk, paths, *zip(*ranges))
+            line_offset = 0
+            for columns, line_count, bad in chunks:
+                self.bad_lines.extend((line_offset + n + 1, line) for n, line in bad)
+                line_offset += line_count
+                yield columns
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def record(self, accounts, deleted=(), full=False):
+        entries = [("U", a.account_id, a.passcode, a.account_category, a.funds) for a in accounts]
+        entries += [("D", account_id) for account_id in deleted]
+        if entries:
+            self.journal.append(entries)
+
+    def save(self, accounts):
+        # A checkpoint still being written would put back a snapshot older than this save
+        self.wait_for_checkpoint()
+
+        # Write the snapshot next to the real file first so a crash never leaves a half-written book
+        temp_name = self.filename + ".tmp"
+        with open(temp_name, "w") as file:
 
+            # Write each account as a line in the file
+            for account in accounts.values():
+                file.write(f"{account.account_id},{account.passcode},{account.account_category},{account.funds}\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+        # Swap it in, after which older checkpoints and the journal are no longer needed.
+        # The old journal goes first: on its own it would be replayed over the new file
+        os.replace(temp_name, self.filename)
+        for path in (self.old_journal_path, self.snapshot_path):
+            if os.path.exists(path):
+                os.unlink(path)
+        self.journal.reset()
+
+    def needs_checkpoint(self, compact_every):
+        return self.journal.records >= compact_every
+
+    def checkpoint(self, accounts, locks, background=True):
+        """
+        Write a binary snapshot and drop the journal it covers.
+
+        All account locks are held only while the balances are copied and
+        the journal is switched to a new file. The snapshot is written
+        afterwards, on a background thread by default, while transactions
+        carry on. Once it is safely on disk, the old journal is deleted.
+        Only one checkpoint runs at a time; callers that find one starting
+        or still writing get False back.
+        """
+        if not self.checkpoint_lock.acquire(blocking=False):
+            return False
         try:
-            if choice == "logout":
-                # Return to login screen
-                self.account = None
-                self.clear_widgets()
-                self.__init__(self.system)
+            if self.checkpoint_thread is not None and self.checkpoint_thread.is_alive():
+                return False
+
+            # The writer is registered before the locks are let go, so a save() right
+            # after this always waits for it instead of being undone by it
+            with locks.holding_all():
+                rows = snapshot_rows(accounts)
+                self.journal.rotate(self.old_journal_path)
+                thread = threading.Thread(target=self.finish_checkpoint, args=(rows,), daemon=True)
+                self.checkpoint_thread = thread
+                self.checkpoint_error = None
+                thread.start()
+        finally:
+            self.checkpoint_lock.release()
+
+        if not background:
+            thread.join()
+            if self.checkpoint_error is not None:
+                raise self.checkpoint_error
+        return True
+
+    # Second half of a checkpoint: write the snapshot, then compact the journal
+    def finish_checkpoint(self, rows):
+        try:
+            SnapshotFile.write(self.snapshot_path, rows)
+            if os.path.exists(self.old_journal_path):
+                os.unlink(self.old_journal_path)
+        except Exception as e:
+            self.checkpoint_error = e   # Raised again for a caller waiting on this checkpoint
+            raise
+
+    def wait_for_checkpoint(self):
+        thread = self.checkpoint_thread
+        if thread is not None:
+            thread.join()
+
+    def close(self):
+        self.wait_for_checkpoint()
+        self.journal.close()
+
+
+# Fixed-width binary records patched in place
+class MmapBackend(StorageBackend):
+    """Storage on a MmapAccountStore; every change patches the account's own slot."""
+
+    def __init__(self, filename):
+        self.store = MmapAccountStore(filename)
+
+    def load(self):
+        return self.store.rows()
+
+    def record(self, accounts, deleted=(), full=False):
+        for account in accounts:
+            self.store.write(account, full)
+        for account_id in deleted:
+            self.store.remove(account_id)
+
+    def save(self, accounts):
+        # Every slot only needs bringing up to date
+        for account in accounts.values():
+            self.store.write(account, full=True)
+        self.store.flush()
+
+    def checkpoint(self, accounts, locks, background=True):
+        self.store.flush()
+        return True
+
+    def close(self):
+        self.store.close()
+
+
+# One SQLite database in WAL mode
+class SqliteBackend(StorageBackend):
+    """
+    Accounts kept in a SQLite table, one row per account.
+
+    The database runs in WAL mode, so a commit appends to the log instead
+    of rewriting pages in place, and readers never block the writer. Each
+    operation is one transaction of single-row statements: a balance
+    change is an UPDATE by primary key, and both sides of a transfer are
+    committed together or not at all. The statements are fixed SQL strings,
+    so sqlite3 prepares each one once and reuses it from its statement
+    cache. An operation costs a B-tree lookup per account, whatever the
+    size of the book.
+    """
+
+    CREATE = ("CREATE TABLE IF NOT EXISTS accounts (account_id TEXT PRIMARY KEY, "
+              "passcode TEXT NOT NULL, category TEXT NOT NULL, cents INTEGER NOT NULL) WITHOUT ROWID")
+    SELECT = "SELECT account_id, passcode, category, cents FROM accounts"
+    UPDATE_CENTS = "UPDATE accounts SET cents = ? WHERE account_id = ?"
+    UPSERT = "INSERT OR REPLACE INTO accounts (account_id, passcode, category, cents) VALUES (?, ?, ?, ?)"
+    DELETE = "DELETE FROM accounts WHERE account_id = ?"
+
+    def __init__(self, filename, synchronous="NORMAL"):
+        """
+        Args:
+            filename: Database file
+            synchronous: SQLite synchronous setting; 'NORMAL' (the default)
+                survives a crash of the program, 'FULL' also a power cut
+        """
+        import sqlite3   # Only loaded when this backend is used
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(f"PRAGMA synchronous={synchronous}")
+        self.db.execute(self.CREATE)
+
+    def load(self):
+        with self.lock:
+            return self.db.execute(self.SELECT).fetchall()
+
+    def record(self, accounts, deleted=(), full=False):
+        with self.lock:
+            cursor = self.db.cursor()
+            cursor.execute("BEGIN")
+            try:
+                for account in accounts:
+                    if not full:
+                        cursor.execute(self.UPDATE_CENTS, (account.cents, account.account_id))
+                        if cursor.rowcount:
+                            continue
+                    cursor.execute(self.UPSERT, (account.account_id, account.passcode,
+                                                 account.account_category, account.cents))
+                for account_id in deleted:
+                    cursor.execute(self.DELETE, (account_id,))
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+
+    def save(self, accounts):
+        with self.lock:
+            cursor = self.db.cursor()
+            cursor.execute("BEGIN")
+            try:
+                cursor.execute("DELETE FROM accounts")
+                cursor.executemany(self.UPSERT, ((a.account_id, a.passcode, a.account_category, a.cents)
+                                                 for a in accounts.values()))
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+
+    def checkpoint(self, accounts, locks, background=True):
+        # Folds the write-ahead log back into the database file
+        with self.lock:
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return True
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+# Storage engines BankingSystem can be asked for by name
+STORAGE_BACKENDS = {"text": TextFileBackend, "mmap": MmapBackend, "sqlite": SqliteBackend}
+
+
+# Counts and times every banking operation
+class Metrics:
+    """
+    In-process operation counters and latency histograms.
+
+    Each operation type (deposit, transfer, ...) is counted by outcome:
+    'ok', 'rejected' (the account refused it, e.g. too little money) or
+    'error' (an exception was raised). Its time is split into a
+    'compute' phase, the in-memory checks and updates, and a 'persist'
+    phase, journal and ledger writes. Each phase has a fixed-bucket
+    histogram. Recording a sample is a bisect and a few additions under
+    one lock.
+
+    stats() returns everything as a dict, and prometheus_text() renders
+    the same data in the Prometheus text exposition format.
+    """
+
+    # Histogram bucket upper bounds in seconds (5us .. 1s, then +Inf)
+    BUCKETS = (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+               0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}     # (operation, outcome) -> count
+        self.histograms = {}   # (operation, phase) -> [bucket counts, sum, count]
+
+    def count(self, operation, outcome):
+        """Add one to an operation's outcome counter."""
+        with self.lock:
+            key = (operation, outcome)
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def observe(self, operation, phase, seconds):
+        """
+        Record how long one phase of an operation took.
+
+        Args:
+            operation: Operation name, e.g. 'deposit'
+            phase: 'compute' or 'persist'
+            seconds: Duration in seconds
+        """
+        bucket = bisect.bisect_left(self.BUCKETS, seconds)
+        with self.lock:
+            histogram = self.histograms.get((operation, phase))
+            if histogram is None:
+                histogram = self.histograms[(operation, phase)] = [[0] * (len(self.BUCKETS) + 1), 0.0, 0]
+            histogram[0][bucket] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def quantile(self, buckets, count, q):
+        """Estimate a quantile from bucket counts (upper bound of its bucket)."""
+        target = q * count
+        seen = 0
+        for bound, n in zip(self.BUCKETS + (float("inf"),), buckets):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def stats(self):
+        """
+        Snapshot of all counters and histograms.
+
+        Returns:
+            dict: {operation: {"outcomes": {...}, "phases": {phase: {...}}}}
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(h[0]), h[1], h[2]) for key, h in self.histograms.items()}
+        result = {}
+        for (operation, outcome), n in counters.items():
+            result.setdefault(operation, {"outcomes": {}, "phases": {}})["outcomes"][outcome] = n
+        for (operation, phase), (buckets, total, n) in histograms.items():
+            result.setdefault(operation, {"outcomes": {}, "phases": {}})["phases"][phase] = {
+                "count": n,
+                "sum_seconds": total,
+                "mean_us": total / n * 1e6 if n else 0.0,
+                "p50_us": self.quantile(buckets, n, 0.50) * 1e6,
+                "p99_us": self.quantile(buckets, n, 0.99) * 1e6,
+                "buckets": buckets,
+            }
+        return result
+
+    def prometheus_text(self):
+        """Render every metric in the Prometheus text format."""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self.histograms.items())
+        lines = ["# HELP bank_operations_total Banking operations by outcome.",
+                 "# TYPE bank_operations_total counter"]
+        for (operation, outcome), n in counters:
+            lines.append(f'bank_operations_total{{operation="{operation}",outcome="{outcome}"}} {n}')
+        lines += ["# HELP bank_operation_seconds Time spent per operation phase.",
+                  "# TYPE bank_operation_seconds histogram"]
+        for (operation, phase), (buckets, total, n) in histograms:
+            labels = f'operation="{operation}",phase="{phase}"'
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS, buckets):
+                cumulative += count
+                lines.append(f'bank_operation_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'bank_operation_seconds_bucket{{{labels},le="+Inf"}} {n}')
+            lines.append(f"bank_operation_seconds_sum{{{labels}}} {total:.9f}")
+            lines.append(f"bank_operation_seconds_count{{{labels}}} {n}")
+        return "\n".join(lines) + "\n"
+
+    def dump_prometheus(self, path):
+        """
+        Write the Prometheus text to a file (atomically, for scrapers that
+        read node-exporter style textfile directories) or, if `path` is a
+        Unix socket, send it there.
+        """
+        text = self.prometheus_text().encode()
+        if os.path.exists(path) and not os.path.isfile(path):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(path)
+                sock.sendall(text)
+            return
+        temp_name = path + ".tmp"
+        with open(temp_name, "wb") as file:
+            file.write(text)
+        os.replace(temp_name, path)
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+# Kinds of ledger entries
+LEDGER_DEPOSIT = 1
+LEDGER_WITHDRAWAL = 2
+LEDGER_TRANSFER_OUT = 3
+LEDGER_TRANSFER_IN = 4
+LEDGER_TOP_UP = 5
+LEDGER_REFUND = 6
+
+LEDGER_KIND_NAMES = {
+    LEDGER_DEPOSIT: "deposit",
+    LEDGER_WITHDRAWAL: "withdrawal",
+    LEDGER_TRANSFER_OUT: "transfer out",
+    LEDGER_TRANSFER_IN: "transfer in",
+    LEDGER_TOP_UP: "mobile top-up",
+    LEDGER_REFUND: "refund",
+}
+
+LedgerEntry = namedtuple("LedgerEntry", "timestamp account_id kind amount counterparty balance")
+
+
+# Ledger records for one posted operation, with the balances it left behind
+def ledger_entries(kind, account, cents, recipient=None, number=None):
+    """
+    Arguments for TransactionLedger.record for one operation.
+
+    A transfer gives one entry on each side.
+
+    Returns:
+        list: (account_id, kind, cents, balance, counterparty) tuples
+    """
+    if kind == LEDGER_TRANSFER_OUT:
+        return [(account.account_id, kind, cents, account.cents, recipient.account_id),
+                (recipient.account_id, LEDGER_TRANSFER_IN, cents, recipient.cents, account.account_id)]
+    return [(account.account_id, kind, cents, account.cents, number if kind == LEDGER_TOP_UP else "")]
+
+
+# History of every posted operation, searchable per account and by time
+class TransactionLedger:
+    """
+    Append-only ledger with per-account and time indexes.
+
+    Each posted operation is one 64-byte record in the ledger file:
+        timestamp (d), kind (B), padding, amount in cents (q),
+        resulting balance in cents (q), account_id (16s), counterparty (16s)
+    The counterparty is the other account of a transfer or the phone
+    number of a top-up.
+
+    Timestamps never go backwards, so the record number doubles as a time
+    index. Per account the ledger keeps the record numbers and timestamps
+    of its entries in two typed arrays. "Last N" reads the tail of one
+    array, and a date range is two binary searches on another, so a query
+    costs O(log n + k) for k results however long the ledger gets. The
+    indexes are rebuilt by scanning the file when it is opened.
+    """
+
+    RECORD = struct.Struct("<dB7xqq16s16s")
+
+    def __init__(self, path):
+        """
+        Open (or create) a ledger file.
+
+        Args:
+            path: Location of the ledger file
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.times = array("d")          # Timestamp of every record, in file order
+        self.by_account = {}             # account_id -> (record numbers, timestamps)
+
+        self.file = open(path, "a+b")
+        size = os.path.getsize(path)
+
+        # A record cut short by a crash is dropped
+        if size % self.RECORD.size:
+            size -= size % self.RECORD.size
+            self.file.truncate(size)
+
+        self.file.seek(0)
+        number = 0
+        while True:
+            chunk = self.file.read(self.RECORD.size * 4096)
+            if not chunk:
+                break
+            for timestamp, _, _, _, account_id, _ in self.RECORD.iter_unpack(chunk):
+                self.index_record(number, timestamp, account_id.rstrip(b"\0").decode())
+                number += 1
+
+    def index_record(self, number, timestamp, account_id):
+        """Add one record to the in-memory indexes."""
+        self.times.append(timestamp)
+        entry = self.by_account.get(account_id)
+        if entry is None:
+            entry = self.by_account[account_id] = (array("q"), array("d"))
+        entry[0].append(number)
+        entry[1].append(timestamp)
+
+    def record(self, account_id, kind, amount, balance, counterparty="", timestamp=None):
+        """
+        Append one entry.
+
+        Args:
+            account_id: Account the entry belongs to
+            kind: One of the LEDGER_* kinds
+            amount: Amount moved, in cents
+            balance: Account balance after the operation, in cents
+            counterparty: Other account ID or phone number, if any
+            timestamp: Seconds since the epoch (default now)
+        """
+        with self.lock:
+            timestamp = time.time() if timestamp is None else timestamp
+            if self.times and timestamp < self.times[-1]:
+                timestamp = self.times[-1]
+            self.file.write(self.RECORD.pack(timestamp, kind, amount, balance,
+                                             account_id.encode(), str(counterparty or "").encode()))
+            self.file.flush()
+            self.index_record(len(self.times), timestamp, account_id)
+
+    def read(self, numbers):
+        """Load the given records from the file as LedgerEntry tuples."""
+        entries = []
+        fd = self.file.fileno()
+        for number in numbers:
+            timestamp, kind, amount, balance, account_id, counterparty = self.RECORD.unpack(
+                os.pread(fd, self.RECORD.size, number * self.RECORD.size))
+            entries.append(LedgerEntry(timestamp, account_id.rstrip(b"\0").decode(), kind, Money(amount),
+                                       counterparty.rstrip(b"\0").decode(), Money(balance)))
+        return entries
+
+    def last(self, account_id, count):
+        """
+        Most recent entries of one account.
+
+        Args:
+            account_id: Account to look at
+            count: Maximum number of entries
+
+        Returns:
+            list: LedgerEntry tuples, newest first
+        """
+        with self.lock:
+            numbers = self.by_account.get(account_id, (array("q"),))[0][-count:] if count > 0 else []
+            return self.read(reversed(numbers))
+
+    def statement(self, account_id, start, end):
+        """
+        Entries of one account between two times.
+
+        Args:
+            account_id: Account to look at
+            start: First timestamp to include
+            end: Timestamp to stop before
+
+        Returns:
+            list: LedgerEntry tuples, oldest first
+        """
+        with self.lock:
+            entry = self.by_account.get(account_id)
+            if entry is None:
+                return []
+            numbers, times = entry
+            first = bisect.bisect_left(times, start)
+            last = bisect.bisect_left(times, end)
+            return self.read(numbers[first:last])
+
+    def between(self, start, end):
+        """
+        Every entry of every account between two times, oldest first.
+        """
+        with self.lock:
+            first = bisect.bisect_left(self.times, start)
+            last = bisect.bisect_left(self.times, end)
+            return self.read(range(first, last))
+
+    def __len__(self):
+        return len(self.times)
+
+    def close(self):
+        """Close the ledger file."""
+        self.file.close()
+
+
+# Keeps (balance, account ID) pairs in order for ranking queries
+class SortedBalances:
+    """
+    Sorted list of (cents, account_id) pairs, split into buckets.
+
+    Each bucket is a plain sorted list of at most 2 * BUCKET pairs, and
+    maxes holds the last pair of every bucket, so finding the right bucket
+    is a bisect. Adding or removing a pair costs O(log n) comparisons plus
+    a short list shift inside one bucket. The largest pairs are read from
+    the last buckets, and a rank lookup only adds up bucket lengths.
+    """
+
+    BUCKET = 1000
+
+    def __init__(self, pairs=()):
+        pairs = sorted(pairs)
+        self.buckets = [pairs[i:i + self.BUCKET] for i in range(0, len(pairs), self.BUCKET)]
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        self.size = len(pairs)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, pair):
+        """Insert one (cents, account_id) pair."""
+        if not self.buckets:
+            self.buckets.append([pair])
+            self.maxes.append(pair)
+            self.size = 1
+            return
+        i = bisect.bisect_left(self.maxes, pair)
+        if i == len(self.buckets):
+            i -= 1
+        bucket = self.buckets[i]
+        bisect.insort(bucket, pair)
+        self.maxes[i] = bucket[-1]
+        self.size += 1
+
+        # Split buckets that got too long so inserts stay cheap
+        if len(bucket) > 2 * self.BUCKET:
+            self.buckets[i:i + 1] = [bucket[:self.BUCKET], bucket[self.BUCKET:]]
+            self.maxes[i:i + 1] = [bucket[self.BUCKET - 1], bucket[-1]]
+
+    def remove(self, pair):
+        """Remove one pair, which must be present."""
+        i = bisect.bisect_left(self.maxes, pair)
+        bucket = self.buckets[i]
+        del bucket[bisect.bisect_left(bucket, pair)]
+        self.size -= 1
+        if bucket:
+            self.maxes[i] = bucket[-1]
+        else:
+            del self.buckets[i]
+            del self.maxes[i]
+
+    def largest(self, count):
+        """The count largest pairs, biggest first."""
+        found = []
+        for bucket in reversed(self.buckets):
+            for pair in reversed(bucket):
+                if len(found) == count:
+                    return found
+                found.append(pair)
+        return found
+
+    def at(self, rank):
+        """The pair at position rank (0 is the smallest)."""
+        for bucket in self.buckets:
+            if rank < len(bucket):
+                return bucket[rank]
+            rank -= len(bucket)
+        raise IndexError(rank)
+
+
+# Book-wide totals kept up to date as accounts change
+# Committed balances of a columnar book, kept by table row instead of by ID
+class TableBalances:
+    """
+    Last committed category and balance of every account in an AccountTable.
+
+    Works like the account_id -> (category, cents) dict BookAggregates
+    keeps for an ordinary book, but stores a category code and a balance
+    per table row in two flat arrays and finds rows through the table's
+    own hash index. That costs 9 bytes per account instead of a dict
+    entry, a key string and a tuple.
+
+    Rows only ever grow, so a row number stays valid until the book is
+    loaded again. Accounts must be committed as deleted before their row
+    is removed from the table, as delete_account does; sync() finds any
+    that were removed without that.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.codes = array("b", table.categories)   # 0 means not in the committed book
+        self.cents = array("q", table.cents)
+        self.count = len(self.codes) - self.codes.count(0)
+        self.orphans = {}   # key -> row of committed accounts already gone from the table
+
+    def row(self, account_id):
+        # Committed row of an account, or -1
+        row = self.table.find_row(account_id)
+        if row < 0:
+            key = self.table.key(account_id)
+            row = self.orphans.get(key, -1) if self.orphans and key is not None else -1
+        return row if 0 <= row < len(self.codes) and self.codes[row] else -1
+
+    def get(self, account_id, default=None):
+        row = self.row(account_id)
+        return (CATEGORY_NAMES[self.codes[row]], self.cents[row]) if row >= 0 else default
+
+    def __setitem__(self, account_id, entry):
+        row = self.table.find_row(account_id)
+        if row < 0:
+            raise KeyError(account_id)
+        grow = row + 1 - len(self.codes)
+        if grow > 0:
+            self.codes.extend(bytes(grow))
+            self.cents.extend(array("q", bytes(8 * grow)))
+        self.count += not self.codes[row]
+        self.codes[row] = CATEGORY_CODES.get(entry[0], 2)
+        self.cents[row] = entry[1]
+
+    def pop(self, account_id, default=None):
+        row = self.row(account_id)
+        if row < 0:
+            return default
+        entry = (CATEGORY_NAMES[self.codes[row]], self.cents[row])
+        self.codes[row] = 0
+        self.cents[row] = 0
+        self.count -= 1
+        self.orphans.pop(self.table.ids[row], None)
+        return entry
+
+    def missing(self):
+        """IDs of committed accounts whose rows have since been removed from the table."""
+        categories, ids = self.table.categories, self.table.ids
+        self.orphans = {ids[row]: row for row, code in enumerate(self.codes) if code and not categories[row]}
+        return [str(key) for key in self.orphans]
+
+    def __contains__(self, account_id):
+        return self.row(account_id) >= 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        ids = self.table.ids
+        return (str(ids[row]) for row, code in enumerate(self.codes) if code)
+
+    def items(self):
+        ids, cents = self.table.ids, self.cents
+        return ((str(ids[row]), (CATEGORY_NAMES[code], cents[row])) for row, code in enumerate(self.codes) if code)
+
+    def values(self):
+        cents = self.cents
+        return ((CATEGORY_NAMES[code], cents[row]) for row, code in enumerate(self.codes) if code)
+
+
+class BookAggregates:
+    """
+    Running report figures for the whole book.
+
+    Keeps the total balance, the balance and account count per category,
+    and every balance in a SortedBalances for top-N and percentile
+    queries (sorted on the first such query, then kept in order).
+    BankingSystem passes each account it saves to update() and
+    each deleted ID to remove(), so a report never has to scan the book.
+    The last balance seen for every account is remembered (by table row,
+    in a TableBalances, for a columnar book), which is how an update knows
+    what to take away before adding the new figure.
+
+    Those remembered balances are also the committed state of the book,
+    and every commit gets a new version number. While a ReadSnapshot is
+    open, a commit keeps the figures it replaces in a short per-account
+    version chain, so the snapshot keeps seeing the book as it was. Old
+    versions are dropped as soon as no open snapshot can need them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = 0          # Bumped by every commit
+        self.readers = {}         # Version -> number of open snapshots taken at it
+        self.history = {}         # account_id -> [(replaced at version, old entry or None)], oldest first
+        self.retired = deque()    # (replaced at version, account_id) in commit order, for reclaiming
+        self.rebuild({})
+
+    def rebuild(self, accounts):
+        """
+        Start over from a full book, e.g. right after loading.
+
+        Args:
+            accounts: Dict of accounts or an AccountTable
+        """
+        with self.lock:
+            # account_id -> (category, cents) as last counted; a table keeps them by row instead
+            if isinstance(accounts, AccountTable):
+                self.balances = TableBalances(accounts)
+            else:
+                self.balances = {a.account_id: (a.account_category, a.cents) for a in accounts.values()}
+            self.sums = {name: 0 for name in CATEGORY_CODES}
+            self.counts = {name: 0 for name in CATEGORY_CODES}
+            for category in set(category for category, _ in self.balances.values()):
+                group = [cents for name, cents in self.balances.values() if name == category]
+                self.sums[category] = sum(group)
+                self.counts[category] = len(group)
+            self.total = sum(self.sums.values())
+            self.ordered = None      # SortedBalances, built by the first ranking query
+            self.version += 1
+
+    def update(self, accounts):
+        """Count the current balance of each account, new or changed."""
+        self.commit(accounts)
+
+    def remove(self, account_ids):
+        """Stop counting deleted accounts."""
+        self.commit(deleted=account_ids)
+
+    def commit(self, accounts=(), deleted=()):
+        """
+        Count changed and deleted accounts as one new version of the book.
+
+        Args:
+            accounts: Accounts whose current balance should be counted
+            deleted: IDs of accounts that were removed
+        """
+        with self.lock:
+            version = self.version + 1
+            keep = bool(self.readers)   # Old figures are only kept while someone may read them
+            for account in accounts:
+                account_id = account.account_id
+                entry = (account.account_category, account.cents)
+                old = self.balances.get(account_id)
+                if old == entry:
+                    continue
+                if keep:
+                    self.retain(account_id, old, version)
+                if old is not None:
+                    self.forget(account_id, old)
+                self.balances[account_id] = entry
+                self.sums[entry[0]] = self.sums.get(entry[0], 0) + entry[1]
+                self.counts[entry[0]] = self.counts.get(entry[0], 0) + 1
+                self.total += entry[1]
+                if self.ordered is not None:
+                    self.ordered.add((entry[1], account_id))
+            for account_id in deleted:
+                old = self.balances.pop(account_id, None)
+                if old is not None:
+                    if keep:
+                        self.retain(account_id, old, version)
+                    self.forget(account_id, old)
+            self.version = version
+
+    def forget(self, account_id, entry):
+        # Takes one account's old figures back out; the caller holds the lock
+        self.sums[entry[0]] -= entry[1]
+        self.counts[entry[0]] -= 1
+        self.total -= entry[1]
+        if self.ordered is not None:
+            self.ordered.remove((entry[1], account_id))
+
+    def retain(self, account_id, entry, version):
+        # Keeps the figures a commit replaces for open snapshots; the caller holds the lock
+        self.history.setdefault(account_id, []).append((version, entry))
+        self.retired.append((version, account_id))
+
+    def sync(self, accounts):
+        """
+        Catch up with changes that were never saved one by one.
+
+        Only accounts whose balance differs are touched, so this costs one
+        dict lookup per account when everything is already up to date.
+
+        Args:
+            accounts: Mapping of every account in the book
+        """
+        deleted = ()
+        if isinstance(self.balances, TableBalances):
+            deleted = self.balances.missing()
+        elif len(self.balances) != len(accounts):
+            deleted = [account_id for account_id in list(self.balances) if account_id not in accounts]
+        self.commit(accounts.values(), deleted)
+
+    def snapshot(self):
+        """
+        Open a consistent read-only view of the committed book.
+
+        Taking a snapshot only notes the current version, so it costs the
+        same whatever the size of the book. Close it when done (or use it
+        as a context manager) so the versions it holds can be dropped.
+
+        Returns:
+            ReadSnapshot: View of the book as of now
+        """
+        with self.lock:
+            version = self.version
+            self.readers[version] = self.readers.get(version, 0) + 1
+        return ReadSnapshot(self, version)
+
+    def release(self, version):
+        # Called when a snapshot closes; drops every old version no open snapshot can reach
+        with self.lock:
+            if self.readers[version] > 1:
+                self.readers[version] -= 1
+                return
+            del self.readers[version]
+            if not self.readers:
+                self.history.clear()
+                self.retired.clear()
                 return
+            oldest = min(self.readers)
+            retired, history = self.retired, self.history
+            while retired and retired[0][0] <= oldest:
+                _, account_id = retired.popleft()
+                chain = history[account_id]
+                del chain[0]
+                if not chain:
+                    del history[account_id]
+
+    def entry_at(self, account_id, version):
+        # (category, cents) of an account as of a version, or None; the caller holds the lock
+        for replaced, old in self.history.get(account_id, ()):
+            if replaced > version:
+                return old
+        return self.balances.get(account_id)
+
+    def committed_balance(self, account_id):
+        """Last committed balance of an account in cents, or None if it isn't in the book."""
+        entry = self.balances.get(account_id)
+        return None if entry is None else entry[1]
+
+    def category_totals(self):
+        """Total balance in cents and account count per category."""
+        with self.lock:
+            return {name: [self.sums[name], self.counts[name]] for name in self.sums}
+
+    def ranked(self):
+        # Sorting every balance is only worth it once someone asks for a ranking,
+        # so loading a book stays cheap; the caller holds the lock
+        if self.ordered is None:
+            self.ordered = SortedBalances([(cents, account_id) for account_id, (_, cents) in self.balances.items()])
+        return self.ordered
+
+    def top(self, count):
+        """The count largest balances as (account_id, cents), biggest first."""
+        with self.lock:
+            return [(account_id, cents) for cents, account_id in self.ranked().largest(count)]
+
+    def percentile(self, q):
+        """
+        Balance in cents at quantile q (0 to 1), by nearest rank.
+
+        Returns:
+            int: The balance, or None for an empty book
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("Percentile must be between 0 and 1")
+        with self.lock:
+            ordered = self.ranked()
+            if not len(ordered):
+                return None
+            rank = max(0, math.ceil(q * len(ordered)) - 1)
+            return ordered.at(rank)[0]
+
+
+# A frozen view of the committed book for balance checks and long reports
+class ReadSnapshot:
+    """
+    Consistent view of every balance as of one version of the book.
+
+    Reads come from BookAggregates' committed figures and version chains,
+    never from the live accounts, so a scan neither sees half-applied
+    transfers nor stops writers. Scans read in chunks of CHUNK accounts,
+    taking the aggregates lock only briefly for each chunk.
+    """
+
+    CHUNK = 1024
+
+    def __init__(self, aggregates, version):
+        self.aggregates = aggregates
+        self.version = version
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release the snapshot so the versions it kept can be reclaimed."""
+        if not self.closed:
+            self.closed = True
+            self.aggregates.release(self.version)
+
+    def check_open(self):
+        if self.closed:
+            raise ValueError("Snapshot is closed")
+
+    def get(self, account_id):
+        """
+        Category and balance of one account in this snapshot.
+
+        Returns:
+            tuple: (category, cents), or None if the account didn't exist
+        """
+        self.check_open()
+        with self.aggregates.lock:
+            return self.aggregates.entry_at(account_id, self.version)
+
+    def balance(self, account_id):
+        """
+        Balance of one account in this snapshot.
+
+        Returns:
+            Money: The balance, or None if the account didn't exist
+        """
+        entry = self.get(account_id)
+        return None if entry is None else Money(entry[1])
+
+    def items(self):
+        """Yield (account_id, category, cents) for every account in the snapshot."""
+        self.check_open()
+        aggregates = self.aggregates
+        with aggregates.lock:
+            account_ids = list(aggregates.balances)
+            account_ids.extend(a for a in aggregates.history if a not in aggregates.balances)
+        for start in range(0, len(account_ids), self.CHUNK):
+            with aggregates.lock:
+                rows = [(account_id, aggregates.entry_at(account_id, self.version))
+                        for account_id in account_ids[start:start + self.CHUNK]]
+            for account_id, entry in rows:
+                if entry is not None:
+                    yield account_id, entry[0], entry[1]
+
+    def total_funds(self):
+        """Sum of all balances in the snapshot, as Money."""
+        return Money(sum(cents for _, _, cents in self.items()))
+
+    def category_totals(self):
+        """
+        Total balance and number of accounts per category in the snapshot.
+
+        Returns:
+            dict: Category name -> (Money total, account count)
+        """
+        totals = {name: [0, 0] for name in CATEGORY_CODES}
+        for _, category, cents in self.items():
+            figures = totals.setdefault(category, [0, 0])
+            figures[0] += cents
+            figures[1] += 1
+        return {name: (Money(cents), count) for name, (cents, count) in totals.items()}
+
+
+# Operation codes and per-row results used by bulk batches
+OPERATION_CODES = {"deposit": 1, "withdraw": 2, "transfer": 3, "topup": 4, "refund": 5}
+OPERATION_NAMES = {code: name for name, code in OPERATION_CODES.items()}
+
+BATCH_OK = 0
+BATCH_INVALID_AMOUNT = 1
+BATCH_INSUFFICIENT_FUNDS = 2
+BATCH_UNKNOWN_ACCOUNT = 3
+BATCH_UNKNOWN_RECIPIENT = 4
+BATCH_INVALID_NUMBER = 5
+BATCH_INVALID_OPERATION = 6
+BATCH_SAME_ACCOUNT = 7
+BATCH_LIMIT_EXCEEDED = 8
+
+# Operation name used in metrics for each menu choice
+CHOICE_NAMES = {"1": "balance", "2": "deposit", "3": "withdraw", "4": "transfer", "5": "topup", "6": "delete"}
+
+# Ledger kind written for each menu choice and batch operation code
+CHOICE_LEDGER_KINDS = {"2": LEDGER_DEPOSIT, "3": LEDGER_WITHDRAWAL, "4": LEDGER_TRANSFER_OUT, "5": LEDGER_TOP_UP}
+BATCH_LEDGER_KINDS = {1: LEDGER_DEPOSIT, 2: LEDGER_WITHDRAWAL, 3: LEDGER_TRANSFER_OUT, 4: LEDGER_TOP_UP,
+                      5: LEDGER_REFUND}
+
+BATCH_STATUS_NAMES = {
+    BATCH_OK: "ok",
+    BATCH_INVALID_AMOUNT: "invalid amount",
+    BATCH_INSUFFICIENT_FUNDS: "insufficient funds",
+    BATCH_UNKNOWN_ACCOUNT: "unknown account",
+    BATCH_UNKNOWN_RECIPIENT: "unknown recipient",
+    BATCH_INVALID_NUMBER: "invalid phone number",
+    BATCH_INVALID_OPERATION: "invalid operation",
+    BATCH_SAME_ACCOUNT: "same account",
+    BATCH_LIMIT_EXCEEDED: "limit exceeded",
+}
+
+
+class OperationBatch:
+    """
+    Column-oriented list of bulk operations.
+
+    Operation codes and amounts (in cents) live in typed arrays, and
+    account IDs and targets (recipient ID or phone number) in parallel
+    lists, so millions of rows take far less memory than one tuple per row.
+    """
+
+    # Binary layout: magic, then one fixed-width record per operation
+    MAGIC = b"NKOP2\0\0\0"
+    RECORD = struct.Struct("<B7x16sq16s")
+
+    def __init__(self):
+        self.codes = array("b")
+        self.amounts = array("q")
+        self.account_ids = []
+        self.targets = []
+
+    def __len__(self):
+        return len(self.codes)
+
+    def add(self, operation, account_id, amount, target=""):
+        """
+        Append one operation.
+
+        Args:
+            operation: 'deposit', 'withdraw', 'transfer' or 'topup'
+            account_id: Account the operation runs against
+            amount: Amount of money involved
+            target: Recipient ID for transfers, phone number for top-ups
+        """
+        self.codes.append(OPERATION_CODES.get(operation, 0))
+        self.amounts.append(Money.to_cents(amount))
+        self.account_ids.append(account_id)
+        self.targets.append(target or "")
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a batch from (operation, account_id, amount[, target]) rows."""
+        batch = cls()
+        for row in rows:
+            batch.add(*row)
+        return batch
+
+    @classmethod
+    def read(cls, path):
+        """
+        Read operations from a CSV or binary operations file.
+
+        CSV rows look like 'operation,account_id,amount,target'. A file
+        that starts with the binary magic is read as fixed-width records.
+
+        Args:
+            path: Operations file
+
+        Returns:
+            OperationBatch: The operations in file order
+        """
+        batch = cls()
+        with open(path, "rb") as file:
+            head = file.read(len(cls.MAGIC))
+            if head == cls.MAGIC:
+                for code, account_id, amount, target in cls.RECORD.iter_unpack(file.read()):
+                    batch.codes.append(code)
+                    batch.amounts.append(amount)
+                    batch.account_ids.append(account_id.rstrip(b"\0").decode())
+                    batch.targets.append(target.rstrip(b"\0").decode())
+                return batch
+
+        with open(path, newline="") as file:
+            for row in csv.reader(file):
+                if not row or row[0].startswith("#"):
+                    continue
+                try:
+                    amount = Money(Money.parse(row[2]))
+                except (IndexError, ValueError):
+                    amount = 0
+                batch.add(row[0].strip().lower(), row[1].strip() if len(row) > 1 else "",
+                          amount, row[3].strip() if len(row) > 3 else "")
+        return batch
+
+    def write(self, path):
+        """
+        Save the batch in the binary operations format.
+
+        Args:
+            path: Destination file
+        """
+        with open(path, "wb") as file:
+            file.write(self.MAGIC)
+            for i in range(len(self.codes)):
+                file.write(self.RECORD.pack(self.codes[i], self.account_ids[i].encode(),
+                                            self.amounts[i], self.targets[i].encode()))
+
+
+# Class made to handle all the banks 
+class BankingSystem:
+
+    def __init__(self, filename = "accounts.txt", compact_every=10000, storage="text",
+                 group_commit=False, commit_window=0.002, commit_batch=64, id_width=5,
+                 workers=8, table="dict", ledger=False, metrics=True,
+                 hash_passcodes=None, passcode_iterations=PASSCODE_ITERATIONS,
+                 session_ttl=900, max_sessions=100000, load_workers=None, velocity_limits=None):
+        """
+        Initialize banking system.
+        
+        Args:
+            filename: Account data storage file (default 'accounts.txt')
+            compact_every: Journal records to collect before a background
+                checkpoint compacts them (default 10000)
+            storage: 'text' for the accounts file plus journal, 'mmap' for
+                the fixed-width binary store, 'sqlite' for a SQLite database,
+                or any StorageBackend instance (default 'text')
+            group_commit: fsync journal records from concurrent callers in
+                shared batches (default False)
+            commit_window: Seconds a group-commit batch waits to fill up
+            commit_batch: Records that close a group-commit batch early
+            id_width: Number of digits in new account IDs (default 5)
+            workers: Threads used by submit() and run_parallel() (default 8)
+            table: 'dict' for one object per account, or 'columnar' for the
+                array-backed AccountTable (default 'dict')
+            load_workers: Processes that parse a large accounts file
+                (text storage; default one per core)
+            velocity_limits: Spending limits per category, as a dict like
+                VELOCITY_LIMITS or a VelocityLimits (default None, no limits)
+            hash_passcodes: Store passcodes as salted hashes. None (the
+                default) follows the book: hashed if it already holds
+                hashes. True migrates a plain book on the spot, since one
+                book never mixes the two kinds
+            passcode_iterations: PBKDF2 rounds for new hashes
+
+        Raises:
+            ValueError: If hash_passcodes is False for a hashed book
+        """
+
+        # Starts up the banking system nd loads existing accounts
+        self.filename = filename
+        self.compact_every = compact_every
+        if table not in ("dict", "columnar"):
+            raise ValueError(f"Unknown table type: {table}")
+        self.columnar = table == "columnar"
+        self.id_allocator = AccountIdAllocator(filename + ".ids", id_width)
+        self.locks = AccountLocks()
+        self.workers = workers
+        self.executor = None   # Thread pool, created on first use
+        self.ledger = TransactionLedger(filename + ".ledger") if ledger else None
+        self.metrics = Metrics() if metrics else None
+        self.passcode_iterations = passcode_iterations
+        self.sessions = SessionManager(session_ttl, max_sessions)
+        self.profiler = None          # cProfile.Profile while profiling is switched on
+        self.profile_every = 1        # Profile one in this many operations
+        self.profile_lock = threading.Lock()
+        self.operations_seen = 0
+        self.aggregates = BookAggregates()
+        if isinstance(velocity_limits, dict):
+            velocity_limits = VelocityLimits(velocity_limits)
+        self.limits = velocity_limits
+
+        # Picks the storage engine and loads the existing accounts from it
+        if isinstance(storage, StorageBackend):
+            self.backend = storage
+        elif storage == "text":
+            self.backend = TextFileBackend(filename, group_commit, commit_window, commit_batch, load_workers)
+        elif storage in STORAGE_BACKENDS:
+            self.backend = STORAGE_BACKENDS[storage](filename)
+        else:
+            raise ValueError(f"Unknown storage type: {storage}")
+        self.journal = getattr(self.backend, "journal", None)   # Text backend only
+        self.store = getattr(self.backend, "store", None)       # Binary store only
+        self.accounts = self.load_accounts()  # Gets all the saved account
+
+        # Report figures start from the loaded book; record_changes keeps them current
+        self.aggregates.rebuild(self.accounts)
+
+        # Hashing is a setting of the book, read from the passcodes it holds, so a
+        # migrated book keeps hashing new accounts whatever later runs pass in
+        hashed, plain = self.passcode_kinds()
+        if hash_passcodes is None:
+            hash_passcodes = hashed
+        elif not hash_passcodes and hashed:
+            self.close()
+            raise ValueError("This book stores hashed passcodes and can't take plain ones")
+        self.hash_passcodes = hash_passcodes
+        if hash_passcodes and plain:
+            self.rehash_passcodes()
+
+
+    # Whether the book holds any hashed and any plain passcodes
+    def passcode_kinds(self):
+        if self.columnar:
+            passcodes = map(self.accounts.passcodes.__getitem__, self.accounts.live_rows())
+        else:
+            passcodes = (account.passcode for account in self.accounts.values())
+        hashed = plain = False
+        for passcode in passcodes:
+            if is_hashed_passcode(passcode):
+                hashed = True
+            else:
+                plain = True
+            if hashed and plain:
+                break
+        return hashed, plain
+
+
+    def load_accounts(self):
+
+        # Loads account from the storage backend when the systems starts
+        
+        accounts = {} # Creates a dictionary where each account is stored with its ID as the key
+        if self.columnar:
+            accounts = AccountTable()
+
+        for row in self.backend.load():
+
+            # A whole parsed chunk of the book at once
+            if isinstance(row, AccountColumns):
+                self.merge_columns(accounts, row)
+                continue
+            account_id, passcode, account_category, cents = row
+
+            # Accounts deleted after the last full save come back as empty rows
+            if passcode is None:
+                accounts.pop(account_id, None)
+
+            # The columnar table takes the fields as they are, no object needed
+            elif self.columnar:
+                accounts.add(account_id, passcode, account_category, cents)
+
+            # Creates appriopriate account type and stores it with ID as key
+            elif account_category == "Personal":
+                accounts[account_id] = PersonalAccount(account_id, passcode, Money(cents))
+            else:
+                accounts[account_id] = BusinessAccount(account_id, passcode, Money(cents))
+        return accounts
+
+
+
+    # Adds a chunk from the parallel loader to the accounts being loaded
+    def merge_columns(self, accounts, columns):
+        if self.columnar:
+            accounts.extend(columns)
+            return
+        for account_id, passcode, code, cents in zip(*columns):
+            if code == 1:
+                accounts[account_id] = PersonalAccount(account_id, passcode, Money(cents))
+            else:
+                accounts[account_id] = BusinessAccount(account_id, passcode, Money(cents))
+
+
+    
+    # Saves all accounts to the file as a full snapshot
+
+    def save_accounts(self):
+
+        # Nobody may change an account while the whole book is written
+        started = time.perf_counter()
+        with self.locks.holding_all():
+            self.aggregates.sync(self.accounts)
+            self.backend.save(self.accounts)
+        if self.metrics is not None:
+            self.metrics.count("save_accounts", "ok")
+            self.metrics.observe("save_accounts", "persist", time.perf_counter() - started)
+
+
+    # Compacts what the backend has recorded without holding up transactions for long
+    def checkpoint(self, background=True):
+        """
+        Compact the changes recorded since the last full save.
+
+        For the text backend this writes a binary snapshot and drops the
+        journal it covers (see TextFileBackend.checkpoint); the binary
+        store is flushed and SQLite checkpoints its write-ahead log.
+
+        Args:
+            background: Do the slow part on a separate thread (default True)
+
+        Returns:
+            bool: False if another checkpoint is still being written
+        """
+        return self.backend.checkpoint(self.accounts, self.locks, background)
+
+
+    # Waits for a background checkpoint to be written
+    def wait_for_checkpoint(self):
+        """Block until any running checkpoint has finished."""
+        self.backend.wait_for_checkpoint()
+
+
+    # Writes the new state of the changed accounts to the storage backend
+    def record_changes(self, accounts=(), deleted=(), full=False):
+        """
+        Persist a single operation as one atomic change.
+
+        Args:
+            accounts: Accounts whose current state should be recorded
+            deleted: IDs of accounts that were removed
+            full: More than the balance changed, e.g. a new passcode
+        """
+        self.aggregates.commit(accounts, deleted)
+        self.backend.record(accounts, deleted, full)
+
+
+    # Checkpoints the book once the journal gets long
+    def maybe_compact(self):
+        """
+        Start a background checkpoint when the backend has recorded compact_every changes.
+
+        Must be called without holding any account locks.
+        """
+        if self.backend.needs_checkpoint(self.compact_every):
+            self.checkpoint()
+
+
+    
+    # Releases the open data files
+    def close(self):
+        """Close the storage backend and the ledger."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.backend.close()
+        if self.ledger is not None:
+            self.ledger.close()
+
+
+    # Makes a new personal and business account
+
+    def create_account(self, account_type):
+        """
+        Create new bank account.
+        
+        Args:
+            account_type: 'Personal' or 'Business'
             
-            # Handles the deposit
-            if choice == "2":
-                amount = simpledialog.askfloat("Deposit", "Enter amount to deposit:", minvalue=0.01)
-                if amount is None: return
-                result = self.system.process_User_Input(self.account, choice, amount=amount)
+        Returns:
+            BankAccount: Newly created account
+        """
 
-            # Handles the withdrawls
-            elif choice == "3":
-                amount = simpledialog.askfloat("Withdraw", "Enter amount to withdraw:", minvalue=0.01)
-                if amount is None: return
-                result = self.system.process_User_Input(self.account, choice, amount=amount)
+        return self.create_accounts(account_type, 1)[0]
+
+
+    # Makes an account and also hands back its passcode to show to the customer
+    def open_account(self, account_type):
+        """
+        Create a new bank account and return it with its passcode.
+
+        When passcodes are hashed, the account only keeps the hash, so
+        this is the one place the plain passcode can be read.
+
+        Args:
+            account_type: 'Personal' or 'Business'
+
+        Returns:
+            tuple: (BankAccount, plain passcode)
+        """
+        return self.create_accounts(account_type, 1, with_passcodes=True)[0]
 
 
-            # Handles the transfer
+    # Makes many accounts of one type at once, e.g. for onboarding a company
+    def create_accounts(self, account_type, count, with_passcodes=False):
+        """
+        Create several new bank accounts with a single save.
+
+        Args:
+            account_type: 'Personal' or 'Business'
+            count: Number of accounts to create
+            with_passcodes: Return (account, plain passcode) pairs instead of
+                just the accounts
+
+        Returns:
+            list: Newly created accounts
+        """
+
+        # Get unique account IDs from the allocator and a 4-digit passwords each
+        account_ids = self.id_allocator.allocate_many(count, self.accounts.__contains__)
+        passcodes = [str(1000 + secrets.randbelow(9000)) for _ in account_ids]
+        stored = passcodes
+        if self.hash_passcodes:
+            stored = [hash_passcode(p, self.passcode_iterations) for p in passcodes]
+        created = []
+        with self.locks.holding(*account_ids):
+            for account_id, passcode in zip(account_ids, stored):
+
+                # Create a account type
+                if account_type == "Personal":
+                    account = PersonalAccount(account_id, passcode)
+                else:
+                    account = BusinessAccount(account_id, passcode)
+
+                # Add a new account to system (a columnar table hands back its own view)
+                self.accounts[account_id] = account
+                created.append(self.accounts[account_id])
+
+            # Save them all together
+            persist_started = time.perf_counter()
+            self.record_changes(created)
+            if self.metrics is not None:
+                self.metrics.count("create", "ok")
+                self.metrics.observe("create", "persist", time.perf_counter() - persist_started)
+
+        # Return the new accounts
+        self.maybe_compact()
+        if with_passcodes:
+            return list(zip(created, passcodes))
+        return created
+
+
+    # Checks if the login details are correct
+    def login(self, account_id, passcode):
+        """
+        Authenticate user credentials.
+        
+        Args:
+            account_id: Account number
+            passcode: Account PIN
+            
+        Returns:
+            BankAccount: Authenticated account object
+            
+        Raises:
+            ValueError: If authentication fails
+        """
+
+        # Check if the account exists or not
+        account = self.accounts.get(account_id)
+
+        # Verify of the passwords matches or not
+        if account and account.check_passcode(passcode):
+            return account
+        
+        # If either checks, it fails        
+        raise ValueError("Account number or password is not recognized")
+
+
+    # Logs in once and hands back a token for the following requests
+    def open_session(self, account_id, passcode):
+        """
+        Verify credentials once and start a session.
+
+        Args:
+            account_id: Account number
+            passcode: Account PIN
+
+        Returns:
+            str: Session token for authenticate()
+
+        Raises:
+            ValueError: If authentication fails
+        """
+        account = self.login(account_id, passcode)
+        return self.sessions.issue(account.account_id)
+
+
+    # Finds the account behind a session token without re-checking the passcode
+    def authenticate(self, token):
+        """
+        Look up the account of a session.
+
+        Args:
+            token: Token from open_session()
+
+        Returns:
+            BankAccount: The session's account
+
+        Raises:
+            ValueError: If the token is unknown, expired or its account is gone
+        """
+        account_id = self.sessions.lookup(token)
+        account = self.accounts.get(account_id) if account_id is not None else None
+        if account is None:
+            raise ValueError("Session is invalid or has expired")
+        return account
+
+
+    # Ends a session
+    def close_session(self, token):
+        """Forget a session token."""
+        self.sessions.revoke(token)
+
+
+    # Replaces every plain passcode with a hash and saves the book
+    def rehash_passcodes(self):
+        """
+        Migrate plain passcodes (e.g. from an old accounts.txt) to hashes.
+
+        From then on the book counts as hashed, so every later run hashes
+        the passcodes of new accounts too.
+
+        Returns:
+            int: Number of passcodes that were hashed
+        """
+        changed = 0
+        with self.locks.holding_all():
+            for account in self.accounts.values():
+                if not is_hashed_passcode(account.passcode):
+                    account.passcode = hash_passcode(account.passcode, self.passcode_iterations)
+                    changed += 1
+            if changed:
+                self.backend.save(self.accounts)
+        self.hash_passcodes = True
+        return changed
+
+
+    # Removes an account from the system
+    def delete_account(self, account_id):
+        """
+        Permanently remove account.
+        
+        Args:
+            account_id: Account number to delete
+            
+        Raises:
+            ValueError: If account doesn't exist
+        """
+
+        with self.locks.holding(account_id):
+
+            # Check if the account exists
+            if account_id not in self.accounts:
+                raise ValueError("Account does not exist")
+
+            # Update the file, then remove from the memory (a columnar book finds its
+            # committed figures through the account's row, so that goes last)
+            self.record_changes(deleted=[account_id])
+            del self.accounts[account_id]
+        self.sessions.revoke_account(account_id)
+        self.maybe_compact()
+
+
+
+    # Handles whatever action the user want to do
+
+    def process_User_Input(self, account, choice, amount=None, recipient_id=None, number=None):
+        """
+        Execute user-selected banking operation.
+        
+        Args:
+            account (BankAccount): Source account
+            choice: Menu selection (1-6)
+            amount: Transaction amount
+            recipient_id: Target account ID
+            number: Mobile number
+            
+        Returns:
+            Operation result message
+            
+        Raises:
+            Invalid_Menu_Choice_Exception: For invalid menu selections
+            Invalid_Transfer_Exception: For failed transfers
+            ValueError: If the account has been deleted
+        """
+        if self.metrics is None and self.profiler is None:
+            return self.run_choice(account, choice, amount, recipient_id, number)[0]
+
+        # Measure the operation, and profile it when profiling is switched on
+        operation = CHOICE_NAMES.get(choice, "invalid")
+        profiler = self.start_profiling_sample()
+        started = time.perf_counter()
+        try:
+            result, changed, persist_seconds = self.run_choice(account, choice, amount, recipient_id, number)
+        except Exception:
+            if self.metrics is not None:
+                self.metrics.count(operation, "error")
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self.profile_lock.release()
+
+        if self.metrics is not None:
+            elapsed = time.perf_counter() - started
+            self.metrics.count(operation, "ok" if changed else "rejected")
+            self.metrics.observe(operation, "compute", elapsed - persist_seconds)
+            if persist_seconds:
+                self.metrics.observe(operation, "persist", persist_seconds)
+        return result
+
+
+    # Does the work behind process_User_Input
+    def run_choice(self, account, choice, amount, recipient_id, number):
+        """
+        Carry out one menu choice.
+
+        Returns:
+            tuple: (result message, whether anything changed, seconds spent saving)
+        """
+        
+        # Every money operation needs an amount to work with
+        if choice in ("2", "3", "4", "5") and amount is None:
+            raise TypeError("An amount is required for this operation")
+
+        # Checks the balance of the account, as last committed, so it never waits for a writer
+        if choice == "1":
+            if account.account_id not in self.accounts:
+                raise ValueError("Account does not exist")
+            cents = self.aggregates.committed_balance(account.account_id)
+            balance = account.funds if cents is None else Money(cents)
+            return f"Your balance is {balance}", True, 0.0
+
+        # Deletes an account (delete_account records it itself)
+        elif choice == "6":
+            self.delete_account(account.account_id)
+            return "Account successfully deleted.", True, 0.0
+
+        # Invaild choice
+        elif choice not in ("2", "3", "4", "5"):
+            raise Invalid_Menu_Choice_Exception("Invalid menu choice")
+
+        # Money operations lock every account they touch until they are saved
+        persist_seconds = 0.0
+        with self.locks.holding(account.account_id, recipient_id if choice == "4" else None):
+
+            # The caller's object may belong to an account deleted since, which must stay deleted
+            account = self.accounts.get(account.account_id)
+            if account is None:
+                raise ValueError("Account does not exist")
+
+            # Balances before the operation, to see what it changed
+            before = account.cents
+            recipient = None
+
+            # First check if the recipient exist
+            if choice == "4":
+                recipient = self.accounts.get(recipient_id)
+                if recipient is None:
+                    raise Invalid_Transfer_Exception("Recipient account does not exist.")
+
+            # Money going out has to stay within the category's velocity limits
+            if choice != "2" and not self.within_limits(account, amount):
+                result = "This would exceed the account's spending limit. Please try a smaller amount later."
+
+            # Deposit the money to the account
+            elif choice == "2":
+                result = account.deposit(amount)
+            
+            # Withdrw the money from the account
+            elif choice == "3":
+                result = account.withdraw(amount)
+
+            # Transfer the momney from the account
             elif choice == "4":
-                recipient_id = simpledialog.askstring("Transfer", "Enter recipient account ID:")
-                if recipient_id is None: return
-                amount = simpledialog.askfloat("Transfer", "Enter amount to transfer:", minvalue=0.01)
-                if amount is None: return
-                result = self.system.process_User_Input(self.account, choice, amount=amount, recipient_id=recipient_id)
-
-            # Handles the mobile top-up
-            elif choice == "5":
-                number = simpledialog.askstring("Mobile Top-Up", "Enter mobile number (8 digits):")
-                if number is None: return
-                amount = simpledialog.askfloat("Mobile Top-Up", "Enter top-up amount:", minvalue=0.01)
-                if amount is None: return
-                result = self.system.process_User_Input(self.account, choice, number=number, amount=amount)
-
-            elif choice == "6":
-                confirm = messagebox.askyesno(
-                    "Confirm Deletion",
-                    "Permanently delete this account?\nThis cannot be undone!",
-                    parent=self.window
-                )
-                if confirm:
-                    result = self.system.process_User_Input(self.account, choice)
-                    messagebox.showinfo("Account Deleted", result)
-                    self.account = None
-                    self.clear_widgets()
-                    self.__init__(self.system)
-
-            # Handles simple commands like checking the balance
+                result = account.transfer(amount, recipient)
+
+            # Mobile top-up
             else:
-                result = self.system.process_User_Input(self.account, choice)
+                result = account.top_up_mobile(number, amount)
 
-            # Shows operation result to the user
-            self.output.config(text=result)
+            # Saves any changes made (failed operations change nothing)
+            changed = account.cents != before
+            if changed:
+                if self.limits is not None and choice != "2":
+                    self.limits.record(account.account_id, account.account_category, before - account.cents)
+                persist_started = time.perf_counter()
+                # The journal commits first, so the ledger never shows an operation a restart would lose
+                self.record_changes([account] if recipient is None else [account, recipient])
+                self.post_operation(CHOICE_LEDGER_KINDS[choice], account, abs(account.cents - before), recipient, number)
+                persist_seconds = time.perf_counter() - persist_started
+
+        self.maybe_compact()
+        return result, changed, persist_seconds
 
-        # Shows any error that occurs
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
 
+    # Checks an outgoing amount against the velocity limits; the caller holds the account's lock
+    def within_limits(self, account, amount):
+        if self.limits is None:
+            return True
+        cents = Money.to_cents(amount)
+        return cents <= 0 or self.limits.allows(account.account_id, account.account_category, cents)
 
-    def clear_widgets(self):
 
-        # Removes all widgets except the status display
+    # Switches cProfile on for every Nth operation, without restarting
+    def enable_profiling(self, every=1):
+        """
+        Start profiling operations with cProfile.
 
-        for widget in self.window.winfo_children():
-            if widget != self.output:
-                widget.destroy()
+        Only one operation is profiled at a time. With every > 1 only one
+        in that many operations is profiled, which keeps the overhead low
+        on a busy system.
 
+        Args:
+            every: Profile one operation out of this many (default 1)
+        """
+        with self.profile_lock:
+            self.profile_every = max(1, every)
+            if self.profiler is None:
+                self.profiler = cProfile.Profile()
 
-if __name__ == "__main__":
-    # Start the bankig application
+
+    # Switches profiling off again and hands back what was collected
+    def disable_profiling(self, sort="cumulative", limit=30):
+        """
+        Stop profiling.
+
+        Args:
+            sort: pstats sort key for the report (default 'cumulative')
+            limit: Number of functions to list (default 30)
+
+        Returns:
+            str: Text report of the profiled calls, or '' if nothing was profiled
+        """
+        with self.profile_lock:
+            profiler, self.profiler = self.profiler, None
+        if profiler is None:
+            return ""
+        import pstats   # Only needed for reports, kept out of startup
+        output = io.StringIO()
+        try:
+            pstats.Stats(profiler, stream=output).sort_stats(sort).print_stats(limit)
+        except TypeError:
+            # No operation was sampled while profiling was on
+            return ""
+        return output.getvalue()
+
+
+    # Decides whether this operation is profiled and starts the profiler if so
+    def start_profiling_sample(self):
+        profiler = self.profiler
+        if profiler is None:
+            return None
+        self.operations_seen += 1
+        if self.operations_seen % self.profile_every or not self.profile_lock.acquire(blocking=False):
+            return None
+        if self.profiler is not profiler:
+            self.profile_lock.release()
+            return None
+        profiler.enable()
+        return profiler
+
+
+    # Adds a successful operation to the ledger, if one is kept
+    def post_operation(self, kind, account, cents, recipient=None, number=None):
+        """
+        Write ledger entries for a posted operation.
+
+        Call it only once the operation's journal record is committed.
+
+        Args:
+            kind: LEDGER_DEPOSIT, LEDGER_WITHDRAWAL, LEDGER_TRANSFER_OUT, LEDGER_TOP_UP
+                or LEDGER_REFUND
+            account (BankAccount): Account the operation ran on
+            cents: Amount moved, in cents
+            recipient (BankAccount): Receiving account of a transfer
+            number: Phone number of a top-up
+        """
+        if self.ledger is None:
+            return
+        for entry in ledger_entries(kind, account, cents, recipient, number):
+            self.ledger.record(*entry)
+
+
+    # Queues an operation to run on the worker threads
+    def submit(self, account, choice, amount=None, recipient_id=None, number=None):
+        """
+        Run process_User_Input on the system's thread pool.
+
+        Operations on different accounts run side by side; operations on
+        the same account wait for each other through the account locks.
+
+        Returns:
+            Future: Resolves to the operation's result message
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self.executor.submit(self.process_User_Input, account, choice, amount, recipient_id, number)
+
+
+    # Runs many independent operations in parallel and collects the results
+    def run_parallel(self, requests):
+        """
+        Execute a list of operations concurrently.
+
+        Args:
+            requests: Iterable of (account, choice, kwargs) tuples
+
+        Returns:
+            list: Result message or raised exception for each request, in order
+        """
+        futures = [self.submit(account, choice, **kwargs) for account, choice, kwargs in requests]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+    # Adds up every balance in the book
+    def total_funds(self):
+        """
+        Total money held across all accounts.
+
+        Returns:
+            Money: Sum of all balances
+        """
+        return Money(self.aggregates.total)
+
+
+    # Opens a consistent view of the book that writers don't have to wait for
+    def snapshot(self):
+        """
+        Take a read snapshot of the committed book, e.g. for an audit.
+
+        Returns:
+            ReadSnapshot: Close it (or use it in a with block) when done
+        """
+        return self.aggregates.snapshot()
+
+
+    # Reports below read the running aggregates instead of scanning the book
+    def category_totals(self):
+        """
+        Total balance and number of accounts per category.
+
+        Returns:
+            dict: Category name -> (Money total, account count)
+        """
+        return {name: (Money(cents), count) for name, (cents, count) in self.aggregates.category_totals().items()}
+
+
+    def account_count(self):
+        """Number of accounts in the book."""
+        return len(self.aggregates.balances)
+
+
+    def top_accounts(self, count=10):
+        """
+        Accounts with the largest balances.
+
+        Args:
+            count: How many to return (default 10)
+
+        Returns:
+            list: (account_id, Money balance) pairs, largest first
+        """
+        return [(account_id, Money(cents)) for account_id, cents in self.aggregates.top(count)]
+
+
+    def balance_percentile(self, q):
+        """
+        Balance at a quantile of all accounts, e.g. 0.5 for the median.
+
+        Args:
+            q: Quantile between 0 and 1
+
+        Returns:
+            Money: The balance, or None when there are no accounts
+        """
+        cents = self.aggregates.percentile(q)
+        return None if cents is None else Money(cents)
+
+
+    # Runs a whole file or list of operations in one go
+    def apply_batch(self, operations):
+        """
+        Apply many deposits, withdrawals, transfers, top-ups and refunds at once.
+
+        Rows are applied strictly in order, so each account sees its own
+        operations in sequence. The checks are the same as in BankAccount:
+        amounts must be positive, nothing may overdraw, phone numbers
+        must have 8 digits, and money going out must stay within any
+        velocity limits. Every touched account is saved in one journal
+        record at the end. Only the locks of the accounts in the batch are
+        taken, so operations on other accounts run alongside it.
+
+        Args:
+            operations: OperationBatch, path of a CSV/binary operations file,
+                or iterable of (operation, account_id, amount[, target]) rows
+
+        Returns:
+            array: One BATCH_* status code per row
+        """
+        if isinstance(operations, str):
+            operations = OperationBatch.read(operations)
+        elif not isinstance(operations, OperationBatch):
+            operations = OperationBatch.from_rows(operations)
+
+        # Only the accounts in the batch are locked, so other traffic carries on meanwhile
+        touched = set(operations.account_ids)
+        touched.update(target for code, target in zip(operations.codes, operations.targets) if code == 3)
+        started = time.perf_counter()
+        with self.locks.holding(*touched):
+            status, persist_seconds = self.apply_rows(operations)
+        if self.metrics is not None:
+            self.metrics.count("batch", "ok")
+            self.metrics.observe("batch", "compute", time.perf_counter() - started - persist_seconds)
+            self.metrics.observe("batch", "persist", persist_seconds)
+        self.maybe_compact()
+        return status
+
+
+    # Does the work of apply_batch; the caller holds the locks of every account in the batch
+    def apply_rows(self, operations):
+        accounts = self.accounts
+        codes, amounts = operations.codes, operations.amounts
+        account_ids, targets = operations.account_ids, operations.targets
+        status = array("b", bytes(len(codes)))
+        touched = {}
+        ledger = self.ledger
+        limits = self.limits
+        postings = []
+
+        for i in range(len(codes)):
+            code = codes[i]
+            amount = amounts[i]
+            account = accounts.get(account_ids[i])
+            if account is None:
+                status[i] = BATCH_UNKNOWN_ACCOUNT
+                continue
+
+            if code == 1:
+                if amount > 0:
+                    account.cents += amount
+                else:
+                    status[i] = BATCH_INVALID_AMOUNT
+                    continue
+
+            elif code == 2 or code == 3:
+                recipient = None
+                if code == 3:
+                    recipient = accounts.get(targets[i])
+                    if recipient is None:
+                        status[i] = BATCH_UNKNOWN_RECIPIENT
+                        continue
+                    if recipient.account_id == account.account_id:
+                        status[i] = BATCH_SAME_ACCOUNT
+                        continue
+                if amount <= 0:
+                    status[i] = BATCH_INVALID_AMOUNT
+                    continue
+                if amount > account.cents:
+                    status[i] = BATCH_INSUFFICIENT_FUNDS
+                    continue
+                if limits is not None and not limits.allows(account.account_id, account.account_category, amount):
+                    status[i] = BATCH_LIMIT_EXCEEDED
+                    continue
+                account.cents -= amount
+                if limits is not None:
+                    limits.record(account.account_id, account.account_category, amount)
+                if recipient is not None:
+                    recipient.cents += amount
+                    touched[recipient.account_id] = recipient
+
+            elif code == 4:
+                number = targets[i]
+                if len(number) != 8 or not number.isdigit():
+                    status[i] = BATCH_INVALID_NUMBER
+                    continue
+                if amount <= 0:
+                    status[i] = BATCH_INVALID_AMOUNT
+                    continue
+                if amount > account.cents:
+                    status[i] = BATCH_INSUFFICIENT_FUNDS
+                    continue
+                if limits is not None and not limits.allows(account.account_id, account.account_category, amount):
+                    status[i] = BATCH_LIMIT_EXCEEDED
+                    continue
+                account.cents -= amount
+                if limits is not None:
+                    limits.record(account.account_id, account.account_category, amount)
+
+            elif code == 5:
+                # Money coming back from a failed payment also frees its limit headroom
+                if amount <= 0:
+                    status[i] = BATCH_INVALID_AMOUNT
+                    continue
+                account.cents += amount
+                if limits is not None:
+                    limits.release(account.account_id, account.account_category, amount)
+
+            else:
+                status[i] = BATCH_INVALID_OPERATION
+                continue
+
+            if ledger is not None:
+                # Balances as of this operation, posted once the batch is committed
+                postings.extend(ledger_entries(BATCH_LEDGER_KINDS[code], account, amount,
+                                               recipient if code == 3 else None, targets[i]))
+            touched[account.account_id] = account
+
+        persist_started = time.perf_counter()
+        self.record_changes(touched.values())
+        for entry in postings:
+            ledger.record(*entry)
+        return status, time.perf_counter() - persist_started
+
+
+    # Streams a script of menu choices through the system
+    def replay(self, lines, batch_size=1000):
+        """
+        Replay operations without the GUI, one per line.
+
+        Each line is 'account_id choice [amount] [recipient_id or number]',
+        separated by commas or spaces, using the menu choices 1-6. Blank
+        lines and lines starting with '#' are skipped. Runs of money
+        operations (choices 2-5) are applied through apply_batch, so up to
+        batch_size of them are saved together in one journal record.
+        Balance checks and deletions first apply whatever is pending, so
+        every line still sees the lines before it.
+
+        Args:
+            lines: Iterable of text lines, e.g. an open file or sys.stdin
+            batch_size: Money operations saved together (default 1000)
+
+        Yields:
+            tuple: (line number, result text), in line order
+        """
+        batch, line_numbers = OperationBatch(), []
+        for line_number, line in enumerate(lines, 1):
+            fields = line.replace(",", " ").split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            account_id, choice = fields[0], fields[1] if len(fields) > 1 else ""
+
+            if choice in ("2", "3", "4", "5"):
+                try:
+                    amount = Money(Money.parse(fields[2]))
+                except (IndexError, ValueError):
+                    amount = 0
+                batch.add(CHOICE_NAMES[choice], account_id, amount, fields[3] if len(fields) > 3 else "")
+                line_numbers.append(line_number)
+                if len(batch) >= batch_size:
+                    yield from self.finish_replay_batch(batch, line_numbers)
+                    batch, line_numbers = OperationBatch(), []
+                continue
+
+            # Everything else runs on its own, after the pending batch
+            if len(batch):
+                yield from self.finish_replay_batch(batch, line_numbers)
+                batch, line_numbers = OperationBatch(), []
+            account = self.accounts.get(account_id)
+            if account is None:
+                yield line_number, BATCH_STATUS_NAMES[BATCH_UNKNOWN_ACCOUNT]
+                continue
+            try:
+                yield line_number, self.process_User_Input(account, choice)
+            except Exception as e:
+                yield line_number, f"error: {e}"
+
+        if len(batch):
+            yield from self.finish_replay_batch(batch, line_numbers)
+
+
+    # Applies one run of replayed money operations
+    def finish_replay_batch(self, batch, line_numbers):
+        """Apply a replay batch and return (line number, status name) pairs."""
+        status = self.apply_batch(batch)
+        return [(line_numbers[i], BATCH_STATUS_NAMES[status[i]]) for i in range(len(status))]
+
+
+
+# Command line entry point for jobs that don't need a window
+def replay_script(system, path, batch_size):
+    """
+    Run --replay: stream a script through the system and report throughput.
+
+    Args:
+        system (BankingSystem): System to replay against; closed afterwards
+        path: Script file, or '-' for stdin
+        batch_size: Money operations saved together
+
+    Returns:
+        Process exit code
+    """
+    file = sys.stdin if path == "-" else open(path)
+    total = errors = 0
+    started = time.perf_counter()
+    try:
+        for line_number, result in system.replay(file, batch_size):
+            print(f"{line_number}: {result}")
+            total += 1
+            errors += result.startswith("error")
+    finally:
+        if file is not sys.stdin:
+            file.close()
+        system.close()
+    elapsed = time.perf_counter() - started
+
+    rate = total / elapsed if elapsed > 0 else 0
+    print(f"Replayed {total} operations ({errors} errors) in {elapsed:.3f}s ({rate:.0f} ops/s)", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    """
+    Run the application.
+
+    With --batch the operations file is applied without opening a window
+    and a summary is printed. With --replay a script of menu choices is
+    streamed through the system, printing one result per line and a
+    throughput summary on stderr. Otherwise the GUI starts.
+
+    Args:
+        argv: Command line arguments (default sys.argv[1:])
+
+    Returns:
+        Process exit code
+    """
+    import argparse   # Imported here so the core module itself loads faster
+    parser = argparse.ArgumentParser(description="Banking application")
+    parser.add_argument("--accounts", default="accounts.txt", help="accounts file to use")
+    parser.add_argument("--batch", metavar="FILE", help="apply a CSV or binary operations file and exit")
+    parser.add_argument("--status-out", metavar="FILE", help="write one status line per batch row to FILE")
+    parser.add_argument("--rehash-passcodes", action="store_true", help="replace plain passcodes with hashes and exit")
+    parser.add_argument("--replay", metavar="FILE", help="replay a script of menu choices ('-' reads stdin) and exit")
+    parser.add_argument("--replay-batch", type=int, default=1000, metavar="N",
+                        help="money operations saved together while replaying (default 1000)")
+    args = parser.parse_args(argv)
 
     # Creates the banking system 
-    system = BankingSystem() 
-    
-    # Launch the GUI
-    BankingGUI(system)
+    system = BankingSystem(args.accounts)
+
+    if args.rehash_passcodes:
+        print(f"Hashed {system.rehash_passcodes()} passcodes")
+        system.close()
+        return 0
+
+    if args.replay is not None:
+        return replay_script(system, args.replay, args.replay_batch)
+
+    if args.batch is None:
+        # Launch the GUI
+        from banking_gui import BankingGUI
+        BankingGUI(system).run()
+        system.close()
+        return 0
+
+    started = time.perf_counter()
+    status = system.apply_batch(args.batch)
+    elapsed = time.perf_counter() - started
+    system.close()
+
+    if args.status_out:
+        with open(args.status_out, "w") as file:
+            for code in status:
+                file.write(BATCH_STATUS_NAMES[code] + "\n")
+
+    # Summary of how the rows went
+    for code, name in BATCH_STATUS_NAMES.items():
+        count = status.count(code)
+        if count:
+            print(f"{name}: {count}")
+    rate = len(status) / elapsed if elapsed > 0 else 0
+    print(f"Applied {len(status)} operations in {elapsed:.3f}s ({rate:.0f} ops/s)")
+    return 0
+
+
+def __getattr__(name):
+    # Keeps BankingGUI importable from here without loading tkinter up front
+    if name in GUI_NAMES:
+        import banking_gui
+        return getattr(banking_gui, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == "__main__":
+    # Start the bankig application
+    sys.exit(main())
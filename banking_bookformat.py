@@ -0,0 +1,495 @@
+# banking_bookformat.py
+
+"""
+Compact binary format for exporting and shipping account books.
+
+A book file is a header, a run of independent blocks and an end marker:
+
+    header   magic 'NKBK', format version, compression (0 none, 1 zlib, 2 lzma)
+    block    record count, raw size, stored size, CRC32 of the stored bytes,
+             then the (optionally compressed) block body
+    end      an all-zero block header, then the total number of records
+
+Each block body starts with its own category dictionary (the names used
+in the block), followed by one record per account:
+
+    tag        varint: category index * 4 + ID kind
+    ID         kind 0: zigzag varint delta from the previous numeric ID
+               kind 1: the same, then the number of leading zeros
+               kind 2: length-prefixed text, for IDs that aren't numbers
+    balance    zigzag varint, in cents
+    passcode   length-prefixed UTF-8
+
+Because blocks are independent, BookWriter and BookReader only ever hold
+one block in memory, whatever the size of the book. A damaged block is
+caught by its checksum before it is decompressed.
+
+    python banking_bookformat.py export accounts.txt accounts.nkb --compression lzma
+    python banking_bookformat.py import accounts.nkb accounts.txt
+    python banking_bookformat.py diff yesterday.nkb today.nkb
+"""
+
+import argparse
+import heapq
+import os
+import struct
+import sys
+import tempfile
+import zlib
+
+from NamkheyYoeselTshering_02240085_A3 import Money
+
+
+""" This error appears when a book file is damaged or isn't a book at all. """
+
+class Invalid_Book_Exception(ValueError):
+    "Raised when a book file fails its checks."
+    pass
+
+
+MAGIC = b"NKBK"
+VERSION = 1
+HEADER = struct.Struct("<4sBBH")          # magic, version, compression, reserved
+BLOCK = struct.Struct("<IIII")            # records, raw size, stored size, crc32
+TRAILER = struct.Struct("<Q")             # total records
+
+COMPRESSION_CODES = {"none": 0, "zlib": 1, "lzma": 2}
+COMPRESSION_NAMES = {code: name for name, code in COMPRESSION_CODES.items()}
+
+# How the account ID of a record is stored (low two bits of its tag)
+ID_NUMBER = 0
+ID_PADDED = 1
+ID_TEXT = 2
+
+
+def encode_varint(value, out):
+    """Append a non-negative integer to `out` as a LEB128 varint."""
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, pos):
+    """
+    Read a varint.
+
+    Returns:
+        tuple: (value, position after it)
+    """
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def zigzag(value):
+    """Map signed to unsigned integers so small negatives stay short (0, -1, 1, -2 ...)."""
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value):
+    """Inverse of zigzag()."""
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def compress(data, compression):
+    if compression == 1:
+        return zlib.compress(data, 6)
+    if compression == 2:
+        import lzma   # Not every Python build has it, so only load it when asked for
+        return lzma.compress(data)
+    return data
+
+
+def decompress(data, compression):
+    if compression == 1:
+        return zlib.decompress(data)
+    if compression == 2:
+        import lzma
+        return lzma.decompress(data)
+    return data
+
+
+# Writes a book one block at a time
+class BookWriter:
+    """
+    Streaming writer for the binary book format.
+
+    Accounts are buffered until block_records of them are collected, then
+    the block is encoded, compressed and written, so memory use doesn't
+    grow with the book. Use as a context manager, or call close().
+    """
+
+    def __init__(self, path, compression="zlib", block_records=4096):
+        """
+        Args:
+            path: Book file to create
+            compression: 'none', 'zlib' (default) or 'lzma'
+            block_records: Accounts per block (default 4096)
+        """
+        if compression not in COMPRESSION_CODES:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.compression = COMPRESSION_CODES[compression]
+        self.block_records = block_records
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.compression, 0))
+        self.pending = []
+        self.records = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # No end marker, so a book cut short by an error never reads as complete
+            self.file.close()
+
+    def write(self, account_id, passcode, account_category, cents):
+        """Add one account to the book."""
+        self.pending.append((account_id, passcode, account_category, cents))
+        if len(self.pending) >= self.block_records:
+            self.flush_block()
+
+    def write_accounts(self, accounts):
+        """
+        Write every account of a BankingSystem book, in account ID order.
+
+        Args:
+            accounts: Dict of accounts or an AccountTable
+        """
+        for account_id in sorted(accounts.keys()):
+            account = accounts[account_id]
+            self.write(account_id, account.passcode, account.account_category, account.cents)
+
+    def flush_block(self):
+        """Encode and write whatever accounts are buffered as one block."""
+        if not self.pending:
+            return
+        categories = {}
+        for row in self.pending:
+            categories.setdefault(row[2], len(categories))
+
+        body = bytearray()
+        encode_varint(len(categories), body)
+        for name in categories:
+            encoded = name.encode()
+            encode_varint(len(encoded), body)
+            body += encoded
+
+        previous = 0
+        for account_id, passcode, account_category, cents in self.pending:
+            tag = categories[account_category] * 4
+            if account_id.isdigit():
+                number = int(account_id)
+                padding = len(account_id) - len(str(number))
+                encode_varint(tag + (ID_PADDED if padding else ID_NUMBER), body)
+                encode_varint(zigzag(number - previous), body)
+                if padding:
+                    encode_varint(padding, body)
+                previous = number
+            else:
+                encoded = account_id.encode()
+                encode_varint(tag + ID_TEXT, body)
+                encode_varint(len(encoded), body)
+                body += encoded
+            encode_varint(zigzag(cents), body)
+            encoded = str(passcode).encode()
+            encode_varint(len(encoded), body)
+            body += encoded
+
+        stored = compress(bytes(body), self.compression)
+        self.file.write(BLOCK.pack(len(self.pending), len(body), len(stored), zlib.crc32(stored)))
+        self.file.write(stored)
+        self.records += len(self.pending)
+        self.pending = []
+
+    def close(self):
+        """Write the last block and the end marker, then close the file."""
+        if self.file.closed:
+            return
+        self.flush_block()
+        self.file.write(BLOCK.pack(0, 0, 0, 0))
+        self.file.write(TRAILER.pack(self.records))
+        self.file.close()
+
+
+# Reads a book back one block at a time
+class BookReader:
+    """
+    Streaming reader for the binary book format.
+
+    Iterating yields (account_id, passcode, account_category, cents) rows
+    in the order they were written; only one block is decoded at a time.
+
+    Raises:
+        Invalid_Book_Exception: On a bad header, a failed checksum or a
+            truncated file
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        header = self.file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            self.file.close()
+            raise Invalid_Book_Exception(f"{path} is too short to be a book")
+        magic, version, compression, _ = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or compression not in COMPRESSION_NAMES:
+            self.file.close()
+            raise Invalid_Book_Exception(f"{path} is not a version {VERSION} book")
+        self.path = path
+        self.compression = compression
+        self.records = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def __iter__(self):
+        while True:
+            header = self.file.read(BLOCK.size)
+            if len(header) < BLOCK.size:
+                raise Invalid_Book_Exception(f"{self.path} ends without an end marker")
+            count, raw_size, stored_size, crc = BLOCK.unpack(header)
+            if count == 0:
+                trailer = self.file.read(TRAILER.size)
+                complete = header == bytes(BLOCK.size) and len(trailer) == TRAILER.size
+                if not complete or TRAILER.unpack(trailer)[0] != self.records:
+                    raise Invalid_Book_Exception(f"{self.path} has a damaged end marker")
+                return
+
+            stored = self.file.read(stored_size)
+            if len(stored) < stored_size or zlib.crc32(stored) != crc:
+                raise Invalid_Book_Exception(f"{self.path}: block after record {self.records} failed its checksum")
+            body = decompress(stored, self.compression)
+            if len(body) != raw_size:
+                raise Invalid_Book_Exception(f"{self.path}: block after record {self.records} has the wrong size")
+            yield from self.decode_block(body, count)
+            self.records += count
+
+    @staticmethod
+    def decode_block(body, count):
+        """Decode the rows of one block body."""
+        size, pos = decode_varint(body, 0)
+        names = []
+        for _ in range(size):
+            length, pos = decode_varint(body, pos)
+            names.append(body[pos:pos + length].decode())
+            pos += length
+
+        previous = 0
+        for _ in range(count):
+            tag, pos = decode_varint(body, pos)
+            kind = tag & 3
+            if kind == ID_TEXT:
+                length, pos = decode_varint(body, pos)
+                account_id = body[pos:pos + length].decode()
+                pos += length
+            else:
+                delta, pos = decode_varint(body, pos)
+                previous += unzigzag(delta)
+                account_id = str(previous)
+                if kind == ID_PADDED:
+                    padding, pos = decode_varint(body, pos)
+                    account_id = "0" * padding + account_id
+            cents, pos = decode_varint(body, pos)
+            length, pos = decode_varint(body, pos)
+            passcode = body[pos:pos + length].decode()
+            pos += length
+            yield account_id, passcode, names[tag >> 2], unzigzag(cents)
+
+
+# Converts an accounts.txt file into a book
+def csv_to_book(csv_path, book_path, compression="zlib", block_records=4096, run_records=100000):
+    """
+    Convert the 'id,passcode,category,funds' text format to a book.
+
+    Damaged lines are skipped and a repeated ID keeps its last line, as
+    load_accounts does. The book is written in account ID order so that
+    diff_books can compare two exports. Memory stays bounded however big
+    the file is: up to run_records accounts are sorted at a time and
+    spilled to temporary books next to the target, which are then merged
+    one block each at a time.
+
+    Returns:
+        tuple: (accounts written, lines skipped)
+    """
+    skipped = 0
+    run = {}
+    runs = []
+    directory, name = os.path.split(os.path.abspath(book_path))
+    try:
+        with open(csv_path) as source:
+            for line in source:
+                try:
+                    account_id, passcode, account_category, funds = line.strip().split(",")
+                    run[account_id] = (passcode, account_category, Money.parse(funds))
+                except ValueError:
+                    skipped += bool(line.strip())
+                    continue
+                if len(run) >= run_records:
+                    handle, path = tempfile.mkstemp(prefix=name + ".", suffix=".run", dir=directory)
+                    os.close(handle)
+                    runs.append(path)
+                    write_run(path, run, block_records)
+                    run = {}
+
+        with BookWriter(book_path, compression, block_records) as book:
+            if not runs:
+                for account_id in sorted(run):
+                    book.write(account_id, *run[account_id])
+                return book.records + len(book.pending), skipped
+            return merge_runs(book, runs, run, block_records), skipped
+    finally:
+        for path in runs:
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+def write_run(path, run, block_records):
+    """Write one sorted run of csv_to_book to an uncompressed temporary book."""
+    with BookWriter(path, "none", block_records) as book:
+        for account_id in sorted(run):
+            book.write(account_id, *run[account_id])
+
+
+def merge_runs(book, runs, last_run, block_records):
+    """
+    Merge the sorted runs of csv_to_book into book, the last one still in memory.
+
+    Where runs share an ID the later run wins, as the later line does.
+
+    Returns:
+        int: Accounts written
+    """
+    def tagged(rows, order):
+        for row in rows:
+            yield row[0], order, row
+
+    readers = [BookReader(path) for path in runs]
+    try:
+        streams = [tagged(reader, order) for order, reader in enumerate(readers)]
+        streams.append(tagged(((account_id,) + last_run[account_id] for account_id in sorted(last_run)), len(runs)))
+        written = 0
+        previous = None
+        for account_id, _, row in heapq.merge(*streams):
+            if previous is not None and previous[0] != account_id:
+                book.write(*previous)
+                written += 1
+            previous = row
+        if previous is not None:
+            book.write(*previous)
+            written += 1
+        return written
+    finally:
+        for reader in readers:
+            reader.close()
+
+
+# Converts a book back into an accounts.txt file
+def book_to_csv(book_path, csv_path):
+    """
+    Convert a book to the text format that load_accounts reads.
+
+    Returns:
+        int: Accounts written
+    """
+    written = 0
+    with BookReader(book_path) as book, open(csv_path, "w") as target:
+        for account_id, passcode, account_category, cents in book:
+            target.write(f"{account_id},{passcode},{account_category},{Money(cents)}\n")
+            written += 1
+    return written
+
+
+# Compares two books that are both sorted by account ID
+def diff_books(old_path, new_path):
+    """
+    Stream the differences between two books.
+
+    Both books must be in account ID order (as BookWriter.write_accounts
+    and csv_to_book produce); the two are merged side by side, so
+    memory use stays at one block per book.
+
+    Yields:
+        tuple: ('added', new row), ('removed', old row) or
+        ('changed', old row, new row)
+
+    Raises:
+        Invalid_Book_Exception: If either book is out of order
+    """
+    def ordered(rows, path):
+        last = None
+        for row in rows:
+            if last is not None and row[0] <= last:
+                raise Invalid_Book_Exception(f"{path} is not sorted by account ID")
+            last = row[0]
+            yield row
+
+    with BookReader(old_path) as old_book, BookReader(new_path) as new_book:
+        old_rows, new_rows = ordered(old_book, old_path), ordered(new_book, new_path)
+        old, new = next(old_rows, None), next(new_rows, None)
+        while old is not None or new is not None:
+            if new is None or (old is not None and old[0] < new[0]):
+                yield ("removed", old)
+                old = next(old_rows, None)
+            elif old is None or new[0] < old[0]:
+                yield ("added", new)
+                new = next(new_rows, None)
+            else:
+                if old != new:
+                    yield ("changed", old, new)
+                old, new = next(old_rows, None), next(new_rows, None)
+
+
+def main(argv=None):
+    """Convert and compare book files from the command line."""
+    parser = argparse.ArgumentParser(description="Binary account book tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="convert an accounts text file to a book")
+    export.add_argument("source")
+    export.add_argument("target")
+    export.add_argument("--compression", default="zlib", choices=sorted(COMPRESSION_CODES))
+    export.add_argument("--block-records", type=int, default=4096)
+    export.add_argument("--run-records", type=int, default=100000, help="accounts sorted in memory at a time")
+    restore = commands.add_parser("import", help="convert a book back to an accounts text file")
+    restore.add_argument("source")
+    restore.add_argument("target")
+    compare = commands.add_parser("diff", help="list accounts that differ between two sorted books")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "export":
+            written, skipped = csv_to_book(args.source, args.target, args.compression, args.block_records,
+                                           args.run_records)
+            print(f"Exported {written} accounts ({skipped} damaged lines skipped)")
+        elif args.command == "import":
+            print(f"Imported {book_to_csv(args.source, args.target)} accounts")
+        else:
+            changes = 0
+            for change in diff_books(args.old, args.new):
+                kind, row = change[0], change[-1]
+                print(f"{kind} {row[0]} {row[2]} {Money(row[3])}")
+                changes += 1
+            return 1 if changes else 0
+    except Invalid_Book_Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
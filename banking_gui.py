@@ -0,0 +1,260 @@
+# banking_gui.py
+
+"""
+Tkinter front-end for the banking system.
+
+Kept apart from NamkheyYoeselTshering_02240085_A3 so that batch jobs, the
+network server and the tests never load tkinter. The core module still
+exposes BankingGUI, importing this module the first time it is asked for.
+"""
+
+import queue
+import tkinter as tk
+import tkinter.simpledialog as simpledialog
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox
+
+
+# Runs slow backend calls off the GUI thread
+class BackgroundWorker:
+    """
+    One worker thread plus a queue of finished results.
+
+    Jobs run in the order they were submitted. Their results wait in a
+    queue until poll() is called, so callbacks always run on the thread
+    that polls (the Tk main thread), never on the worker.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gui-worker")
+        self.results = queue.Queue()
+        self.pending = 0
+
+    def submit(self, function, callback, *args, **kwargs):
+        """
+        Run function(*args, **kwargs) on the worker thread.
+
+        Args:
+            function: Backend call to make
+            callback: Called later by poll() as callback(result, error),
+                where error is the exception raised or None
+        """
+        def job():
+            try:
+                self.results.put((callback, function(*args, **kwargs), None))
+            except Exception as e:
+                self.results.put((callback, None, e))
+        self.pending += 1
+        self.executor.submit(job)
+
+    def poll(self):
+        """Run the callbacks of every job that has finished so far."""
+        while True:
+            try:
+                callback, result, error = self.results.get_nowait()
+            except queue.Empty:
+                return
+            self.pending -= 1
+            callback(result, error)
+
+    def shutdown(self):
+        """Wait for running jobs and stop the thread."""
+        self.executor.shutdown(wait=True)
+
+
+class BankingGUI:
+    """Graphical user interface for banking application"""
+
+    # How often finished background jobs are checked for, in milliseconds
+    POLL_INTERVAL = 50
+
+    def __init__(self, system):
+        """
+        Initialize banking GUI.
+
+        The window and both screens are built once; logging in and out
+        only swaps which frame is shown. Call run() to start the event loop.
+        
+        Args:
+            system (BankingSystem): Connected banking system
+        """
+
+        # It sets up the main banking application window
+        self.system = system
+        self.account_id = None   # Looked up again for every operation, so a deleted account is never reused
+        self.worker = BackgroundWorker()
+
+        # Creates the main window
+        self.window = tk.Tk()
+        self.window.title("Banking Application")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        # Login screen with the account ID and passwords entry fields
+        self.login_frame = tk.Frame(self.window)
+        self.id_entry = tk.Entry(self.login_frame)
+        self.pass_entry = tk.Entry(self.login_frame, show="*")  # Hides the passwords characters
+        tk.Label(self.login_frame, text="Account ID").pack()
+        self.id_entry.pack()
+        tk.Label(self.login_frame, text="Passcode").pack()
+        self.pass_entry.pack()
+        tk.Button(self.login_frame, text="Login", command=self.login).pack()
+        tk.Button(self.login_frame, text="Create Personal Account", command=lambda: self.create_account("Personal")).pack()
+        tk.Button(self.login_frame, text="Create Business Account", command=lambda: self.create_account("Business")).pack()
+
+        # Account screen with all the avaolable banking options
+        self.account_frame = tk.Frame(self.window)
+        options = [
+            ("Check Balance", "1"),
+            ("Deposit", "2"),
+            ("Withdraw", "3"),
+            ("Transfer", "4"),
+            ("Top-Up Mobile", "5"),
+            ("Delete Account", "6"),
+            ("Logout", "logout")
+        ]
+        for text, val in options:
+            tk.Button(self.account_frame, text=text, command=lambda v=val: self.handle_action(v)).pack()
+
+        # Creates status display label, shared by both screens
+        self.output = tk.Label(self.window, text="Welcome to the Bank!", wraplength=300)
+        self.show_frame(self.login_frame)
+        self.output.pack(side="bottom")
+        self.window.after(self.POLL_INTERVAL, self.poll_worker)
+
+
+    def run(self):
+        # Displays everyting until the window is closed
+        self.window.mainloop()
+
+
+    def close(self):
+        # Lets running operations finish saving before the window goes away
+        self.worker.shutdown()
+        self.window.destroy()
+
+
+    def poll_worker(self):
+        # Delivers finished backend calls on the Tk thread, then checks again later
+        self.worker.poll()
+        self.window.after(self.POLL_INTERVAL, self.poll_worker)
+
+
+    def show_frame(self, frame):
+        # Swaps between the login and account screens
+        for other in (self.login_frame, self.account_frame):
+            if other is not frame:
+                other.pack_forget()
+        frame.pack(side="top")
+
+
+    def run_in_background(self, function, on_success, *args, **kwargs):
+        """
+        Call the backend on the worker thread and report back on the Tk thread.
+
+        Args:
+            function: Backend call, e.g. self.system.process_User_Input
+            on_success: Called with the result; errors are shown in a dialog
+        """
+        self.output.config(text="Working...")
+
+        def done(result, error):
+            if error is not None:
+                self.output.config(text="")
+                messagebox.showerror("Error", str(error))
+            else:
+                on_success(result)
+        self.worker.submit(function, done, *args, **kwargs)
+
+
+    def create_account(self, account_type):
+
+        # Creates new account and show the credentials details to the user
+        def created(result):
+            account, passcode = result
+            self.output.config(text=f"Created {account_type} Account. ID: {account.account_id}, Pass: {passcode}")
+        self.run_in_background(self.system.open_account, created, account_type)
+
+
+    def login(self):
+
+        # Attempts to log in with entered credentitals
+        acc_id = self.id_entry.get()
+        passcode = self.pass_entry.get()
+
+        def logged_in(account):
+            self.account_id = account.account_id
+            self.pass_entry.delete(0, "end")
+            self.output.config(text=f"Logged in to account {account.account_id}")
+            self.show_logged_in_options()
+        self.run_in_background(self.system.login, logged_in, acc_id, passcode)
+
+
+    def show_logged_in_options(self):
+        # Display banking options after successful login
+        self.show_frame(self.account_frame)
+
+
+    def show_login(self, message="Welcome to the Bank!"):
+        # Return to login screen
+        self.account_id = None
+        self.output.config(text=message)
+        self.show_frame(self.login_frame)
+
+
+    # Process user's sleected banking operations
+    def handle_action(self, choice):
+
+        if choice == "logout":
+            self.show_login()
+            return
+
+        # The account may have been deleted elsewhere since logging in
+        account = self.system.accounts.get(self.account_id)
+        if account is None:
+            self.show_login("Account does not exist")
+            return
+
+        # Asks for the details on the Tk thread; only the operation itself runs in the background
+        kwargs = {}
+
+        # Handles the deposit
+        if choice == "2":
+            kwargs["amount"] = simpledialog.askfloat("Deposit", "Enter amount to deposit:", minvalue=0.01)
+            if kwargs["amount"] is None: return
+
+        # Handles the withdrawls
+        elif choice == "3":
+            kwargs["amount"] = simpledialog.askfloat("Withdraw", "Enter amount to withdraw:", minvalue=0.01)
+            if kwargs["amount"] is None: return
+
+        # Handles the transfer
+        elif choice == "4":
+            kwargs["recipient_id"] = simpledialog.askstring("Transfer", "Enter recipient account ID:")
+            if kwargs["recipient_id"] is None: return
+            kwargs["amount"] = simpledialog.askfloat("Transfer", "Enter amount to transfer:", minvalue=0.01)
+            if kwargs["amount"] is None: return
+
+        # Handles the mobile top-up
+        elif choice == "5":
+            kwargs["number"] = simpledialog.askstring("Mobile Top-Up", "Enter mobile number (8 digits):")
+            if kwargs["number"] is None: return
+            kwargs["amount"] = simpledialog.askfloat("Mobile Top-Up", "Enter top-up amount:", minvalue=0.01)
+            if kwargs["amount"] is None: return
+
+        elif choice == "6":
+            confirm = messagebox.askyesno(
+                "Confirm Deletion",
+                "Permanently delete this account?\nThis cannot be undone!",
+                parent=self.window
+            )
+            if not confirm: return
+
+            def deleted(result):
+                messagebox.showinfo("Account Deleted", result)
+                self.show_login(result)
+            self.run_in_background(self.system.process_User_Input, deleted, account, choice)
+            return
+
+        # Shows operation result to the user
+        self.run_in_background(self.system.process_User_Input, lambda result: self.output.config(text=result),
+                               account, choice, **kwargs)
@@ -0,0 +1,490 @@
+# banking_scheduler.py
+
+"""
+Standing orders and future-dated transfers.
+
+OrderScheduler keeps every scheduled transfer in a hierarchical timer
+wheel, so finding what is due costs time in proportion to the orders that
+fire, not to how many are scheduled:
+
+    1. schedule() (or schedule_many() for a payroll run) checks the accounts
+       and amount, journals the order and places it on the wheel.
+    2. run_due() advances the wheel to now and collects every order whose
+       time has come. A recurring order that missed several runs (while
+       the system was down, say) fires once for each missed run.
+    3. The due runs are sorted by time and sent through apply_batch in
+       chunks of batch_size, so transfers get the usual checks, journal,
+       ledger and velocity limits. A chunk that raises is retried one order
+       at a time, so a broken order is reported as an error without
+       stopping the rest.
+    4. Each order's next run is journaled before its money moves, so after
+       a crash an order is never paid twice (at most once).
+
+start() runs run_due() on a background thread once per tick.
+
+    python banking_scheduler.py --accounts accounts.txt list
+    python banking_scheduler.py --accounts accounts.txt run
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from NamkheyYoeselTshering_02240085_A3 import BATCH_STATUS_NAMES, BankingSystem, Money
+
+
+# due is the next run as a Unix time, interval the seconds between runs (0 for
+# a one-off transfer) and remaining the runs left, or None until cancelled
+StandingOrder = namedtuple("StandingOrder", "order_id account_id recipient_id cents due interval remaining")
+
+# Scheduler totals under the outcome names the system's metrics use
+OUTCOME_NAMES = {"fired": "ok", "failed": "rejected", "errors": "error"}
+
+
+# Hierarchical timer wheel holding items by the tick they are due
+class TimerWheel:
+    """
+    Hashed hierarchical timer wheel.
+
+    Level 0 has one slot per tick; each level above has slots covering a
+    whole turn of the level below (64, 64**2, ... ticks with the default
+    64 slots). An item starts on the lowest level whose turn it falls in
+    and moves down a level each time the wheel reaches its slot, so adding
+    an item is O(1) and advancing only touches slots that hold something.
+    Stretches where the lower levels are empty are skipped a whole turn at
+    a time, and a turn that is already over when the wheel reaches it is
+    fired in one sorted batch, which keeps catching up after a long pause
+    cheap. Items further out than the top level wait in an overflow list.
+    """
+
+    def __init__(self, start_tick=0, slots=64, levels=4):
+        """
+        Args:
+            start_tick: Tick the wheel starts at
+            slots: Slots per level, a power of two (default 64)
+            levels: Number of levels (default 4)
+        """
+        if slots < 2 or slots & (slots - 1):
+            raise ValueError("Slots per level must be a power of two")
+        self.slots = slots
+        self.bits = slots.bit_length() - 1   # Bits of the tick number each level covers
+        self.levels = levels
+        self.spans = [slots ** level for level in range(levels + 1)]   # Ticks covered by one slot per level
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.sizes = [0] * levels
+        self.overflow = []
+        self.current = start_tick   # Next tick to be processed
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, tick, item):
+        """Add an item due at a tick; anything already overdue fires on the next advance."""
+        self.count += 1
+        self.place(max(tick, self.current), item)
+
+    def place(self, tick, item):
+        # Puts an item on the lowest level whose current turn contains its tick,
+        # found from the highest bit where the tick differs from the current one
+        level = max(0, ((tick ^ self.current).bit_length() - 1) // self.bits)
+        if level >= self.levels:
+            self.overflow.append((tick, item))
+            return
+        self.wheels[level][(tick >> (self.bits * level)) & (self.slots - 1)].append((tick, item))
+        self.sizes[level] += 1
+
+    def cascade(self, lowest=1):
+        # At the start of a turn, moves the items of the slots just reached down a level
+        # (for every level from the top down to lowest)
+        if self.current % self.spans[self.levels] == 0 and self.overflow:
+            waiting, self.overflow = self.overflow, []
+            for tick, item in waiting:
+                self.place(tick, item)
+        for level in range(self.levels - 1, lowest - 1, -1):
+            if self.current % self.spans[level]:
+                continue
+            index = (self.current >> (self.bits * level)) & (self.slots - 1)
+            bucket = self.wheels[level][index]
+            if bucket:
+                self.wheels[level][index] = []
+                self.sizes[level] -= len(bucket)
+                for tick, item in bucket:
+                    self.place(tick, item)
+
+    def advance(self, tick):
+        """
+        Move the wheel through every tick up to and including tick.
+
+        Returns:
+            list: (tick, item) of everything that came due, in tick order
+        """
+        fired = []
+        while self.current <= tick:
+
+            # A whole turn that is already due (when catching up) fires in one go,
+            # without moving its items down level by level
+            whole = 0
+            for level in range(self.levels - 1, 0, -1):
+                span = self.spans[level]
+                if self.current % span == 0 and self.current + span - 1 <= tick:
+                    whole = level
+                    break
+            self.cascade(whole + 1)
+            if whole:
+                index = (self.current >> (self.bits * whole)) & (self.slots - 1)
+                due = self.wheels[whole][index]
+                self.wheels[whole][index] = []
+                self.sizes[whole] -= len(due)
+                for level in range(whole):   # Everything on the lower levels is inside this turn
+                    if self.sizes[level]:
+                        for bucket in self.wheels[level]:
+                            due.extend(bucket)
+                        self.wheels[level] = [[] for _ in range(self.slots)]
+                        self.sizes[level] = 0
+                due.sort(key=lambda entry: entry[0])
+                fired.extend(due)
+                self.current += self.spans[whole]
+
+            # Nothing moves down inside a turn of level 0, so its slots up to tick fire in one pass
+            else:
+                end = min(tick, self.current - self.current % self.slots + self.slots - 1)
+                if self.sizes[0]:
+                    wheel = self.wheels[0]
+                    for now in range(self.current, end + 1):
+                        bucket = wheel[now % self.slots]
+                        if bucket:
+                            wheel[now % self.slots] = []
+                            self.sizes[0] -= len(bucket)
+                            fired.extend(bucket)
+                self.current = end + 1
+
+            # Skip to the next turn of the lowest level that holds anything
+            for level in range(self.levels):
+                if self.sizes[level]:
+                    step = -self.current % self.spans[level]
+                    break
+            else:
+                # Only the overflow is left: go straight to the turn of its earliest item
+                top = self.spans[self.levels]
+                if self.overflow:
+                    step = min(t for t, _ in self.overflow) // top * top - self.current
+                else:
+                    step = tick + 1 - self.current
+            self.current += max(0, min(step, tick + 1 - self.current))
+        self.count -= len(fired)
+        return fired
+
+
+# Runs standing orders for a BankingSystem
+class OrderScheduler:
+    """
+    Standing-order and scheduled-transfer engine.
+
+    Orders are journaled to path (one line per change), and the journal is
+    rewritten once it holds more than twice as many lines as live orders.
+    Cancelled orders are dropped from the wheel lazily, when their slot
+    comes up.
+    """
+
+    COMPACT_SLACK = 1000   # Extra journal lines allowed before a rewrite
+
+    def __init__(self, system, path=None, tick=1.0, batch_size=1000, clock=time.time):
+        """
+        Args:
+            system (BankingSystem): System whose accounts the orders move money between
+            path: Order journal (default: the accounts file + '.orders')
+            tick: Seconds per wheel tick, the timing resolution (default 1.0)
+            batch_size: Transfers sent to apply_batch at once (default 1000)
+            clock: Function returning the Unix time
+        """
+        self.system = system
+        self.path = path or system.filename + ".orders"
+        self.tick = tick
+        self.batch_size = batch_size
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.orders = {}       # order_id -> StandingOrder
+        self.next_id = 0
+        self.journal_lines = 0
+        self.totals = {"fired": 0, "failed": 0, "errors": 0}
+        self.thread = None
+        self.stopping = threading.Event()
+        self.wheel = TimerWheel(self.tick_of(self.clock()))
+        self.load()
+        self.file = open(self.path, "a")
+
+    def tick_of(self, when):
+        return int(when // self.tick)
+
+    def load(self):
+        """Read the order journal and put every live order on the wheel."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as file:
+            for line in file:
+                self.journal_lines += 1
+                fields = line.strip().split(",")
+                try:
+                    if fields[0] == "S" and len(fields) == 8:
+                        order = StandingOrder(int(fields[1]), fields[2], fields[3], int(fields[4]),
+                                              float(fields[5]), float(fields[6]),
+                                              int(fields[7]) if fields[7] else None)
+                        self.orders[order.order_id] = order
+                    elif fields[0] == "C" and len(fields) == 2:
+                        self.orders.pop(int(fields[1]), None)
+                    else:
+                        continue
+                    self.next_id = max(self.next_id, int(fields[1]))
+                except ValueError:
+                    continue   # A torn last line from a crash
+        for order in self.orders.values():
+            self.wheel.add(self.tick_of(order.due), (order.order_id, order.due))
+        if self.journal_lines > 2 * len(self.orders) + self.COMPACT_SLACK:
+            self.compact()
+
+    def write(self, lines):
+        # Appends change lines to the journal and makes them durable; the caller holds the lock
+        if not lines:
+            return
+        self.file.write("".join(lines))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.journal_lines += len(lines)
+        if self.journal_lines > 2 * len(self.orders) + self.COMPACT_SLACK:
+            self.compact()
+
+    @staticmethod
+    def order_line(order):
+        remaining = "" if order.remaining is None else order.remaining
+        return (f"S,{order.order_id},{order.account_id},{order.recipient_id},{order.cents},"
+                f"{order.due!r},{order.interval!r},{remaining}\n")
+
+    def compact(self):
+        """Rewrite the journal with one line per live order."""
+        temp_name = self.path + ".tmp"
+        with open(temp_name, "w") as file:
+            file.write("".join(self.order_line(order) for order in self.orders.values()))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_name, self.path)
+        if getattr(self, "file", None) is not None:
+            self.file.close()
+            self.file = open(self.path, "a")
+        self.journal_lines = len(self.orders)
+
+    def schedule(self, account_id, recipient_id, amount, first_due, interval=0, count=None):
+        """
+        Schedule a transfer, once or repeating.
+
+        Args:
+            account_id: Account the money comes from
+            recipient_id: Account it goes to
+            amount: Positive amount per run
+            first_due: Unix time of the first run
+            interval: Seconds between runs, 0 for a one-off (default 0)
+            count: Number of runs, or None to repeat until cancelled
+
+        Returns:
+            int: The new order's ID
+
+        Raises:
+            ValueError: If an account doesn't exist or the order makes no sense
+        """
+        return self.schedule_many(account_id, [(recipient_id, amount)], first_due, interval, count)[0]
+
+    def schedule_many(self, account_id, payments, first_due, interval=0, count=None):
+        """
+        Schedule many transfers from one account, e.g. a payroll, with a single journal write.
+
+        Args:
+            payments: Iterable of (recipient_id, amount)
+            Other arguments as for schedule()
+
+        Returns:
+            list: IDs of the new orders, in order
+        """
+        if account_id not in self.system.accounts:
+            raise ValueError("Account does not exist")
+        if interval < 0 or (count is not None and count < 1) or (interval == 0 and count not in (None, 1)):
+            raise ValueError("Invalid schedule")
+        rows = []
+        for recipient_id, amount in payments:
+            cents = Money.to_cents(amount)
+            if recipient_id not in self.system.accounts:
+                raise ValueError(f"Recipient account {recipient_id} does not exist")
+            if recipient_id == account_id:
+                raise ValueError("Cannot transfer to the same account")
+            if cents <= 0:
+                raise ValueError("Amount must be positive")
+            rows.append((recipient_id, cents))
+
+        remaining = 1 if interval == 0 else count
+        with self.lock:
+            orders = []
+            for recipient_id, cents in rows:
+                self.next_id += 1
+                orders.append(StandingOrder(self.next_id, account_id, recipient_id, cents,
+                                            float(first_due), float(interval), remaining))
+            for order in orders:
+                self.orders[order.order_id] = order
+            self.write([self.order_line(order) for order in orders])
+            for order in orders:
+                self.wheel.add(self.tick_of(order.due), (order.order_id, order.due))
+        return [order.order_id for order in orders]
+
+    def cancel(self, order_id):
+        """
+        Cancel a standing order.
+
+        Returns:
+            bool: False if there was no such order
+        """
+        with self.lock:
+            if self.orders.pop(order_id, None) is None:
+                return False
+            self.write([f"C,{order_id}\n"])
+            return True
+
+    def run_due(self, now=None):
+        """
+        Fire every order that is due by now.
+
+        Returns:
+            list: (order_id, due time, status name) of each run, in time order;
+                  a run that raised has the status "error"
+        """
+        now = self.clock() if now is None else now
+        with self.lock:
+            runs = []
+            changes = []
+            for _, (order_id, due) in self.wheel.advance(self.tick_of(now)):
+                order = self.orders.get(order_id)
+                if order is None or order.due != due:
+                    continue   # Cancelled, or already moved on
+                if order.due > now:
+                    self.wheel.add(self.tick_of(order.due), (order_id, order.due))   # Later within this tick
+                    continue
+
+                # One run for every time the order came due, including runs missed while stopped
+                times = 1
+                if order.interval:
+                    times = int((now - order.due) // order.interval) + 1
+                    if order.remaining is not None:
+                        times = min(times, order.remaining)
+                runs.extend((order.due + n * order.interval, order) for n in range(times))
+
+                remaining = None if order.remaining is None else order.remaining - times
+                if remaining == 0:
+                    del self.orders[order_id]
+                    changes.append(f"C,{order_id}\n")
+                else:
+                    order = order._replace(due=order.due + times * order.interval, remaining=remaining)
+                    self.orders[order_id] = order
+                    changes.append(self.order_line(order))
+                    self.wheel.add(self.tick_of(order.due), (order_id, order.due))
+
+            # The schedule moves on before the money does, so nothing is paid twice
+            self.write(changes)
+
+        runs.sort(key=lambda run: (run[0], run[1].order_id))
+        results = []
+        for start in range(0, len(runs), self.batch_size):
+            chunk = runs[start:start + self.batch_size]
+            try:
+                names = self.apply_runs(chunk)
+            except Exception:
+                # Something in the chunk broke the batch, so run its orders one at a time
+                names = [self.apply_run(run) for run in chunk]
+            for (due, order), name in zip(chunk, names):
+                results.append((order.order_id, due, name))
+        return results
+
+    def apply_runs(self, chunk):
+        # Send a chunk of runs through apply_batch and count how each went
+        status = self.system.apply_batch(
+            [("transfer", order.account_id, Money(order.cents), order.recipient_id) for _, order in chunk])
+        names = [BATCH_STATUS_NAMES[code] for code in status]
+        for name in names:
+            self.count("fired" if name == "ok" else "failed")
+        return names
+
+    def apply_run(self, run):
+        # One run on its own, so an order that raises fails alone instead of stopping the others
+        try:
+            return self.apply_runs([run])[0]
+        except Exception as e:
+            due, order = run
+            self.count("errors")
+            print(f"Standing order {order.order_id} due at {due} failed: {e!r}", file=sys.stderr)
+            return "error"
+
+    def count(self, outcome):
+        # Running totals, and the system's metrics when it keeps them
+        with self.lock:
+            self.totals[outcome] += 1
+        if self.system.metrics is not None:
+            self.system.metrics.count("standing_order", OUTCOME_NAMES[outcome])
+
+    def start(self):
+        """Run due orders on a background thread once per tick."""
+        if self.thread is None:
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.run, name="order-scheduler", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        # Scheduler thread: wakes every tick until stopped
+        while not self.stopping.wait(self.tick):
+            try:
+                self.run_due()
+            except Exception as e:
+                # Keep ticking, so one bad pass never stops every later standing order
+                self.count("errors")
+                print(f"Standing orders could not run: {e!r}", file=sys.stderr)
+
+    def stats(self):
+        """Live orders, entries on the wheel and runs fired, failed or errored so far."""
+        with self.lock:
+            return {"orders": len(self.orders), "wheel": len(self.wheel), **self.totals}
+
+    def close(self):
+        """Stop the background thread and close the journal."""
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+        with self.lock:
+            self.file.close()
+
+
+def main(argv=None):
+    """List standing orders or fire the ones that are due."""
+    parser = argparse.ArgumentParser(description="Standing orders")
+    parser.add_argument("--accounts", default="accounts.txt", help="accounts file to use")
+    parser.add_argument("command", choices=["list", "run"])
+    args = parser.parse_args(argv)
+
+    system = BankingSystem(args.accounts)
+    scheduler = OrderScheduler(system)
+    try:
+        if args.command == "list":
+            for order in sorted(scheduler.orders.values(), key=lambda order: order.due):
+                runs = "until cancelled" if order.remaining is None else f"{order.remaining} left"
+                print(f"{order.order_id} {order.account_id} -> {order.recipient_id} {Money(order.cents)} "
+                      f"next {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(order.due))} ({runs})")
+        else:
+            results = scheduler.run_due()
+            failed = sum(1 for _, _, name in results if name != "ok")
+            print(f"Ran {len(results)} transfers ({failed} failed)")
+    finally:
+        scheduler.close()
+        system.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+
+import argparse
+import asyncio
+import itertools
+import json
+from decimal import Decimal
+
+from NamkheyYoeselTshering_02240085_A3 import (
+    BankingSystem, Invalid_Menu_Choice_Exception, Invalid_Transfer_Exception, Money
+)
+
+
+
+""" This error appears when the server answers a request with a failure. """
+
+class Banking_Service_Exception(Exception):
+    "Raised by BankingClient when the server reports an error."
+    pass
+
+
+# Exceptions the client can rebuild from the server's reply
+KNOWN_ERRORS = {
+    "ValueError": ValueError,
+    "TypeError": TypeError,
+    "Invalid_Menu_Choice_Exception": Invalid_Menu_Choice_Exception,
+    "Invalid_Transfer_Exception": Invalid_Transfer_Exception,
+}
+
+# Which menu choice of process_User_Input each network operation maps to
+OPERATION_CHOICES = {
+    "balance": "1",
+    "deposit": "2",
+    "withdraw": "3",
+    "transfer": "4",
+    "topup": "5",
+    "delete": "6",
+}
+
+
+# Serves one BankingSystem to many network clients at once
+class BankingServer:
+    """
+    asyncio front-end for BankingSystem.
+
+    The protocol is line-delimited JSON. Every request carries an "id" and
+    an "op", and the reply echoes the id:
+
+        {"id": 1, "op": "login", "account_id": "12345", "passcode": "1111"}
+        {"id": 1, "ok": true, "result": "Logged in."}
+        {"id": 2, "op": "deposit", "amount": 50}
+        {"id": 2, "ok": true, "result": "Deposit completed."}
+
+    A connection logs in once and then works on that account. The login
+    reply also carries a session token; a request that includes "token"
+    acts on that session's account instead, so other connections and
+    batch jobs can reuse one login without the slow passcode check. Requests on
+    one connection are handled in the order they arrive, so clients can
+    pipeline many requests without waiting for each reply. Operations that
+    save to disk run on the banking system's worker threads, which keeps the
+    event loop free to serve other connections.
+    """
+
+    def __init__(self, system, host="127.0.0.1", port=8765, path=None):
+        """
+        Args:
+            system (BankingSystem): System to serve
+            host: TCP address to listen on (default 127.0.0.1)
+            port: TCP port, 0 picks a free one (default 8765)
+            path: Unix socket path; used instead of TCP when given
+        """
+        self.system = system
+        self.host = host
+        self.port = port
+        self.path = path
+        self.server = None
+        self.connections = 0
+
+    async def start(self):
+        """Start listening and return the bound address."""
+        if self.path is not None:
+            self.server = await asyncio.start_unix_server(self.handle_connection, path=self.path)
+            return self.path
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port, backlog=4096)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.host, self.port
+
+    async def serve_forever(self):
+        """Start (if needed) and serve until cancelled."""
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        """Stop accepting connections and wait for the listener to close."""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle_connection(self, reader, writer):
+        """Read requests from one client and answer each of them."""
+        self.connections += 1
+        session = {"account_id": None}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = await self.handle_request(session, line)
+                writer.write(json.dumps(reply).encode() + b"\n")
+
+                # Only wait for the socket when its buffer is filling up
+                if writer.transport.get_write_buffer_size() > 65536:
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def handle_request(self, session, line):
+        """
+        Run one request and build its reply.
+
+        Args:
+            session: Per-connection state holding the logged-in account
+            line: Raw JSON request
+
+        Returns:
+            dict: Reply to send back
+        """
+        request_id = None
+        try:
+            # Amounts stay decimal from the wire to the cents, never passing through a binary float
+            request = json.loads(line, parse_float=Decimal)
+            request_id = request.get("id")
+            op = request.get("op")
+
+            if op == "login":
+                # The passcode check is slow on purpose, so it runs off the event loop
+                token = await asyncio.get_running_loop().run_in_executor(
+                    None, self.system.open_session, str(request.get("account_id")), str(request.get("passcode")))
+                session["account_id"] = self.system.authenticate(token).account_id
+                return {"id": request_id, "ok": True, "result": "Logged in.", "token": token}
+
+            if op not in OPERATION_CHOICES:
+                raise Invalid_Menu_Choice_Exception(f"Unknown operation: {op}")
+            # The account is looked up on every request, so one deleted meanwhile is never used
+            if request.get("token") is not None:
+                account = self.system.authenticate(request["token"])
+            elif session["account_id"] is None:
+                raise ValueError("Please log in first")
+            else:
+                account = self.system.accounts.get(session["account_id"])
+                if account is None:
+                    session["account_id"] = None
+                    raise ValueError("Account does not exist")
+
+            # Reading a balance touches no files, so it is answered right away
+            if op == "balance":
+                result = self.system.process_User_Input(account, "1")
+            else:
+                amount = request.get("amount")
+                future = self.system.submit(
+                    account, OPERATION_CHOICES[op],
+                    amount=Money(Money.to_cents(amount)) if amount is not None else None,
+                    recipient_id=request.get("recipient_id"),
+                    number=request.get("number"),
+                )
+                result = await asyncio.wrap_future(future)
+                if op == "delete":
+                    session["account_id"] = None
+            return {"id": request_id, "ok": True, "result": result}
+
+        except Exception as e:
+            return {"id": request_id, "ok": False, "error": str(e), "type": type(e).__name__}
+
+
+# Talks to a BankingServer from asyncio code
+class BankingClient:
+    """
+    Async client for BankingServer.
+
+    Every call sends its request straight away and returns once the
+    matching reply arrives, so many calls can be in flight on one
+    connection (for example with asyncio.gather).
+    """
+
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.pending = {}
+        self.ids = itertools.count(1)
+        self.reader_task = None
+        self.token = None   # Session token from the last login
+
+    async def connect(self, host="127.0.0.1", port=8765, path=None):
+        """
+        Open a connection to the server.
+
+        Args:
+            host: Server address (default 127.0.0.1)
+            port: Server port (default 8765)
+            path: Unix socket path; used instead of TCP when given
+        """
+        if path is not None:
+            self.reader, self.writer = await asyncio.open_unix_connection(path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.reader_task = asyncio.ensure_future(self.read_replies())
+        return self
+
+    async def close(self):
+        """Close the connection."""
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+        if self.reader_task is not None:
+            await self.reader_task
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def read_replies(self):
+        """Match each reply from the server to the call waiting for it."""
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                reply = json.loads(line)
+                future = self.pending.pop(reply.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        except ConnectionError:
+            pass
+        finally:
+            # Nothing else is coming, fail whoever is still waiting
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection to the server was closed"))
+            self.pending.clear()
+
+    async def request(self, op, **fields):
+        """
+        Send one request and wait for its reply.
+
+        Returns:
+            The operation's result message
+
+        Raises:
+            The server-side exception type when it is known, otherwise
+            Banking_Service_Exception
+        """
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write(json.dumps({"id": request_id, "op": op, **fields}).encode() + b"\n")
+        reply = await future
+        if reply.get("ok"):
+            if "token" in reply:
+                self.token = reply["token"]
+            return reply.get("result")
+        raise KNOWN_ERRORS.get(reply.get("type"), Banking_Service_Exception)(reply.get("error"))
+
+    async def login(self, account_id, passcode):
+        return await self.request("login", account_id=account_id, passcode=passcode)
+
+    async def balance(self):
+        return await self.request("balance")
+
+    async def deposit(self, amount):
+        return await self.request("deposit", amount=amount)
+
+    async def withdraw(self, amount):
+        return await self.request("withdraw", amount=amount)
+
+    async def transfer(self, amount, recipient_id):
+        return await self.request("transfer", amount=amount, recipient_id=recipient_id)
+
+    async def top_up_mobile(self, number, amount):
+        return await self.request("topup", number=number, amount=amount)
+
+    async def delete_account(self):
+        return await self.request("delete")
+
+
+def main(argv=None):
+    """Run the banking server until interrupted."""
+    parser = argparse.ArgumentParser(description="Banking network service")
+    parser.add_argument("--accounts", default="accounts.txt", help="accounts file to serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=8, help="threads used for saving to disk")
+    args = parser.parse_args(argv)
+
+    system = BankingSystem(args.accounts, workers=args.workers)
+    server = BankingServer(system, args.host, args.port, args.unix)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        system.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
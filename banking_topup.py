@@ -0,0 +1,384 @@
+# banking_topup.py
+
+"""
+Asynchronous delivery of mobile top-ups to a carrier.
+
+BankAccount.top_up_mobile only takes the money out of the account.
+TopUpDispatcher adds the delivery step without slowing callers down:
+
+    1. submit() reserves the funds straight away (through apply_batch, so
+       the usual checks, journal and ledger apply) and queues the request.
+    2. A dispatcher thread coalesces queued requests into batches of up to
+       batch_size, waiting at most max_wait for a batch to fill.
+    3. GatewayClient hands each batch to the carrier gateway on a small
+       thread pool, retrying failed calls with exponential backoff.
+    4. Anything the carrier rejects, or that still fails after the last
+       attempt, is refunded to the account automatically.
+
+Carriers plug in by subclassing CarrierGateway; StubGateway is a local
+stand-in for tests and benchmarks.
+"""
+
+import random
+import threading
+import time
+from collections import namedtuple, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from NamkheyYoeselTshering_02240085_A3 import BATCH_OK, BATCH_STATUS_NAMES, Money
+
+
+""" This error appears when the carrier can't be reached for a moment. """
+
+class Carrier_Unavailable_Exception(Exception):
+    "Raised by a gateway when a whole batch should be tried again later."
+    pass
+
+
+# Per-request answers a gateway gives back
+TOPUP_DELIVERED = "delivered"
+TOPUP_REJECTED = "rejected"    # The carrier refused it for good, e.g. unknown number
+TOPUP_RETRY = "retry"          # Temporary failure, send it again
+
+# What a submitted top-up finally ends up as
+TOPUP_REFUNDED = "refunded"
+TOPUP_REFUND_FAILED = "refund failed"   # The account was deleted before the refund
+
+TopUpRequest = namedtuple("TopUpRequest", "request_id account_id number cents")
+
+
+# Interface every carrier connection implements
+class CarrierGateway:
+    """
+    Sends batches of top-ups to a mobile carrier.
+
+    send_batch() gets a list of TopUpRequest and returns a dict mapping
+    each request_id to TOPUP_DELIVERED, TOPUP_REJECTED or TOPUP_RETRY.
+    Requests missing from the dict are treated as TOPUP_RETRY. Raising
+    Carrier_Unavailable_Exception retries the whole batch. Gateways are
+    called from several pool threads at once.
+    """
+
+    def send_batch(self, requests):
+        raise NotImplementedError
+
+    def close(self):
+        """Release any connections held by the gateway."""
+        pass
+
+
+# Local carrier used by tests and benchmarks
+class StubGateway(CarrierGateway):
+    """
+    In-process gateway that records what it was sent.
+
+    Numbers in reject_numbers are always rejected. The first
+    fail_batches calls raise Carrier_Unavailable_Exception, and numbers in
+    flaky_numbers answer TOPUP_RETRY that many times before going through.
+    latency adds a delay to every call, like a network round trip.
+    """
+
+    def __init__(self, latency=0.0, reject_numbers=(), fail_batches=0, flaky_numbers=None):
+        self.latency = latency
+        self.reject_numbers = set(reject_numbers)
+        self.fail_batches = fail_batches
+        self.flaky_numbers = dict(flaky_numbers or {})
+        self.lock = threading.Lock()
+        self.batches = []       # Sizes of the batches that reached the carrier
+        self.delivered = []     # (number, cents) of every delivered top-up
+
+    def send_batch(self, requests):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            if self.fail_batches > 0:
+                self.fail_batches -= 1
+                raise Carrier_Unavailable_Exception("Carrier is not answering")
+            self.batches.append(len(requests))
+            results = {}
+            for request in requests:
+                if request.number in self.reject_numbers:
+                    results[request.request_id] = TOPUP_REJECTED
+                elif self.flaky_numbers.get(request.number, 0) > 0:
+                    self.flaky_numbers[request.number] -= 1
+                    results[request.request_id] = TOPUP_RETRY
+                else:
+                    self.delivered.append((request.number, request.cents))
+                    results[request.request_id] = TOPUP_DELIVERED
+            return results
+
+
+# Calls the gateway from a pool of threads, retrying what fails
+class GatewayClient:
+    """
+    Pooled, retrying client for a CarrierGateway.
+
+    deliver() runs on one of pool_size threads. Failed calls and TOPUP_RETRY
+    answers are sent again after backoff * 2**attempt seconds (capped at
+    max_backoff, with random jitter) until max_attempts have been made.
+    """
+
+    def __init__(self, gateway, pool_size=4, max_attempts=5, backoff=0.05, max_backoff=2.0):
+        """
+        Args:
+            gateway (CarrierGateway): Carrier to deliver to
+            pool_size: Batches that may be in flight at once (default 4)
+            max_attempts: Calls made for a request before giving up (default 5)
+            backoff: Delay before the first retry in seconds (default 0.05)
+            max_backoff: Longest delay between retries (default 2.0)
+        """
+        self.gateway = gateway
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="topup")
+        self.retries = 0
+
+    def retry_delay(self, attempt):
+        """Seconds to wait before retry number attempt (1 for the first retry)."""
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def deliver(self, requests):
+        """
+        Start delivering a batch.
+
+        Returns:
+            Future: Resolves to a dict of request_id -> TOPUP_DELIVERED or
+            TOPUP_REJECTED; requests that ran out of attempts are rejected
+        """
+        return self.executor.submit(self.deliver_now, requests)
+
+    def deliver_now(self, requests):
+        """Deliver a batch on the calling thread; see deliver()."""
+        outcome = {}
+        remaining = list(requests)
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                results = self.gateway.send_batch(remaining)
+            except Carrier_Unavailable_Exception:
+                results = {}
+
+            retry = []
+            for request in remaining:
+                result = results.get(request.request_id, TOPUP_RETRY)
+                if result == TOPUP_RETRY:
+                    retry.append(request)
+                else:
+                    outcome[request.request_id] = result
+            if not retry:
+                return outcome
+            remaining = retry
+            if attempt < self.max_attempts:
+                self.retries += 1
+                time.sleep(self.retry_delay(attempt))
+
+        for request in remaining:
+            outcome[request.request_id] = TOPUP_REJECTED
+        return outcome
+
+    def close(self):
+        """Wait for batches in flight and close the gateway."""
+        self.executor.shutdown(wait=True)
+        self.gateway.close()
+
+
+# Reserves funds, queues top-ups and delivers them in batches
+class TopUpDispatcher:
+    """
+    Top-up pipeline in front of a BankingSystem.
+
+    submit() returns a Future per top-up that resolves to TOPUP_DELIVERED,
+    TOPUP_REFUNDED or TOPUP_REFUND_FAILED, or straight away to the batch
+    status name (e.g. 'insufficient funds') when nothing could be reserved.
+    stats() reports the queue depth, batches in flight and totals, and
+    delivery latencies go to the system's Metrics under 'topup_delivery'.
+    """
+
+    def __init__(self, system, gateway, batch_size=100, max_wait=0.05, pool_size=4,
+                 max_attempts=5, backoff=0.05, max_backoff=2.0):
+        """
+        Args:
+            system (BankingSystem): System the funds are reserved in
+            gateway (CarrierGateway): Carrier to deliver to
+            batch_size: Most top-ups sent in one gateway call (default 100)
+            max_wait: Longest a queued top-up waits for its batch to fill,
+                in seconds (default 0.05)
+            pool_size, max_attempts, backoff, max_backoff: See GatewayClient
+        """
+        self.system = system
+        self.client = GatewayClient(gateway, pool_size, max_attempts, backoff, max_backoff)
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.futures = {}        # request_id -> Future for the caller
+        self.next_id = 0
+        self.in_flight = 0       # Batches handed to the client and not finished
+        self.closed = False
+        self.totals = {"submitted": 0, "declined": 0, "batches": 0, TOPUP_DELIVERED: 0,
+                       TOPUP_REFUNDED: 0, TOPUP_REFUND_FAILED: 0}
+        self.thread = threading.Thread(target=self.run, name="topup-dispatcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, account, number, amount):
+        """
+        Reserve the funds for one top-up and queue it for delivery.
+
+        Args:
+            account (BankAccount): Account paying for the top-up
+            number: 8-digit phone number
+            amount: Positive top-up amount
+
+        Returns:
+            Future: Final outcome of the top-up
+        """
+        return self.submit_many([(account.account_id, number, amount)])[0]
+
+    def submit_many(self, rows):
+        """
+        Reserve and queue many top-ups, saved together in one journal record.
+
+        Args:
+            rows: Iterable of (account_id, number, amount)
+
+        Returns:
+            list: One Future per row, in order
+        """
+        rows = [(account_id, number, Money.to_cents(amount)) for account_id, number, amount in rows]
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Top-up dispatcher is closed")
+        status = self.system.apply_batch(
+            [("topup", account_id, Money(cents), number) for account_id, number, cents in rows])
+
+        futures = []
+        with self.condition:
+            closed = self.closed
+            if not closed:
+                for (account_id, number, cents), code in zip(rows, status):
+                    future = Future()
+                    futures.append(future)
+                    if code != BATCH_OK:
+                        self.totals["declined"] += 1
+                        future.set_result(BATCH_STATUS_NAMES[code])
+                        continue
+                    self.next_id += 1
+                    self.futures[self.next_id] = future
+                    self.queue.append(TopUpRequest(self.next_id, account_id, number, cents))
+                    self.totals["submitted"] += 1
+                self.condition.notify()
+
+        if closed:
+            # Closed while the money was being reserved, so give it straight back
+            self.system.apply_batch([("refund", account_id, Money(cents))
+                                     for (account_id, _, cents), code in zip(rows, status) if code == BATCH_OK])
+            raise RuntimeError("Top-up dispatcher is closed")
+        return futures
+
+    def run(self):
+        # Dispatcher thread: waits for a full batch or max_wait, then sends it
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+                deadline = time.monotonic() + self.max_wait
+                while len(self.queue) < self.batch_size and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+                self.in_flight += 1
+                self.totals["batches"] += 1
+
+            started = time.perf_counter()
+            future = self.client.deliver(batch)
+            future.add_done_callback(lambda f, batch=batch, started=started: self.finish_batch(batch, f, started))
+
+    def finish_batch(self, batch, future, started):
+        """Settle a delivered batch: refund failures and resolve the callers' futures."""
+        metrics = self.system.metrics
+        results, error = [], None
+        try:
+            try:
+                outcome = future.result()
+            except Exception:
+                outcome = {}
+            failed = [request for request in batch if outcome.get(request.request_id) != TOPUP_DELIVERED]
+
+            # Every failure in the batch is refunded in one go, which also frees its velocity limit headroom
+            refunded = {}
+            if failed:
+                status = self.system.apply_batch(
+                    [("refund", request.account_id, Money(request.cents)) for request in failed])
+                refunded = {request.request_id: code == BATCH_OK for request, code in zip(failed, status)}
+
+            if metrics is not None:
+                metrics.observe("topup_delivery", "batch", time.perf_counter() - started)
+
+            with self.condition:
+                for request in batch:
+                    if request.request_id not in refunded:
+                        result = TOPUP_DELIVERED
+                    elif refunded[request.request_id]:
+                        result = TOPUP_REFUNDED
+                    else:
+                        result = TOPUP_REFUND_FAILED
+                    self.totals[result] += 1
+                    results.append((self.futures.pop(request.request_id), result))
+        except Exception as e:
+            error = e
+        finally:
+            # However settling went, the batch is over, so flush() and close() never wait on it forever
+            with self.condition:
+                self.in_flight -= 1
+                unresolved = [self.futures.pop(request.request_id) for request in batch
+                              if request.request_id in self.futures]
+                self.condition.notify_all()
+            for caller in unresolved:
+                caller.set_exception(error or RuntimeError("Top-up batch could not be settled"))
+
+        for caller, result in results:
+            if metrics is not None:
+                metrics.count("topup_delivery", result)
+            caller.set_result(result)
+
+    def stats(self):
+        """
+        Current state of the pipeline.
+
+        Returns:
+            dict: queue_depth, in_flight batches, retries and running totals
+        """
+        with self.condition:
+            return {"queue_depth": len(self.queue), "in_flight": self.in_flight,
+                    "retries": self.client.retries, **self.totals}
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued top-up has been delivered or refunded.
+
+        Returns:
+            bool: False if the timeout ran out first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            self.condition.notify_all()
+            while self.queue or self.in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def close(self):
+        """Deliver what is still queued, then stop the dispatcher and its pool."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.flush()
+        self.client.close()